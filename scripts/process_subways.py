@@ -5,25 +5,37 @@ import logging
 import os
 import re
 import sys
+from collections.abc import Iterable, Iterator
 
 from subways import processors
-from subways.overpass import multi_overpass
+from subways.element_cache import (
+    ElementCache,
+    is_element_cache,
+    write_element_cache,
+)
+from subways.osm_element import OsmElement
+from subways.osm_pbf import load_pbf
+from subways.overpass import DEFAULT_OVERPASS_API, multi_overpass
+from subways.overpass_cache import DEFAULT_TTL, OverpassCache
 from subways.subway_io import (
     dump_yaml,
-    load_xml,
+    iter_json,
+    iter_xml,
     make_geojson,
     read_recovery_data,
     write_recovery_data,
 )
 from subways.structure.city import (
+    City,
     find_transfers,
     get_unused_subway_entrances_geojson,
 )
+from subways.types import OsmElementT
+from subways.validation_cache import ValidationCache
 from subways.validation import (
-    add_osm_elements_to_cities,
     BAD_MARK,
-    calculate_centers,
     DEFAULT_CITIES_INFO_URL,
+    localize_and_add_to_cities,
     prepare_cities,
     validate_cities,
 )
@@ -33,6 +45,75 @@ def slugify(name: str) -> str:
     return re.sub(r"[^a-z0-9_-]+", "", name.lower().replace(" ", "_"))
 
 
+def _iter_json_file(path: str) -> Iterator[OsmElementT]:
+    with open(path, "rb") as f:
+        yield from iter_json(f)
+
+
+def read_source(path: str) -> Iterable[OsmElementT]:
+    """Read elements from a binary element cache or a JSON file.
+    Elements of a JSON file are decoded as they are iterated over.
+    """
+    if is_element_cache(path):
+        return ElementCache(path)
+    return _iter_json_file(path)
+
+
+def write_source(path: str, osm: list[OsmElementT]) -> None:
+    """Write elements to a JSON file if the path has .json extension,
+    otherwise to a binary element cache.
+    """
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(osm, f, default=OsmElement.to_dict)
+    else:
+        write_element_cache(path, osm)
+
+
+def download_from_overpass(
+    options: argparse.Namespace, cities: list[City]
+) -> list[OsmElementT]:
+    """Query Overpass API for elements in bboxes of the cities. Slices
+    of the query that fail after all retries are requested again up to
+    options.overpass_resumes times, keeping the fetched slices.
+    """
+    bboxes = [c.bbox for c in cities]
+    overpass_cache = (
+        OverpassCache(
+            options.overpass_cache, options.overpass_cache_ttl * 3600
+        )
+        if options.overpass_cache
+        else None
+    )
+    logging.info("Downloading data from Overpass API")
+    fetched_slices = {}
+    for resume in range(options.overpass_resumes + 1):
+        try:
+            elements = multi_overpass(
+                options.overground,
+                options.overpass_api,
+                bboxes,
+                options.overpass_concurrency,
+                fetched_slices,
+                overpass_cache,
+            )
+            break
+        except Exception as e:
+            if resume == options.overpass_resumes:
+                raise
+            logging.warning(
+                "Failed to download data from Overpass API: %s. "
+                "Requesting failed slices again",
+                e,
+            )
+    if overpass_cache:
+        logging.info(
+            "%s Overpass API responses reused from the cache",
+            overpass_cache.hits,
+        )
+    return elements
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -46,16 +127,87 @@ def main() -> None:
     parser.add_argument(
         "-i",
         "--source",
-        help="File to write backup of OSM data, or to read data from",
+        help=(
+            "File to write backup of OSM data, or to read data from. "
+            "The data is written in JSON format if the file name has "
+            ".json extension, otherwise in binary element cache format"
+        ),
+    )
+    parser.add_argument(
+        "-x",
+        "--xml",
+        help=(
+            "OSM extract with routes, to read data from. "
+            "Files with .pbf extension are read as OSM PBF, the same "
+            "tag filter as in process_subways.sh being applied"
+        ),
+    )
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help=(
+            "Assign OSM elements to cities in chunks with NumPy; "
+            "ignored if NumPy is not installed"
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to validate cities in",
+    )
+    parser.add_argument(
+        "--batched-geometry",
+        action="store_true",
+        help=(
+            "Calculate projections, angles and distances of all stops "
+            "of a route at once, with NumPy if it is installed"
+        ),
     )
     parser.add_argument(
-        "-x", "--xml", help="OSM extract with routes, to read data from"
+        "--validation-cache",
+        help=(
+            "File to store validated cities in, so that cities whose "
+            "OSM data and settings have not changed are not validated "
+            "again in the next run"
+        ),
     )
     parser.add_argument(
         "--overpass-api",
-        default="http://overpass-api.de/api/interpreter",
+        default=DEFAULT_OVERPASS_API,
         help="Overpass API URL",
     )
+    parser.add_argument(
+        "--overpass-concurrency",
+        type=int,
+        help=(
+            "Number of simultaneous requests to Overpass API; by default, "
+            "the number of slots the server allows"
+        ),
+    )
+    parser.add_argument(
+        "--overpass-resumes",
+        type=int,
+        default=2,
+        help=(
+            "Number of times to request again slices of Overpass API "
+            "queries that failed after all retries, keeping the slices "
+            "that have been fetched"
+        ),
+    )
+    parser.add_argument(
+        "--overpass-cache",
+        help=(
+            "Directory to keep Overpass API responses in, so that "
+            "the same queries are answered from it in the next runs"
+        ),
+    )
+    parser.add_argument(
+        "--overpass-cache-ttl",
+        type=float,
+        default=DEFAULT_TTL / 3600,
+        help="Time in hours to reuse cached Overpass API responses for",
+    )
     parser.add_argument(
         "-q",
         "--quiet",
@@ -151,45 +303,64 @@ def main() -> None:
 
     logging.info("Read %s metro networks", len(cities))
 
-    # Reading cached json, loading XML or querying Overpass API
+    # Reading cached elements, loading XML or querying Overpass API.
+    # Centers of elements are calculated and elements are sorted by city
+    # while they are being read, so that XML parsing is not followed
+    # by separate passes over all elements.
+    stop_area_groups: list[OsmElementT] = []
+    # All elements are kept only for the outputs that need them
+    osm: list[OsmElementT] | ElementCache | None = None
     if options.source and os.path.exists(options.source):
         logging.info("Reading %s", options.source)
-        with open(options.source, "r") as f:
-            osm = json.load(f)
-            if "elements" in osm:
-                osm = osm["elements"]
-            calculate_centers(osm)
-    elif options.xml:
-        logging.info("Reading %s", options.xml)
-        osm = load_xml(options.xml)
-        calculate_centers(osm)
-        if options.source:
-            with open(options.source, "w", encoding="utf-8") as f:
-                json.dump(osm, f)
-    else:
-        if len(cities) > 10:
-            logging.error(
-                "Would not download that many cities from Overpass API, "
-                "choose a smaller set"
+        source = read_source(options.source)
+        if isinstance(source, ElementCache):
+            source.calculate_centers()
+            source.add_to_cities(cities, options.vectorized, stop_area_groups)
+            osm = source
+            element_count = len(source)
+        else:
+            if options.entrances:
+                osm = []
+            element_count = localize_and_add_to_cities(
+                source, cities, options.vectorized, stop_area_groups, osm
             )
-            sys.exit(3)
-        bboxes = [c.bbox for c in cities]
-        logging.info("Downloading data from Overpass API")
-        osm = multi_overpass(options.overground, options.overpass_api, bboxes)
-        calculate_centers(osm)
+    else:
+        if options.source or options.entrances:
+            osm = []
+        if options.xml:
+            logging.info("Reading %s", options.xml)
+            if options.xml.endswith(".pbf"):
+                source = load_pbf(options.xml)
+            else:
+                source = iter_xml(options.xml)
+        else:
+            source = download_from_overpass(options, cities)
+        element_count = localize_and_add_to_cities(
+            source, cities, options.vectorized, stop_area_groups, osm
+        )
+        del source
         if options.source:
-            with open(options.source, "w", encoding="utf-8") as f:
-                json.dump(osm, f)
-    logging.info("Downloaded %s elements", len(osm))
-
-    logging.info("Sorting elements by city")
-    add_osm_elements_to_cities(osm, cities)
+            write_source(options.source, osm)
+    logging.info("Downloaded %s elements", element_count)
 
     logging.info("Building routes for each city")
-    good_cities = validate_cities(cities)
+    validation_cache = (
+        ValidationCache(options.validation_cache)
+        if options.validation_cache
+        else None
+    )
+    good_cities = validate_cities(
+        cities, options.jobs, validation_cache, options.batched_geometry
+    )
+    if validation_cache:
+        logging.info(
+            "%s cities reused from the validation cache",
+            validation_cache.hits,
+        )
+        validation_cache.save()
 
     logging.info("Finding transfer stations")
-    transfers = find_transfers(osm, good_cities)
+    transfers = find_transfers(stop_area_groups, good_cities)
 
     good_city_names = set(c.name for c in good_cities)
     logging.info(
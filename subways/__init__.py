@@ -12,16 +12,40 @@ from .consts import (
 from .css_colours import normalize_colour
 from .geom_utils import (
     angle_between,
+    angles_along,
     distance,
+    distance_many,
     distance_on_line,
     find_segment,
     is_near,
+    LocalProjection,
+    planar_distance,
     project_on_line,
+    project_points_on_line,
+)
+from .osm_element import (
+    el_center,
+    el_id,
+    el_packed_id,
+    Node,
+    OsmElement,
+    pack_id,
+    Relation,
+    unpack_id,
+    Way,
+)
+from .osm_pbf import load_pbf
+from .overpass import (
+    get_overpass_slots,
+    merge_bboxes,
+    multi_overpass,
+    overpass_request,
 )
-from .osm_element import el_center, el_id
-from .overpass import multi_overpass, overpass_request
 from .subway_io import (
     dump_yaml,
+    iter_json,
+    iter_xml,
+    load_json,
     load_xml,
     make_geojson,
     read_recovery_data,
@@ -43,6 +67,7 @@ from .validation import (
     DEFAULT_CITIES_INFO_URL,
     DEFAULT_SPREADSHEET_ID,
     get_cities_info,
+    localize_and_add_to_cities,
     prepare_cities,
     validate_cities,
 )
@@ -59,17 +84,35 @@ __all__ = [
     "MODES_RAPID",
     "RAILWAY_TYPES",
     "angle_between",
+    "angles_along",
     "distance",
+    "distance_many",
     "distance_on_line",
     "find_segment",
     "is_near",
+    "LocalProjection",
+    "planar_distance",
     "project_on_line",
+    "project_points_on_line",
     "normalize_colour",
     "el_center",
     "el_id",
+    "el_packed_id",
+    "pack_id",
+    "unpack_id",
+    "Node",
+    "OsmElement",
+    "Relation",
+    "Way",
+    "load_pbf",
     "overpass_request",
     "multi_overpass",
+    "get_overpass_slots",
+    "merge_bboxes",
     "dump_yaml",
+    "iter_json",
+    "iter_xml",
+    "load_json",
     "load_xml",
     "make_geojson",
     "read_recovery_data",
@@ -87,6 +130,7 @@ __all__ = [
     "DEFAULT_CITIES_INFO_URL",
     "DEFAULT_SPREADSHEET_ID",
     "get_cities_info",
+    "localize_and_add_to_cities",
     "prepare_cities",
     "validate_cities",
 ]
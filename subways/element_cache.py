@@ -0,0 +1,628 @@
+"""Binary cache of OSM elements, a faster and more compact alternative
+to the JSON dump of the element list.
+
+The file consists of a header and a number of sections with packed
+arrays, each section aligned to 8 bytes:
+  - string table: utf-8 encoded strings and their offsets;
+  - nodes: ids, (lon, lat) coordinates;
+  - ways: ids, offsets in the node refs array, node refs,
+    (lon, lat) of centers;
+  - relations: ids, offsets in the member arrays, member types,
+    refs and roles (string indices), (lon, lat) of centers;
+  - tags of nodes, ways and relations: offsets in the tag arrays,
+    key and value string indices.
+A missing center is stored as a pair of NaNs.
+
+The file is opened with mmap and elements are provided as lazy
+read-only views that behave like element dicts. The only writable
+key is "center" of ways and relations, so that center calculation
+works with the views as well. With NumPy installed, centers can be
+calculated directly on the arrays (see ElementCache.calculate_centers).
+"""
+
+from __future__ import annotations
+
+import math
+import mmap
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Iterable, Iterator, Mapping
+import typing
+from typing import Any
+
+from subways.spatial_index import VectorizedCityIndex
+from subways.structure.city import is_stop_area_group
+from subways.types import LonLat, OsmElementT
+from subways.validation import (
+    add_osm_elements_to_cities,
+    ASSIGNMENT_CHUNK_SIZE,
+    calculate_centers,
+    CenterCalculator,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if typing.TYPE_CHECKING:
+    from subways.structure.city import City
+
+MAGIC = b"SUBWELCA"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_SECTION = struct.Struct("<QQ")  # offset, size in bytes
+_ALIGNMENT = 8
+
+MEMBER_TYPES = ("node", "way", "relation")
+
+# Section name => array typecode, in the order sections appear in the file
+SECTIONS = {
+    "string_offsets": "Q",
+    "string_data": "B",
+    "node_ids": "q",
+    "node_coords": "d",
+    "way_ids": "q",
+    "way_node_offsets": "Q",
+    "way_nodes": "q",
+    "way_centers": "d",
+    "relation_ids": "q",
+    "relation_member_offsets": "Q",
+    "member_types": "B",
+    "member_refs": "q",
+    "member_roles": "I",
+    "relation_centers": "d",
+    "node_tag_offsets": "Q",
+    "node_tag_keys": "I",
+    "node_tag_values": "I",
+    "way_tag_offsets": "Q",
+    "way_tag_keys": "I",
+    "way_tag_values": "I",
+    "relation_tag_offsets": "Q",
+    "relation_tag_keys": "I",
+    "relation_tag_values": "I",
+}
+
+
+class ElementCacheError(Exception):
+    """Is thrown if a file is not an element cache of a supported version."""
+
+
+def is_element_cache(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.arrays = {name: array(tc) for name, tc in SECTIONS.items()}
+        self.string_ids: dict[str, int] = {}
+        self.arrays["string_offsets"].append(0)
+        for name in ("node", "way", "relation"):
+            self.arrays[f"{name}_tag_offsets"].append(0)
+        self.arrays["way_node_offsets"].append(0)
+        self.arrays["relation_member_offsets"].append(0)
+
+    def string_id(self, s: str) -> int:
+        if (sid := self.string_ids.get(s)) is None:
+            sid = self.string_ids[s] = len(self.string_ids)
+            self.arrays["string_data"].frombytes(s.encode())
+            self.arrays["string_offsets"].append(
+                len(self.arrays["string_data"])
+            )
+        return sid
+
+    def add_tags(self, el: OsmElementT) -> None:
+        el_type = el["type"]
+        keys = self.arrays[f"{el_type}_tag_keys"]
+        values = self.arrays[f"{el_type}_tag_values"]
+        for k, v in el.get("tags", {}).items():
+            keys.append(self.string_id(k))
+            values.append(self.string_id(v))
+        self.arrays[f"{el_type}_tag_offsets"].append(len(keys))
+
+    @staticmethod
+    def add_center(centers: array, el: OsmElementT) -> None:
+        if "center" in el:
+            centers.extend((el["center"]["lon"], el["center"]["lat"]))
+        else:
+            centers.extend((math.nan, math.nan))
+
+    def add(self, el: OsmElementT) -> None:
+        a = self.arrays
+        el_type = el["type"]
+        if el_type == "node":
+            a["node_ids"].append(el["id"])
+            a["node_coords"].extend((el["lon"], el["lat"]))
+        elif el_type == "way":
+            a["way_ids"].append(el["id"])
+            a["way_nodes"].extend(el.get("nodes", []))
+            a["way_node_offsets"].append(len(a["way_nodes"]))
+            self.add_center(a["way_centers"], el)
+        elif el_type == "relation":
+            a["relation_ids"].append(el["id"])
+            for m in el.get("members", []):
+                a["member_types"].append(MEMBER_TYPES.index(m["type"]))
+                a["member_refs"].append(m["ref"])
+                a["member_roles"].append(self.string_id(m["role"]))
+            a["relation_member_offsets"].append(len(a["member_refs"]))
+            self.add_center(a["relation_centers"], el)
+        else:
+            raise ElementCacheError(f"Unknown element type {el_type}")
+        self.add_tags(el)
+
+    def write(self, path: str) -> None:
+        header_size = _HEADER.size + _SECTION.size * len(SECTIONS)
+        offset = header_size
+        section_table = []
+        for name in SECTIONS:
+            offset += -offset % _ALIGNMENT
+            nbytes = len(self.arrays[name]) * self.arrays[name].itemsize
+            section_table.append((offset, nbytes))
+            offset += nbytes
+
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS)))
+            for section in section_table:
+                f.write(_SECTION.pack(*section))
+            for name, (offset, _) in zip(SECTIONS, section_table):
+                f.write(b"\0" * (offset - f.tell()))
+                self.arrays[name].tofile(f)
+
+
+def write_element_cache(path: str, elements: Iterable[OsmElementT]) -> None:
+    """Write elements to a binary cache file. Elements are restored in
+    nodes-ways-relations order, each type in the order of the `elements`.
+    """
+    if sys.byteorder != "little":
+        raise ElementCacheError("Only little-endian platforms are supported")
+    writer = _Writer()
+    for el in elements:
+        writer.add(el)
+    writer.write(path)
+
+
+class _ElementView(Mapping, ABC):
+    """Read-only dict-like view of an element stored in ElementCache.
+    Tags, way nodes and relation members are decoded on first access.
+    """
+
+    __slots__ = ("_cache", "_index", "_tags")
+    element_type = ""
+
+    def __init__(self, cache: ElementCache, index: int) -> None:
+        self._cache = cache
+        self._index = index
+        self._tags = None
+
+    @abstractmethod
+    def _keys(self) -> list[str]:
+        pass
+
+    @abstractmethod
+    def _has(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _get(self, key: str) -> Any:
+        pass
+
+    def _has_tags(self) -> bool:
+        offsets = getattr(self._cache, f"{self.element_type}_tag_offsets")
+        return offsets[self._index] != offsets[self._index + 1]
+
+    def _get_tags(self) -> dict[str, str]:
+        if self._tags is None:
+            c = self._cache
+            offsets = getattr(c, f"{self.element_type}_tag_offsets")
+            keys = getattr(c, f"{self.element_type}_tag_keys")
+            values = getattr(c, f"{self.element_type}_tag_values")
+            self._tags = {
+                c.string(keys[i]): c.string(values[i])
+                for i in range(offsets[self._index], offsets[self._index + 1])
+            }
+        return self._tags
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "type":
+            return self.element_type
+        if key == "id":
+            return getattr(self._cache, f"{self.element_type}_ids")[
+                self._index
+            ]
+        if key == "tags" and self._has_tags():
+            return self._get_tags()
+        return self._get(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in ("type", "id"):
+            return True
+        if key == "tags":
+            return self._has_tags()
+        return self._has(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self)})"
+
+    def __reduce__(self) -> tuple:
+        # The memory-mapped file cannot be passed to another process,
+        # so the element is pickled as a plain dict
+        return dict, (dict(self),)
+
+
+class _NodeView(_ElementView):
+    __slots__ = ()
+    element_type = "node"
+
+    def _keys(self) -> list[str]:
+        keys = ["type", "id", "lat", "lon"]
+        if self._has_tags():
+            keys.append("tags")
+        return keys
+
+    def _has(self, key: str) -> bool:
+        return key in ("lat", "lon")
+
+    def _get(self, key: str) -> Any:
+        if key == "lat":
+            return self._cache.node_coords[2 * self._index + 1]
+        if key == "lon":
+            return self._cache.node_coords[2 * self._index]
+        raise KeyError(key)
+
+
+class _CenteredElementView(_ElementView):
+    """Way or relation view that has a writable "center"."""
+
+    __slots__ = ("_items",)
+    items_key = ""
+
+    def __init__(self, cache: ElementCache, index: int) -> None:
+        super().__init__(cache, index)
+        self._items = None
+
+    def _centers(self) -> array:
+        return getattr(self._cache, f"{self.element_type}_centers")
+
+    def _has_center(self) -> bool:
+        return not math.isnan(self._centers()[2 * self._index])
+
+    def _item_range(self) -> range:
+        offsets = self._cache.item_offsets(self.element_type)
+        return range(offsets[self._index], offsets[self._index + 1])
+
+    @abstractmethod
+    def _decode_items(self) -> list:
+        pass
+
+    def _keys(self) -> list[str]:
+        keys = ["type", "id"]
+        if self._has_tags():
+            keys.append("tags")
+        if self._item_range():
+            keys.append(self.items_key)
+        if self._has_center():
+            keys.append("center")
+        return keys
+
+    def _has(self, key: str) -> bool:
+        if key == "center":
+            return self._has_center()
+        return key == self.items_key and bool(self._item_range())
+
+    def _get(self, key: str) -> Any:
+        if key == "center" and self._has_center():
+            centers = self._centers()
+            return {
+                "lat": centers[2 * self._index + 1],
+                "lon": centers[2 * self._index],
+            }
+        if key == self.items_key and self._item_range():
+            if self._items is None:
+                self._items = self._decode_items()
+            return self._items
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: dict) -> None:
+        if key != "center":
+            raise TypeError(f"Cached element key '{key}' is read-only")
+        centers = self._centers()
+        centers[2 * self._index] = value["lon"]
+        centers[2 * self._index + 1] = value["lat"]
+
+
+class _WayView(_CenteredElementView):
+    __slots__ = ()
+    element_type = "way"
+    items_key = "nodes"
+
+    def _decode_items(self) -> list[int]:
+        r = self._item_range()
+        return self._cache.way_nodes[r.start : r.stop].tolist()  # noqa E203
+
+
+class _RelationView(_CenteredElementView):
+    __slots__ = ()
+    element_type = "relation"
+    items_key = "members"
+
+    def _decode_items(self) -> list[dict]:
+        c = self._cache
+        return [
+            {
+                "type": MEMBER_TYPES[c.member_types[i]],
+                "ref": c.member_refs[i],
+                "role": c.string(c.member_roles[i]),
+            }
+            for i in self._item_range()
+        ]
+
+
+class _CenterLookup(Mapping):
+    """Read-only mapping osm_id => LonLat over arrays of ids and (lon, lat)
+    pairs. As in a dict built from the arrays, the last of duplicate ids
+    wins.
+    """
+
+    def __init__(self, ids: np.ndarray, centers: np.ndarray) -> None:
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        self.centers = centers[order]
+
+    def indices(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return indices of ids in the lookup arrays and a mask of found
+        ids (indices of not found ids are meaningless).
+        """
+        indices = np.searchsorted(self.ids, ids, side="right") - 1
+        found = indices >= 0
+        found[found] = self.ids[indices[found]] == ids[found]
+        return indices, found
+
+    def _index(self, osm_id: int) -> int | None:
+        indices, found = self.indices(np.array([osm_id], dtype=np.int64))
+        return int(indices[0]) if found[0] else None
+
+    def __contains__(self, osm_id: object) -> bool:
+        return self._index(osm_id) is not None
+
+    def __getitem__(self, osm_id: int) -> LonLat:
+        if (i := self._index(osm_id)) is None:
+            raise KeyError(osm_id)
+        return float(self.centers[i, 0]), float(self.centers[i, 1])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _sum_by_segments(
+    segment_ids: np.ndarray, values: np.ndarray, segment_count: int
+) -> np.ndarray:
+    # Unlike np.add.reduceat, bincount adds values sequentially in
+    # the array order, which gives exactly the same sums as python loops
+    return np.bincount(segment_ids, weights=values, minlength=segment_count)
+
+
+class ElementCache:
+    """Sequence of OSM elements read from a binary cache file.
+    Elements are views into memory-mapped file contents.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, section_count = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ElementCacheError(f"{path} is not an element cache")
+        if version != FORMAT_VERSION or section_count != len(SECTIONS):
+            raise ElementCacheError(
+                f"Unsupported element cache version {version}"
+            )
+        buf = memoryview(self._mmap)
+        for i, (name, typecode) in enumerate(SECTIONS.items()):
+            offset, nbytes = _SECTION.unpack_from(
+                self._mmap, _HEADER.size + i * _SECTION.size
+            )
+            section = buf[offset : offset + nbytes]  # noqa E203
+            if name.endswith("_centers"):
+                # Centers may be recalculated, so keep them in memory
+                section = array(typecode, section.tobytes())
+            else:
+                section = section.cast(typecode)
+            setattr(self, name, section)
+
+        self.node_count = len(self.node_ids)
+        self.way_count = len(self.way_ids)
+        self.relation_count = len(self.relation_ids)
+        self._strings: dict[int, str] = {}
+
+    def string(self, sid: int) -> str:
+        if (s := self._strings.get(sid)) is None:
+            start, end = self.string_offsets[sid], self.string_offsets[sid + 1]
+            s = self._strings[sid] = bytes(
+                self.string_data[start:end]
+            ).decode()
+        return s
+
+    def item_offsets(self, element_type: str) -> memoryview:
+        return (
+            self.way_node_offsets
+            if element_type == "way"
+            else self.relation_member_offsets
+        )
+
+    def __len__(self) -> int:
+        return self.node_count + self.way_count + self.relation_count
+
+    def __getitem__(self, i: int) -> _ElementView:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i < self.node_count:
+            return _NodeView(self, i)
+        i -= self.node_count
+        if i < self.way_count:
+            return _WayView(self, i)
+        return _RelationView(self, i - self.way_count)
+
+    def __iter__(self) -> Iterator[_ElementView]:
+        for i in range(self.node_count):
+            yield _NodeView(self, i)
+        for i in range(self.way_count):
+            yield _WayView(self, i)
+        for i in range(self.relation_count):
+            yield _RelationView(self, i)
+
+    def calculate_centers(self) -> None:
+        """Calculate centers of ways and relations that have none,
+        with the same result as subways.validation.calculate_centers()
+        gives for the element list. With NumPy, centers of ways and of
+        relations without relation members are calculated on the arrays
+        at once; other relations are processed by CenterCalculator.
+        """
+        if np is None:
+            calculate_centers(self)
+            return
+
+        node_ids = np.asarray(self.node_ids, dtype=np.int64)
+        node_coords = np.asarray(self.node_coords).reshape(-1, 2)
+        nodes = _CenterLookup(node_ids, node_coords)
+
+        # Ways
+        way_centers = np.frombuffer(self.way_centers).reshape(-1, 2)
+        offsets = np.asarray(self.way_node_offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        way_of_item = np.repeat(np.arange(self.way_count), lengths)
+        way_nodes = np.asarray(self.way_nodes, dtype=np.int64)
+        node_indices, is_used = nodes.indices(way_nodes)
+        # Don't count the first node of a closed way twice
+        long_ways = np.flatnonzero(lengths > 1)
+        last_items = offsets[long_ways + 1] - 1
+        closed = way_nodes[offsets[long_ways]] == way_nodes[last_items]
+        is_used[last_items[closed]] = False
+        self._average_centers(
+            way_centers,
+            way_of_item[is_used],
+            node_coords[node_indices[is_used]],
+        )
+        is_localized = ~np.isnan(way_centers[:, 0])
+        ways = _CenterLookup(
+            np.asarray(self.way_ids, dtype=np.int64)[is_localized],
+            way_centers[is_localized],
+        )
+
+        # Relations that have no relation members
+        relation_centers = np.frombuffer(self.relation_centers).reshape(-1, 2)
+        offsets = np.asarray(self.relation_member_offsets, dtype=np.int64)
+        relation_of_item = np.repeat(
+            np.arange(self.relation_count), np.diff(offsets)
+        )
+        member_types = np.asarray(self.member_types)
+        member_refs = np.asarray(self.member_refs, dtype=np.int64)
+        has_relation_members = np.zeros(self.relation_count, dtype=bool)
+        has_relation_members[
+            relation_of_item[member_types == MEMBER_TYPES.index("relation")]
+        ] = True
+        member_coords = np.full((len(member_refs), 2), np.nan)
+        for member_type, lookup in (("node", nodes), ("way", ways)):
+            is_of_type = member_types == MEMBER_TYPES.index(member_type)
+            indices, found = lookup.indices(member_refs[is_of_type])
+            coords = np.full((len(indices), 2), np.nan)
+            coords[found] = lookup.centers[indices[found]]
+            member_coords[is_of_type] = coords
+        is_used = ~np.isnan(member_coords[:, 0])
+        is_used &= ~has_relation_members[relation_of_item]
+        self._average_centers(
+            relation_centers,
+            relation_of_item[is_used],
+            member_coords[is_used],
+        )
+
+        # Relations with relation members may depend on each other
+        is_localized = ~np.isnan(relation_centers[:, 0])
+        calculator = CenterCalculator()
+        calculator.nodes = nodes
+        calculator.ways = ways
+        calculator.relations = dict(
+            zip(
+                np.asarray(self.relation_ids)[is_localized].tolist(),
+                map(tuple, relation_centers[is_localized].tolist()),
+            )
+        )
+        for i in np.flatnonzero(has_relation_members & ~is_localized):
+            calculator.add(_RelationView(self, int(i)))
+        calculator.finish()
+
+    def get_centers(self) -> np.ndarray:
+        """Return (lon, lat) of all elements in the cache order, NaNs for
+        elements without center.
+        """
+        return np.concatenate(
+            (
+                np.asarray(self.node_coords).reshape(-1, 2),
+                np.frombuffer(self.way_centers).reshape(-1, 2),
+                np.frombuffer(self.relation_centers).reshape(-1, 2),
+            )
+        )
+
+    def add_to_cities(
+        self,
+        cities: list[City],
+        vectorized: bool = False,
+        stop_area_groups: list[OsmElementT] | None = None,
+    ) -> None:
+        """Add elements to cities as add_osm_elements_to_cities() does.
+        If vectorized and NumPy is installed, cities are found for center
+        arrays at once, and views are only made for elements inside cities.
+        """
+        if not vectorized or np is None:
+            add_osm_elements_to_cities(
+                self, cities, vectorized, stop_area_groups
+            )
+            return
+        city_index = VectorizedCityIndex(cities)
+        centers = self.get_centers()
+        for start in range(0, len(self), ASSIGNMENT_CHUNK_SIZE):
+            el_indices, city_indices = city_index.find_city_indices(
+                centers[start : start + ASSIGNMENT_CHUNK_SIZE]  # noqa E203
+            )
+            el = None
+            el_i = -1
+            for i, city_i in zip(el_indices.tolist(), city_indices.tolist()):
+                # An element is added to all its cities as the same view
+                if i != el_i:
+                    el_i = i
+                    el = self[start + i]
+                cities[city_i].add(el)
+        if stop_area_groups is not None:
+            stop_area_groups.extend(
+                filter(
+                    is_stop_area_group,
+                    (
+                        _RelationView(self, i)
+                        for i in range(self.relation_count)
+                    ),
+                )
+            )
+
+    @staticmethod
+    def _average_centers(
+        centers: np.ndarray, segment_ids: np.ndarray, coords: np.ndarray
+    ) -> None:
+        """Set centers that are NaN to average coords of their segments."""
+        count = len(centers)
+        counts = np.bincount(segment_ids, minlength=count)
+        lon_sums = _sum_by_segments(segment_ids, coords[:, 0], count)
+        lat_sums = _sum_by_segments(segment_ids, coords[:, 1], count)
+        is_updated = np.isnan(centers[:, 0]) & (counts > 0)
+        centers[is_updated, 0] = lon_sums[is_updated] / counts[is_updated]
+        centers[is_updated, 1] = lat_sums[is_updated] / counts[is_updated]
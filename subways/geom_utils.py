@@ -1,8 +1,28 @@
+from __future__ import annotations
+
 import math
+import typing
+from collections.abc import Sequence
+from typing import NamedTuple
 
 from subways.consts import MAX_DISTANCE_STOP_TO_LINE
 from subways.types import LonLat, RailT
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if typing.TYPE_CHECKING:
+    from subways.spatial_index import SegmentGrid
+
+# Points farther from a line are not projected onto it
+MAX_DISTANCE_TO_PROJECT = MAX_DISTANCE_STOP_TO_LINE * 5
+
+# Limit of the size of points x segments arrays which are built
+# by project_points_on_line() for a chunk of points
+PROJECTION_CHUNK_ITEMS = 1 << 20
+
 
 def distance(p1: LonLat, p2: LonLat) -> float:
     if p1 is None or p2 is None:
@@ -16,6 +36,72 @@ def distance(p1: LonLat, p2: LonLat) -> float:
     return 6378137 * math.sqrt(dx * dx + dy * dy)
 
 
+def planar_distance(p1: tuple[float, float], p2: tuple[float, float]) -> float:
+    """Distance between points in metres of a LocalProjection."""
+    return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
+
+
+class LocalProjection(NamedTuple):
+    """Equirectangular projection onto a plane with coordinates in metres
+    relative to the center point. Distortion is small within a city,
+    and no trigonometry is needed to convert coordinates and to measure
+    distances between projected points.
+    """
+
+    lon0: float
+    lat0: float
+    kx: float  # metres per degree of longitude at the center
+    ky: float  # metres per degree of latitude
+
+    @classmethod
+    def around(cls, center: LonLat) -> LocalProjection:
+        ky = math.radians(6378137)
+        return cls(
+            center[0], center[1], ky * math.cos(math.radians(center[1])), ky
+        )
+
+    def to_xy(self, p: LonLat) -> tuple[float, float]:
+        return (p[0] - self.lon0) * self.kx, (p[1] - self.lat0) * self.ky
+
+    def to_lonlat(self, xy: tuple[float, float]) -> LonLat:
+        return xy[0] / self.kx + self.lon0, xy[1] / self.ky + self.lat0
+
+
+def _distance_arrays(
+    lon1: np.ndarray, lat1: np.ndarray, lon2: np.ndarray, lat2: np.ndarray
+) -> np.ndarray:
+    """The same formula as in distance(), applied to NumPy arrays
+    with broadcasting.
+    """
+    dx = np.radians(lon1 - lon2) * np.cos(0.5 * np.radians(lat1 + lat2))
+    dy = np.radians(lat1 - lat2)
+    return 6378137 * np.sqrt(dx * dx + dy * dy)
+
+
+def _planar_distance_arrays(
+    x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray
+) -> np.ndarray:
+    return np.hypot(x1 - x2, y1 - y2)
+
+
+def distance_many(
+    points1: Sequence[LonLat], points2: Sequence[LonLat]
+) -> list[float]:
+    """Distances between pairs of points of two sequences of equal length.
+    The result may differ from distance() in the last bits with NumPy.
+    """
+    if len(points1) != len(points2):
+        raise ValueError(
+            f"Point sequences differ in length: {len(points1)} and "
+            f"{len(points2)}"
+        )
+    if np is None or not points1:
+        return [distance(p1, p2) for p1, p2 in zip(points1, points2)]
+    a = np.asarray(points1, dtype=np.float64)
+    b = np.asarray(points2, dtype=np.float64)
+    return _distance_arrays(a[:, 0], a[:, 1], b[:, 0], b[:, 1]).tolist()
+
+
 def is_near(p1: LonLat, p2: LonLat) -> bool:
     return (
         p1[0] - 1e-8 <= p2[0] <= p1[0] + 1e-8
@@ -37,7 +123,18 @@ def project_on_segment(p: LonLat, p1: LonLat, p2: LonLat) -> float | None:
     return u
 
 
-def project_on_line(p: LonLat, line: RailT) -> dict:
+def project_on_line(
+    p: LonLat,
+    line: RailT,
+    index: SegmentGrid | None = None,
+    planar: bool = False,
+) -> dict:
+    """Find the closest to p point on the line within MAX_DISTANCE_TO_PROJECT.
+    :param index: segment index of the line built with
+        MAX_DISTANCE_TO_PROJECT radius, to skip remote vertices and segments
+    :param planar: whether the point and the line are in metres
+        of a LocalProjection rather than (lon, lat)
+    """
     result = {
         # In the first approximation, position on rails is the index of the
         # closest vertex of line to the point p. Fractional value means that
@@ -50,11 +147,39 @@ def project_on_line(p: LonLat, line: RailT) -> dict:
 
     if len(line) < 2:
         return result
-    d_min = MAX_DISTANCE_STOP_TO_LINE * 5
+    if index is None:
+        segments = range(len(line) - 1)
+        vertices = range(len(line))
+    else:
+        # Vertices and segments farther than d_min do not affect the result
+        segments = index.find_segments(p)
+        vertices = sorted({v for seg in segments for v in (seg, seg + 1)})
+    return _project_on_line(p, line, vertices, segments, result, planar)
+
+
+def _project_on_line(
+    p: LonLat,
+    line: RailT,
+    vertices: Sequence[int],
+    segments: Sequence[int],
+    result: dict,
+    planar: bool = False,
+) -> dict:
+    """Fill result of project_on_line() checking only the given vertices
+    and segments of the line, in increasing order.
+    """
+    if planar:
+        distance_func = planar_distance
+        bbox_margin = MAX_DISTANCE_TO_PROJECT
+    else:
+        distance_func = distance
+        bbox_margin = MAX_DISTANCE_STOP_TO_LINE
+    d_min = MAX_DISTANCE_TO_PROJECT
     closest_to_vertex = False
     # First, check vertices in the line
-    for i, vertex in enumerate(line):
-        d = distance(p, vertex)
+    for i in vertices:
+        vertex = line[i]
+        d = distance_func(p, vertex)
         if d < d_min:
             result["positions_on_line"] = [i]
             result["projected_point"] = vertex
@@ -64,20 +189,18 @@ def project_on_line(p: LonLat, line: RailT) -> dict:
             # Repeated occurrence of the track vertex in line, like Oslo Line 5
             result["positions_on_line"].append(i)
     # And then calculate distances to each segment
-    for seg in range(len(line) - 1):
+    for seg in segments:
         # Check bbox for speed
         if not (
             (
-                min(line[seg][0], line[seg + 1][0]) - MAX_DISTANCE_STOP_TO_LINE
+                min(line[seg][0], line[seg + 1][0]) - bbox_margin
                 <= p[0]
-                <= max(line[seg][0], line[seg + 1][0])
-                + MAX_DISTANCE_STOP_TO_LINE
+                <= max(line[seg][0], line[seg + 1][0]) + bbox_margin
             )
             and (
-                min(line[seg][1], line[seg + 1][1]) - MAX_DISTANCE_STOP_TO_LINE
+                min(line[seg][1], line[seg + 1][1]) - bbox_margin
                 <= p[1]
-                <= max(line[seg][1], line[seg + 1][1])
-                + MAX_DISTANCE_STOP_TO_LINE
+                <= max(line[seg][1], line[seg + 1][1]) + bbox_margin
             )
         ):
             continue
@@ -87,7 +210,7 @@ def project_on_line(p: LonLat, line: RailT) -> dict:
                 line[seg][0] + u * (line[seg + 1][0] - line[seg][0]),
                 line[seg][1] + u * (line[seg + 1][1] - line[seg][1]),
             )
-            d = distance(p, projected_point)
+            d = distance_func(p, projected_point)
             if d < d_min:
                 result["positions_on_line"] = [seg + u]
                 result["projected_point"] = projected_point
@@ -101,6 +224,69 @@ def project_on_line(p: LonLat, line: RailT) -> dict:
     return result
 
 
+def project_points_on_line(
+    points: Sequence[LonLat], line: RailT, planar: bool = False
+) -> list[dict]:
+    """The same as project_on_line() for each of the points. With NumPy,
+    distances from a chunk of points to all vertices and segments of
+    the line are calculated at once to select the vertices and segments
+    that may affect the result, and only those are checked by the scalar
+    algorithm, so the result is exactly the same.
+    """
+    if np is None or len(line) < 2:
+        return [project_on_line(p, line, planar=planar) for p in points]
+
+    distance_arrays = _planar_distance_arrays if planar else _distance_arrays
+    # A margin protects from rounding errors of the vectorized distance
+    max_distance = MAX_DISTANCE_TO_PROJECT * (1 + 1e-6)
+    vertices = np.asarray(line, dtype=np.float64)
+    starts = vertices[:-1]
+    dp = vertices[1:] - starts
+    d2 = dp[:, 0] * dp[:, 0] + dp[:, 1] * dp[:, 1]
+    chunk_size = max(1, PROJECTION_CHUNK_ITEMS // len(line))
+    result = []
+    for chunk_start in range(0, len(points), chunk_size):
+        chunk = points[chunk_start : chunk_start + chunk_size]  # noqa E203
+        p = np.asarray(chunk, dtype=np.float64)
+        x = p[:, 0:1]
+        y = p[:, 1:2]
+        near_vertices = (
+            distance_arrays(x, y, vertices[:, 0], vertices[:, 1])
+            < max_distance
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = (
+                (x - starts[:, 0]) * dp[:, 0] + (y - starts[:, 1]) * dp[:, 1]
+            ) / d2
+        # NaN values of u for degenerate segments fail comparisons
+        on_segments = (d2 >= 1e-14) & (u >= 0) & (u <= 1)
+        projected_x = starts[:, 0] + u * dp[:, 0]
+        projected_y = starts[:, 1] + u * dp[:, 1]
+        near_segments = on_segments & (
+            distance_arrays(x, y, projected_x, projected_y) < max_distance
+        )
+        # Any vertex near the point is the end of a candidate segment
+        candidates = (
+            near_segments | near_vertices[:, :-1] | near_vertices[:, 1:]
+        )
+        for point, point_candidates in zip(chunk, candidates):
+            segments = np.flatnonzero(point_candidates).tolist()
+            vertex_indices = sorted(
+                {v for seg in segments for v in (seg, seg + 1)}
+            )
+            result.append(
+                _project_on_line(
+                    point,
+                    line,
+                    vertex_indices,
+                    segments,
+                    {"positions_on_line": None, "projected_point": None},
+                    planar,
+                )
+            )
+    return result
+
+
 def find_segment(
     p: LonLat, line: RailT, start_vertex: int = 0
 ) -> tuple[int, float] | tuple[None, None]:
@@ -173,3 +359,25 @@ def angle_between(p1: LonLat, c: LonLat, p2: LonLat) -> float:
         )
     )
     return a if a <= 180 else 360 - a
+
+
+def angles_along(points: Sequence[LonLat]) -> list[float]:
+    """Angles between neighbours at each inner point of the sequence,
+    the same as angle_between() for each three consecutive points.
+    """
+    if np is None or len(points) < 3:
+        return [
+            angle_between(points[i - 1], points[i], points[i + 1])
+            for i in range(1, len(points) - 1)
+        ]
+    a = np.asarray(points, dtype=np.float64)
+    c = a[1:-1]
+    angles = np.rint(
+        np.abs(
+            np.degrees(
+                np.arctan2(a[:-2, 1] - c[:, 1], a[:-2, 0] - c[:, 0])
+                - np.arctan2(a[2:, 1] - c[:, 1], a[2:, 0] - c[:, 0])
+            )
+        )
+    ).astype(np.int64)
+    return np.where(angles <= 180, angles, 360 - angles).tolist()
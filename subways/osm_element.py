@@ -1,4 +1,14 @@
-from subways.types import IdT, LonLat, OsmElementT
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+from typing import Any
+
+from subways.types import IdT, LonLat, OsmElementT, PackedIdT
+
+# Element type is stored in the lower bits of a packed id
+_TYPE_BITS = {"node": 0, "way": 1, "relation": 2}
+_TYPE_PREFIXES = ("n", "w", "r")
 
 
 def el_id(el: OsmElementT) -> IdT | None:
@@ -9,6 +19,28 @@ def el_id(el: OsmElementT) -> IdT | None:
     return el["type"][0] + str(el.get("id", el.get("ref", "")))
 
 
+def pack_id(el_type: str, osm_id: int) -> PackedIdT:
+    """Integer id of an element of the type ("node", "way" or "relation")
+    with the OSM id. Works with negative ids of unsaved JOSM objects.
+    """
+    return osm_id << 2 | _TYPE_BITS[el_type]
+
+
+def el_packed_id(el: OsmElementT) -> PackedIdT | None:
+    if not el:
+        return None
+    if "type" not in el:
+        raise Exception("What is this element? {}".format(el))
+    return pack_id(el["type"], el.get("id", el.get("ref")))
+
+
+def unpack_id(packed_id: PackedIdT) -> IdT:
+    """Return the string form of the id like "n123", for messages
+    and outputs.
+    """
+    return _TYPE_PREFIXES[packed_id & 3] + str(packed_id >> 2)
+
+
 def el_center(el: OsmElementT) -> LonLat | None:
     if not el:
         return None
@@ -24,3 +56,132 @@ def get_network(relation: OsmElementT) -> str | None:
         if k in relation["tags"]:
             return relation["tags"][k]
     return None
+
+
+class OsmElement(MutableMapping):
+    """Compact OSM element with attributes in slots instead of dict items.
+    It behaves as an OsmElementT dict with the same keys, so that code
+    working with dicts works with it too. A key is present if
+    the attribute is not None.
+    """
+
+    __slots__ = ()
+    type = ""
+    # Keys besides "type", in the order of keys of an element dict
+    _keys: tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "type":
+            return self.type
+        if key in self._keys:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "type":
+            return self.type
+        if key in self._keys:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        return default
+
+    def __contains__(self, key: object) -> bool:
+        return key == "type" or (
+            key in self._keys and getattr(self, key) is not None
+        )
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self._keys or value is None:
+            raise KeyError(f"Cannot set '{key}' of {self.type}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self or key in ("type", "id"):
+            raise KeyError(key)
+        setattr(self, key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        yield "type"
+        for key in self._keys:
+            if getattr(self, key) is not None:
+                yield key
+
+    def __len__(self) -> int:
+        return 1 + sum(getattr(self, key) is not None for key in self._keys)
+
+    def to_dict(self) -> OsmElementT:
+        """Return the element as a dict, like from JSON of Overpass API."""
+        return {
+            key: value.tolist() if isinstance(value, array) else value
+            for key, value in self.items()
+        }
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, OsmElement):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class Node(OsmElement):
+    __slots__ = ("id", "lat", "lon", "tags")
+    type = "node"
+    _keys = __slots__
+
+    def __init__(
+        self,
+        id: int,
+        lat: float,
+        lon: float,
+        tags: dict[str, str] | None = None,
+    ) -> None:
+        self.id = id
+        self.lat = lat
+        self.lon = lon
+        self.tags = tags
+
+
+class Way(OsmElement):
+    __slots__ = ("id", "tags", "nodes", "center")
+    type = "way"
+    _keys = __slots__
+
+    def __init__(
+        self,
+        id: int,
+        tags: dict[str, str] | None = None,
+        nodes: Iterable[int] | None = None,
+    ) -> None:
+        self.id = id
+        self.tags = tags
+        self.nodes = array("q", nodes) if nodes else None
+        self.center = None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "nodes" and not isinstance(value, array):
+            value = array("q", value)
+        super().__setitem__(key, value)
+
+
+class Relation(OsmElement):
+    __slots__ = ("id", "tags", "members", "center")
+    type = "relation"
+    _keys = __slots__
+
+    def __init__(
+        self,
+        id: int,
+        tags: dict[str, str] | None = None,
+        members: list[dict] | None = None,
+    ) -> None:
+        self.id = id
+        self.tags = tags
+        self.members = members
+        self.center = None
@@ -0,0 +1,401 @@
+"""Pure-python reader of OSM PBF files
+(https://wiki.openstreetmap.org/wiki/PBF_Format).
+
+Only the subset of the format that osmium and planet dumps produce
+is supported: raw/zlib/lzma compressed blobs, plain and dense nodes,
+ways and relations. Metadata (versions, timestamps, etc.) is skipped.
+"""
+
+from __future__ import annotations
+
+import lzma
+import struct
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO
+
+from subways.osm_element import Node, OsmElement, Relation, Way
+from subways.subway_io import MAX_SHARED_TAGS_SIZE
+
+# Tag filter of the scripts/process_subways.sh script, i.e.
+#   r/route,route_master=subway,light_rail,monorail,train
+#   r/public_transport=stop_area,stop_area_group
+#   n/railway=station,subway_entrance,train_station_entrance
+#   n/station=subway,light_rail,monorail
+#   n/subway=yes n/light_rail=yes n/monorail=yes n/train=yes
+RELATION_FILTER = {
+    "route": {"subway", "light_rail", "monorail", "train"},
+    "route_master": {"subway", "light_rail", "monorail", "train"},
+    "public_transport": {"stop_area", "stop_area_group"},
+}
+NODE_FILTER = {
+    "railway": {"station", "subway_entrance", "train_station_entrance"},
+    "station": {"subway", "light_rail", "monorail"},
+    "subway": {"yes"},
+    "light_rail": {"yes"},
+    "monorail": {"yes"},
+    "train": {"yes"},
+}
+
+SUPPORTED_FEATURES = {"OsmSchema-V0.6", "DenseNodes", "HistoricalInformation"}
+MEMBER_TYPES = ("node", "way", "relation")
+
+# Numbers of PrimitiveGroup fields
+_NODES, _DENSE, _WAYS, _RELATIONS = 1, 2, 3, 4
+
+# Protobuf wire types
+_VARINT, _FIXED64, _LENGTH_DELIMITED, _FIXED32 = 0, 1, 2, 5
+
+
+class PbfError(Exception):
+    """Is thrown on malformed or unsupported PBF data."""
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def _signed(n: int) -> int:
+    """Interpret varint-encoded value of int32/int64 protobuf field."""
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+
+def _iter_fields(buf: bytes) -> Iterator[tuple[int, int | bytes]]:
+    """Yield (field_number, value) pairs of a protobuf message.
+    Values of fixed-size fields are skipped.
+    """
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == _LENGTH_DELIMITED:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos : pos + length]  # noqa E203
+            pos += length
+        elif wire_type == _FIXED64:
+            pos += 8
+            continue
+        elif wire_type == _FIXED32:
+            pos += 4
+            continue
+        else:
+            raise PbfError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+
+def _packed_varints(buf: bytes) -> list[int]:
+    result = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        value, pos = _read_varint(buf, pos)
+        result.append(value)
+    return result
+
+
+def _packed_deltas(buf: bytes) -> list[int]:
+    """Decode packed sint64 delta-coded values."""
+    result = []
+    value = 0
+    for delta in _packed_varints(buf):
+        value += _zigzag(delta)
+        result.append(value)
+    return result
+
+
+def _iter_blobs(f: BinaryIO) -> Iterator[tuple[str, bytes]]:
+    """Yield (blob type, decompressed blob data) for each file block."""
+    while True:
+        size_bytes = f.read(4)
+        if not size_bytes:
+            return
+        if len(size_bytes) < 4:
+            raise PbfError("Truncated PBF file")
+        (header_size,) = struct.unpack("!I", size_bytes)
+        blob_type = None
+        data_size = 0
+        for field, value in _iter_fields(f.read(header_size)):
+            if field == 1:
+                blob_type = value.decode()
+            elif field == 3:
+                data_size = value
+        blob = f.read(data_size)
+        if len(blob) < data_size:
+            raise PbfError("Truncated PBF file")
+        yield blob_type, _decompress_blob(blob)
+
+
+def _decompress_blob(blob: bytes) -> bytes:
+    for field, value in _iter_fields(blob):
+        if field == 1:
+            return value
+        if field == 3:
+            return zlib.decompress(value)
+        if field == 4:
+            return lzma.decompress(value)
+        if field in (5, 6, 7):
+            raise PbfError("Only raw, zlib and lzma PBF blobs are supported")
+    return b""
+
+
+def _check_header(data: bytes) -> None:
+    for field, value in _iter_fields(data):
+        if field == 4 and value.decode() not in SUPPORTED_FEATURES:
+            raise PbfError(f"Unsupported PBF feature: {value.decode()}")
+
+
+class _PrimitiveBlock:
+    """Decoder of one OSMData block. Only groups of requested kinds
+    are decoded into elements.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self.strings: list[str] = []
+        self.groups: list[bytes] = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+        for field, value in _iter_fields(data):
+            if field == 1:
+                self.strings = [
+                    s.decode() for f, s in _iter_fields(value) if f == 1
+                ]
+            elif field == 2:
+                self.groups.append(value)
+            elif field == 17:
+                self.granularity = value
+            elif field == 19:
+                self.lat_offset = _signed(value)
+            elif field == 20:
+                self.lon_offset = _signed(value)
+
+    def elements(self, kinds: set[int]) -> Iterator[OsmElement]:
+        decoders = {
+            _NODES: self._node,
+            _WAYS: self._way,
+            _RELATIONS: self._relation,
+        }
+        for group in self.groups:
+            for field, value in _iter_fields(group):
+                if field not in kinds:
+                    continue
+                if field == _DENSE:
+                    yield from self._dense_nodes(value)
+                elif field in decoders:
+                    yield decoders[field](value)
+
+    def _coord(self, offset: int, value: int) -> float:
+        # Division (and not multiplication by 1e-9) gives exactly the same
+        # float as parsing of the decimal representation of the coordinate
+        return (offset + self.granularity * value) / 1_000_000_000
+
+    def _tags(self, keys: list[int], vals: list[int]) -> dict[str, str]:
+        s = self.strings
+        return {s[k]: s[v] for k, v in zip(keys, vals)}
+
+    def _node(self, data: bytes) -> Node:
+        keys, vals = [], []
+        lat = lon = 0
+        for field, value in _iter_fields(data):
+            if field == 1:
+                osm_id = _zigzag(value)
+            elif field == 2:
+                keys = _packed_varints(value)
+            elif field == 3:
+                vals = _packed_varints(value)
+            elif field == 8:
+                lat = _zigzag(value)
+            elif field == 9:
+                lon = _zigzag(value)
+        return Node(
+            osm_id,
+            self._coord(self.lat_offset, lat),
+            self._coord(self.lon_offset, lon),
+            self._tags(keys, vals) if keys else None,
+        )
+
+    def _dense_nodes(self, data: bytes) -> Iterator[Node]:
+        ids, lats, lons, keys_vals = [], [], [], []
+        for field, value in _iter_fields(data):
+            if field == 1:
+                ids = _packed_deltas(value)
+            elif field == 8:
+                lats = _packed_deltas(value)
+            elif field == 9:
+                lons = _packed_deltas(value)
+            elif field == 10:
+                keys_vals = _packed_varints(value)
+        s = self.strings
+        kv_pos = 0
+        for osm_id, lat, lon in zip(ids, lats, lons):
+            tags = {}
+            # keys_vals is empty if no node in the block has tags
+            while kv_pos < len(keys_vals) and keys_vals[kv_pos] != 0:
+                tags[s[keys_vals[kv_pos]]] = s[keys_vals[kv_pos + 1]]
+                kv_pos += 2
+            kv_pos += 1
+            yield Node(
+                osm_id,
+                self._coord(self.lat_offset, lat),
+                self._coord(self.lon_offset, lon),
+                tags or None,
+            )
+
+    def _way(self, data: bytes) -> Way:
+        keys, vals, refs = [], [], []
+        for field, value in _iter_fields(data):
+            if field == 1:
+                osm_id = _signed(value)
+            elif field == 2:
+                keys = _packed_varints(value)
+            elif field == 3:
+                vals = _packed_varints(value)
+            elif field == 8:
+                refs = _packed_deltas(value)
+        return Way(osm_id, self._tags(keys, vals) if keys else None, refs)
+
+    def _relation(self, data: bytes) -> Relation:
+        keys, vals, roles, memids, types = [], [], [], [], []
+        for field, value in _iter_fields(data):
+            if field == 1:
+                osm_id = _signed(value)
+            elif field == 2:
+                keys = _packed_varints(value)
+            elif field == 3:
+                vals = _packed_varints(value)
+            elif field == 8:
+                roles = _packed_varints(value)
+            elif field == 9:
+                memids = _packed_deltas(value)
+            elif field == 10:
+                types = _packed_varints(value)
+        members = [
+            {
+                "type": MEMBER_TYPES[t],
+                "ref": ref,
+                "role": self.strings[role],
+            }
+            for t, ref, role in zip(types, memids, roles)
+        ]
+        return Relation(
+            osm_id, self._tags(keys, vals) if keys else None, members or None
+        )
+
+
+def iter_pbf(
+    path: str, kinds: set[int] = frozenset((_NODES, _DENSE, _WAYS, _RELATIONS))
+) -> Iterator[OsmElement]:
+    """Yield all elements of given kinds (PrimitiveGroup field numbers)
+    in file order.
+    """
+    with open(path, "rb") as f:
+        for blob_type, data in _iter_blobs(f):
+            if blob_type == "OSMHeader":
+                _check_header(data)
+            elif blob_type == "OSMData":
+                yield from _PrimitiveBlock(data).elements(kinds)
+
+
+def _matches(el: OsmElement, tag_filter: dict[str, set[str]]) -> bool:
+    tags = el.get("tags")
+    if not tags:
+        return False
+    return any(tags.get(k) in values for k, values in tag_filter.items())
+
+
+def _share_tags(elements: Iterable[OsmElement]) -> None:
+    """Make elements share equal small tag dicts, as load_xml() does.
+    It is done for loaded elements only, so that tag sets of skipped
+    elements are not kept.
+    """
+    shared_tags: dict[tuple[tuple[str, str], ...], dict[str, str]] = {}
+    for el in elements:
+        tags = el.get("tags")
+        if tags is not None and len(tags) <= MAX_SHARED_TAGS_SIZE:
+            el["tags"] = shared_tags.setdefault(tuple(tags.items()), tags)
+
+
+def load_pbf(path: str, filter_tags: bool = True) -> list[OsmElement]:
+    """Read OSM elements from a pbf file. The result is the same as
+    load_xml() would give for the file converted into the OSM XML format.
+
+    :param path: path to the .osm.pbf file
+    :param filter_tags: leave only elements that match the same tag filter
+        as `osmium tags-filter` does in the scripts/process_subways.sh script,
+        together with referenced elements: members of matched relations
+        (without members of member relations) and nodes of matched ways.
+    :return: list of OSM elements, nodes first, then ways, then relations
+    """
+    if not filter_tags:
+        elements = list(iter_pbf(path))
+        _share_tags(elements)
+        return elements
+
+    # As ways and relations that pass the filter are not known
+    # before relations are read, the file is read four times: twice
+    # for relations, then for ways and nodes. Only elements that are
+    # loaded are kept between the passes, besides their member ids.
+    # Blocks with nodes, ways and relations are decompressed in all
+    # passes though.
+    member_relation_ids: set[int] = set()
+    way_ids: set[int] = set()
+    node_ids: set[int] = set()
+    # (position in the file, relation) for keeping the file order
+    matched_relations: list[tuple[int, Relation]] = []
+    for i, rel in enumerate(iter_pbf(path, {_RELATIONS})):
+        if not _matches(rel, RELATION_FILTER):
+            continue
+        matched_relations.append((i, rel))
+        for m in rel.get("members", []):
+            container = (
+                node_ids
+                if m["type"] == "node"
+                else way_ids
+                if m["type"] == "way"
+                else member_relation_ids
+            )
+            container.add(m["ref"])
+
+    # Member relations not matching the filter, without their members
+    member_relations: list[tuple[int, Relation]] = [
+        (i, rel)
+        for i, rel in enumerate(iter_pbf(path, {_RELATIONS}))
+        if rel["id"] in member_relation_ids
+        and not _matches(rel, RELATION_FILTER)
+    ]
+    relations = [
+        rel
+        for _, rel in sorted(
+            matched_relations + member_relations, key=lambda item: item[0]
+        )
+    ]
+    del matched_relations, member_relations
+
+    ways = [w for w in iter_pbf(path, {_WAYS}) if w["id"] in way_ids]
+    for way in ways:
+        node_ids.update(way.get("nodes", []))
+
+    nodes = [
+        n
+        for n in iter_pbf(path, {_NODES, _DENSE})
+        if n["id"] in node_ids or _matches(n, NODE_FILTER)
+    ]
+
+    elements = nodes + ways + relations
+    _share_tags(elements)
+    return elements
@@ -1,12 +1,99 @@
-import json
 import logging
+import re
 import time
+import urllib.error
 import urllib.parse
 import urllib.request
+from collections.abc import Iterable, Iterator
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from itertools import count
 
 from subways.consts import MODES_OVERGROUND, MODES_RAPID
+from subways.osm_element import el_packed_id
+from subways.overpass_cache import OverpassCache
+from subways.subway_io import load_json
 from subways.types import OsmElementT
 
+DEFAULT_OVERPASS_API = "http://overpass-api.de/api/interpreter"
+SLICE_SIZE = 10  # Number of bboxes in one request
+DEFAULT_CONCURRENCY = 2  # Simultaneous requests, if not told by the server
+RETRY_HTTP_CODES = (429, 504)  # Too Many Requests, Gateway Timeout
+MAX_RETRIES = 6
+BACKOFF_BASE = 5  # in seconds, doubled with every retry
+BACKOFF_MAX = 300  # in seconds
+# Overlapping or adjacent bboxes are queried as one bbox that encloses
+# them if its area exceeds the area they cover by at most this share
+BBOX_MERGE_EXTRA_AREA = 0.2
+
+
+def _bbox_area(bbox: list[float]) -> float:
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+
+def _merge_two_bboxes(
+    bbox1: list[float], bbox2: list[float]
+) -> list[float] | None:
+    """Return the bbox enclosing both bboxes if they can be queried
+    as one, or None.
+    """
+    overlap_lat = min(bbox1[2], bbox2[2]) - max(bbox1[0], bbox2[0])
+    overlap_lon = min(bbox1[3], bbox2[3]) - max(bbox1[1], bbox2[1])
+    if overlap_lat < 0 or overlap_lon < 0:
+        return None
+    merged = [
+        min(bbox1[0], bbox2[0]),
+        min(bbox1[1], bbox2[1]),
+        max(bbox1[2], bbox2[2]),
+        max(bbox1[3], bbox2[3]),
+    ]
+    covered_area = (
+        _bbox_area(bbox1) + _bbox_area(bbox2) - overlap_lat * overlap_lon
+    )
+    if _bbox_area(merged) > covered_area * (1 + BBOX_MERGE_EXTRA_AREA):
+        return None
+    return merged
+
+
+def merge_bboxes(bboxes: list[list[float]]) -> list[list[float]]:
+    """Merge overlapping or adjacent bboxes (south, west, north, east)
+    if the enclosing bbox does not take much extra area, so that shared
+    elements are not downloaded several times.
+    """
+    result = []
+    for bbox in bboxes:
+        i = 0
+        while i < len(result):
+            if merged := _merge_two_bboxes(result[i], bbox):
+                # The merged bbox may now be merged with previous ones
+                del result[i]
+                bbox = merged
+                i = 0
+            else:
+                i += 1
+        result.append(list(bbox))
+    return result
+
+
+def deduplicate_elements(
+    elements: Iterable[OsmElementT],
+) -> Iterator[OsmElementT]:
+    """Yield elements skipping repeated ones with the same type and id.
+    Log the number of duplicates.
+    """
+    seen_ids = set()
+    duplicates = 0
+    for el in elements:
+        packed_id = el_packed_id(el)
+        if packed_id in seen_ids:
+            duplicates += 1
+            continue
+        seen_ids.add(packed_id)
+        yield el
+    if duplicates:
+        logging.info(
+            "Skipped %s duplicate elements from Overpass API", duplicates
+        )
+
 
 def compose_overpass_request(
     overground: bool, bboxes: list[list[float]]
@@ -35,26 +122,148 @@ def compose_overpass_request(
     return query
 
 
+def _get_retry_delay(
+    attempt: int, error: urllib.error.HTTPError | None = None
+) -> float:
+    delay = min(BACKOFF_BASE * 2**attempt, BACKOFF_MAX)
+    retry_after = error.headers.get("Retry-After") if error else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(int(retry_after), BACKOFF_MAX))
+    return delay
+
+
 def overpass_request(
-    overground: bool, overpass_api: str, bboxes: list[list[float]]
+    overground: bool,
+    overpass_api: str,
+    bboxes: list[list[float]],
+    cache: OverpassCache | None = None,
 ) -> list[OsmElementT]:
+    """Query Overpass API, retrying with exponential backoff if the server
+    is busy (HTTP 429 or 504) or reports a runtime error, e.g. a timeout,
+    in a "remark" of the response.
+    :param cache: store of responses to reuse instead of querying
+        the server and to put complete new responses into
+    """
     query = compose_overpass_request(overground, bboxes)
+    if cache and (elements := cache.get(overpass_api, query)) is not None:
+        return elements
     url = f"{overpass_api}?data={urllib.parse.quote(query)}"
-    response = urllib.request.urlopen(url, timeout=1000)
-    if (r_code := response.getcode()) != 200:
-        raise Exception(f"Failed to query Overpass API: HTTP {r_code}")
-    return json.load(response)["elements"]
+    for attempt in count():
+        try:
+            response = urllib.request.urlopen(url, timeout=1000)
+        except urllib.error.HTTPError as e:
+            e.close()
+            if e.code not in RETRY_HTTP_CODES or attempt >= MAX_RETRIES:
+                raise
+            delay = _get_retry_delay(attempt, e)
+            logging.warning(
+                "Overpass API responded with HTTP %s, retrying in %s s",
+                e.code,
+                delay,
+            )
+            time.sleep(delay)
+            continue
+        if (r_code := response.getcode()) != 200:
+            raise Exception(f"Failed to query Overpass API: HTTP {r_code}")
+        # Decoded incrementally, so that the whole response text
+        # is never kept in memory
+        remarks = []
+        with response:
+            elements = load_json(response, remarks)
+        if not remarks:
+            if cache:
+                cache.put(overpass_api, query, elements)
+            return elements
+        # Elements of a response with a runtime error may be incomplete
+        if attempt >= MAX_RETRIES:
+            raise Exception(f"Overpass API error: {remarks[0]}")
+        delay = _get_retry_delay(attempt)
+        logging.warning(
+            "Overpass API reported: %s, retrying in %s s", remarks[0], delay
+        )
+        time.sleep(delay)
+
+
+def get_overpass_slots(overpass_api: str) -> int | None:
+    """Return the number of simultaneous requests the Overpass API server
+    allows, from its /status page, or None if it is unknown or unlimited.
+    """
+    status_url = f"{overpass_api.rsplit('/', 1)[0]}/status"
+    try:
+        with urllib.request.urlopen(status_url, timeout=60) as response:
+            status = response.read().decode("utf-8", errors="replace")
+    except OSError as e:
+        logging.warning("Could not get Overpass API status: %s", e)
+        return None
+    if match := re.search(r"^Rate limit: (\d+)", status, re.MULTILINE):
+        return int(match.group(1)) or None
+    return None
 
 
 def multi_overpass(
-    overground: bool, overpass_api: str, bboxes: list[list[float]]
+    overground: bool,
+    overpass_api: str,
+    bboxes: list[list[float]],
+    concurrency: int | None = None,
+    fetched_slices: dict[int, list[OsmElementT]] | None = None,
+    cache: OverpassCache | None = None,
 ) -> list[OsmElementT]:
-    SLICE_SIZE = 10
-    INTERREQUEST_WAIT = 5  # in seconds
-    result = []
-    for i in range(0, len(bboxes), SLICE_SIZE):
-        if i > 0:
-            time.sleep(INTERREQUEST_WAIT)
-        bboxes_i = bboxes[i : i + SLICE_SIZE]  # noqa E203
-        result.extend(overpass_request(overground, overpass_api, bboxes_i))
-    return result
+    """Query Overpass API for bboxes in slices of SLICE_SIZE, sending
+    up to concurrency requests at once. Overlapping bboxes are merged
+    first. Elements are returned in the order of slices, and elements
+    that come in several slices are returned once.
+    :param concurrency: by default, the number of slots the server allows
+    :param fetched_slices: slice index => elements. Slices present there
+        are not requested again, and successfully fetched slices are
+        stored there. If a slice cannot be fetched, the exception is
+        raised after all other requests have finished, so that the call
+        may be repeated with the same bboxes and dict to resume.
+        Slices are made of merged bboxes.
+    :param cache: store of responses, see overpass_request(). The server
+        is not contacted if all slices are in the cache.
+    """
+    if fetched_slices is None:
+        fetched_slices = {}
+    bboxes = merge_bboxes(bboxes)
+    slices = [
+        bboxes[i : i + SLICE_SIZE]  # noqa E203
+        for i in range(0, len(bboxes), SLICE_SIZE)
+    ]
+    if cache:
+        for i, slice_bboxes in enumerate(slices):
+            if i in fetched_slices:
+                continue
+            query = compose_overpass_request(overground, slice_bboxes)
+            if (elements := cache.get(overpass_api, query)) is not None:
+                fetched_slices[i] = elements
+    if missing := [i for i in range(len(slices)) if i not in fetched_slices]:
+        if concurrency is None:
+            concurrency = (
+                get_overpass_slots(overpass_api) or DEFAULT_CONCURRENCY
+            )
+        errors = []
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(
+                    overpass_request,
+                    overground,
+                    overpass_api,
+                    slices[i],
+                    cache,
+                ): i
+                for i in missing
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    fetched_slices[i] = future.result()
+                except Exception as e:
+                    logging.error("Failed to fetch slice %s: %s", i, e)
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+    return list(
+        deduplicate_elements(
+            el for i in range(len(slices)) for el in fetched_slices[i]
+        )
+    )
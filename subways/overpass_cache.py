@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from subways.osm_element import OsmElement
+from subways.subway_io import load_json
+from subways.types import OsmElementT
+
+DEFAULT_TTL = 24 * 3600  # in seconds
+DEFAULT_MAX_SIZE = 1 << 30  # in bytes, of compressed responses
+CACHE_FILE_SUFFIX = ".json.gz"
+
+
+class OverpassCache:
+    """On-disk store of Overpass API responses, one gzipped JSON file
+    per query. Files are named by a hash of the API URL and the query.
+
+    A response older than ttl seconds is not used. When the total size
+    of files exceeds max_size, the least recently used ones are removed.
+    The time a file was fetched is kept as its modification time, and
+    the time it was last used as its access time.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+
+    @staticmethod
+    def get_key(overpass_api: str, query: str) -> str:
+        return hashlib.sha256(f"{overpass_api}\n{query}".encode()).hexdigest()
+
+    def _get_path(self, overpass_api: str, query: str) -> Path:
+        return self.cache_dir / (
+            self.get_key(overpass_api, query) + CACHE_FILE_SUFFIX
+        )
+
+    def get(self, overpass_api: str, query: str) -> list[OsmElementT] | None:
+        """Return elements of the cached response, or None if there is
+        no fresh response to the query.
+        """
+        path = self._get_path(overpass_api, query)
+        try:
+            fetched_time = path.stat().st_mtime
+            if time.time() - fetched_time > self.ttl:
+                path.unlink()
+                return None
+            with gzip.open(path, "rb") as f:
+                elements = load_json(f)
+            os.utime(path, (time.time(), fetched_time))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning("Corrupted Overpass cache file %s: %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+        self.hits += 1
+        return elements
+
+    def put(
+        self, overpass_api: str, query: str, elements: list[OsmElementT]
+    ) -> None:
+        path = self._get_path(overpass_api, query)
+        # Write to a temporary file first so that concurrent readers
+        # never see a partial response
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(
+                    {"elements": elements},
+                    f,
+                    ensure_ascii=False,
+                    default=OsmElement.to_dict,
+                )
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used responses until the total size
+        of the cache is not greater than max_size.
+        """
+        files = []
+        total_size = 0
+        for path in self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # removed by another thread
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total_size += stat.st_size
+        if total_size <= self.max_size:
+            return
+        files.sort()
+        for _, size, path in files:
+            path.unlink(missing_ok=True)
+            total_size -= size
+            if total_size <= self.max_size:
+                break
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import typing
 
-from subways.osm_element import el_center
+from subways.osm_element import el_center, unpack_id
 from subways.types import TransfersT
 
 if typing.TYPE_CHECKING:
@@ -56,7 +56,7 @@ def transit_to_dict(cities: list[City], transfers: TransfersT) -> dict:
                     "duration": route.duration,
                     "stops": [
                         {
-                            "stoparea_id": route_stop.stoparea.id,
+                            "stoparea_id": unpack_id(route_stop.stoparea.id),
                             "distance": route_stop.distance,
                         }
                         for route_stop in route.stops
@@ -67,27 +67,29 @@ def transit_to_dict(cities: list[City], transfers: TransfersT) -> dict:
                 # and that have not been stored yet
                 for route_stop in route.stops:
                     stoparea = route_stop.stoparea
-                    if stoparea.id in data["stopareas"]:
+                    stoparea_id = unpack_id(stoparea.id)
+                    if stoparea_id in data["stopareas"]:
                         continue
                     stoparea_data = {
-                        "id": stoparea.id,
+                        "id": stoparea_id,
                         "center": stoparea.center,
                         "name": stoparea.station.name,
                         "entrances": [
                             {
-                                "id": egress_id,
+                                "id": unpack_id(egress_id),
                                 "name": egress["tags"].get("name"),
                                 "ref": egress["tags"].get("ref"),
                                 "center": el_center(egress),
                             }
                             for (egress_id, egress) in (
                                 (egress_id, city.elements[egress_id])
-                                for egress_id in stoparea.entrances
-                                | stoparea.exits
+                                for egress_id in set(stoparea.entrances).union(
+                                    stoparea.exits
+                                )
                             )
                         ],
                     }
-                    data["stopareas"][stoparea.id] = stoparea_data
+                    data["stopareas"][stoparea_id] = stoparea_data
 
                 route_data["itineraries"].append(variant_data)
 
@@ -98,7 +100,7 @@ def transit_to_dict(cities: list[City], transfers: TransfersT) -> dict:
     # transfers
     pairwise_transfers = set()
     for stoparea_id_set in transfers:
-        stoparea_ids = sorted(stoparea_id_set)
+        stoparea_ids = sorted(map(unpack_id, stoparea_id_set))
         for first_i in range(len(stoparea_ids) - 1):
             for second_i in range(first_i + 1, len(stoparea_ids)):
                 stoparea1_id = stoparea_ids[first_i]
@@ -10,9 +10,15 @@ from typing import Any, TypeAlias
 
 from subways.consts import DISPLACEMENT_TOLERANCE
 from subways.geom_utils import distance
-from subways.osm_element import el_center
+from subways.osm_element import el_center, el_packed_id, pack_id, unpack_id
 from subways.structure.station import Station
-from subways.types import IdT, LonLat, OsmElementT, TransfersT
+from subways.types import (
+    IdT,
+    LonLat,
+    OsmElementT,
+    PackedIdT,
+    TransfersT,
+)
 from ._common import (
     DEFAULT_AVE_VEHICLE_SPEED,
     DEFAULT_INTERVAL,
@@ -35,7 +41,12 @@ SPEED_TO_ENTRANCE = 5 * KMPH_TO_MPS  # m/s
 TransferTimesT: TypeAlias = dict[tuple[int, int], int]
 
 
-def uid(elid: IdT, typ: str | None = None) -> int:
+def uid(elid: IdT | PackedIdT, typ: str | None = None) -> int:
+    """:param elid: packed id of an element, or the string id of
+    a route master, which may be the id of one of its routes.
+    """
+    if isinstance(elid, int):
+        elid = unpack_id(elid)
     t = elid[0]
     osm_id = int(elid[1:])
     if not typ:
@@ -73,8 +84,8 @@ def transit_data_to_fmk(cities: list[City], transfers: TransfersT) -> dict:
                 exits.append(n)
         return exits
 
-    stop_areas: dict[IdT, StopArea] = {}
-    stops: dict[IdT, dict] = {}  # stoparea el_id -> stop jsonified data
+    stop_areas: dict[PackedIdT, StopArea] = {}
+    stops: dict[PackedIdT, dict] = {}  # stoparea id -> stop jsonified data
     networks = []
     good_cities = [c for c in cities if c.is_good]
     platform_nodes = {}
@@ -110,7 +121,7 @@ def transit_data_to_fmk(cities: list[City], transfers: TransfersT) -> dict:
                                 pl_nodes = [pl_el]
                             elif pl_el["type"] == "way":
                                 pl_nodes = [
-                                    city.elements.get("n{}".format(n))
+                                    city.elements.get(pack_id("node", n))
                                     for n in pl_el["nodes"]
                                 ]
                             else:
@@ -118,21 +129,15 @@ def transit_data_to_fmk(cities: list[City], transfers: TransfersT) -> dict:
                                 for m in pl_el["members"]:
                                     if m["type"] == "way":
                                         if (
-                                            "{}{}".format(
-                                                m["type"][0], m["ref"]
-                                            )
-                                            in city.elements
-                                        ):
+                                            way_id := el_packed_id(m)
+                                        ) in city.elements:
                                             pl_nodes.extend(
                                                 [
                                                     city.elements.get(
-                                                        "n{}".format(n)
+                                                        pack_id("node", n)
                                                     )
                                                     for n in city.elements[
-                                                        "{}{}".format(
-                                                            m["type"][0],
-                                                            m["ref"],
-                                                        )
+                                                        way_id
                                                     ]["nodes"]
                                                 ]
                                             )
@@ -151,19 +156,19 @@ def transit_data_to_fmk(cities: list[City], transfers: TransfersT) -> dict:
             "int_name": stop.int_name,
             "lat": stop.center[1],
             "lon": stop.center[0],
-            "osm_type": OSM_TYPES[stop.station.id[0]][1],
-            "osm_id": int(stop.station.id[1:]),
+            "osm_type": stop.station.element["type"],
+            "osm_id": stop.station.element["id"],
             "id": uid(stop.id),
             "entrances": [],
             "exits": [],
         }
         for e_l, k in ((stop.entrances, "entrances"), (stop.exits, "exits")):
             for e in e_l:
-                if e[0] == "n":
+                if (e_id := unpack_id(e))[0] == "n":
                     st[k].append(
                         {
                             "osm_type": "node",
-                            "osm_id": int(e[1:]),
+                            "osm_id": int(e_id[1:]),
                             "lon": stop.centers[e][0],
                             "lat": stop.centers[e][1],
                         }
@@ -185,8 +190,8 @@ def transit_data_to_fmk(cities: list[City], transfers: TransfersT) -> dict:
                 for k in ("entrances", "exits"):
                     st[k].append(
                         {
-                            "osm_type": OSM_TYPES[stop.station.id[0]][1],
-                            "osm_id": int(stop.station.id[1:]),
+                            "osm_type": stop.station.element["type"],
+                            "osm_id": stop.station.element["id"],
                             "lon": stop.centers[stop.id][0],
                             "lat": stop.centers[stop.id][1],
                         }
@@ -10,9 +10,15 @@ from typing import Any, TypeAlias
 
 from subways.consts import DISPLACEMENT_TOLERANCE
 from subways.geom_utils import distance
-from subways.osm_element import el_center
+from subways.osm_element import el_center, el_packed_id, pack_id, unpack_id
 from subways.structure.station import Station
-from subways.types import IdT, LonLat, OsmElementT, TransfersT
+from subways.types import (
+    IdT,
+    LonLat,
+    OsmElementT,
+    PackedIdT,
+    TransfersT,
+)
 from ._common import (
     DEFAULT_AVE_VEHICLE_SPEED,
     DEFAULT_INTERVAL,
@@ -35,7 +41,12 @@ SPEED_TO_ENTRANCE = 5 * KMPH_TO_MPS  # m/s
 TransferTimesT: TypeAlias = dict[tuple[int, int], int]
 
 
-def uid(elid: IdT, typ: str | None = None) -> int:
+def uid(elid: IdT | PackedIdT, typ: str | None = None) -> int:
+    """:param elid: packed id of an element, or the string id of
+    a route master, which may be the id of one of its routes.
+    """
+    if isinstance(elid, int):
+        elid = unpack_id(elid)
     t = elid[0]
     osm_id = int(elid[1:])
     if not typ:
@@ -105,8 +116,8 @@ class MapsmeCache:
         """
         city_cache_data = self.cache[city.name]
         for stoparea_id, cached_stoparea in city_cache_data["stops"].items():
-            station_id = cached_stoparea["osm_type"][0] + str(
-                cached_stoparea["osm_id"]
+            station_id = pack_id(
+                cached_stoparea["osm_type"], cached_stoparea["osm_id"]
             )
             city_station = city.elements.get(station_id)
             if not city_station or not Station.is_station(
@@ -161,17 +172,19 @@ class MapsmeCache:
         }
 
     @if_object_is_used
-    def link_stop_with_city(self, stoparea_id: IdT, city_name: str) -> None:
+    def link_stop_with_city(
+        self, stoparea_id: PackedIdT, city_name: str
+    ) -> None:
         """Remember that some stop_area is used in a city."""
         stoparea_uid = uid(stoparea_id)
         self.stop_cities[stoparea_uid].add(city_name)
 
     @if_object_is_used
-    def add_stop(self, stoparea_id: IdT, st: dict) -> None:
+    def add_stop(self, stoparea_id: PackedIdT, st: dict) -> None:
         """Add stoparea to the cache of each city the stoparea is in."""
         stoparea_uid = uid(stoparea_id)
         for city_name in self.stop_cities[stoparea_uid]:
-            self.cache[city_name]["stops"][stoparea_id] = st
+            self.cache[city_name]["stops"][unpack_id(stoparea_id)] = st
 
     @if_object_is_used
     def add_transfer(
@@ -228,7 +241,7 @@ def transit_data_to_mapsme(
 
     cache = MapsmeCache(cache_path, cities)
 
-    stop_areas: dict[IdT, StopArea] = {}
+    stop_areas: dict[PackedIdT, StopArea] = {}
     stops: dict[IdT, dict] = {}  # stoparea el_id -> stop jsonified data
     networks = []
     good_cities = [c for c in cities if c.is_good]
@@ -273,7 +286,7 @@ def transit_data_to_mapsme(
                                 pl_nodes = [pl_el]
                             elif pl_el["type"] == "way":
                                 pl_nodes = [
-                                    city.elements.get("n{}".format(n))
+                                    city.elements.get(pack_id("node", n))
                                     for n in pl_el["nodes"]
                                 ]
                             else:
@@ -281,21 +294,15 @@ def transit_data_to_mapsme(
                                 for m in pl_el["members"]:
                                     if m["type"] == "way":
                                         if (
-                                            "{}{}".format(
-                                                m["type"][0], m["ref"]
-                                            )
-                                            in city.elements
-                                        ):
+                                            way_id := el_packed_id(m)
+                                        ) in city.elements:
                                             pl_nodes.extend(
                                                 [
                                                     city.elements.get(
-                                                        "n{}".format(n)
+                                                        pack_id("node", n)
                                                     )
                                                     for n in city.elements[
-                                                        "{}{}".format(
-                                                            m["type"][0],
-                                                            m["ref"],
-                                                        )
+                                                        way_id
                                                     ]["nodes"]
                                                 ]
                                             )
@@ -321,19 +328,19 @@ def transit_data_to_mapsme(
             "int_name": stop.int_name,
             "lat": stop.center[1],
             "lon": stop.center[0],
-            "osm_type": OSM_TYPES[stop.station.id[0]][1],
-            "osm_id": int(stop.station.id[1:]),
+            "osm_type": stop.station.element["type"],
+            "osm_id": stop.station.element["id"],
             "id": uid(stop.id),
             "entrances": [],
             "exits": [],
         }
         for e_l, k in ((stop.entrances, "entrances"), (stop.exits, "exits")):
             for e in e_l:
-                if e[0] == "n":
+                if (e_id := unpack_id(e))[0] == "n":
                     st[k].append(
                         {
                             "osm_type": "node",
-                            "osm_id": int(e[1:]),
+                            "osm_id": int(e_id[1:]),
                             "lon": stop.centers[e][0],
                             "lat": stop.centers[e][1],
                             "distance": ENTRANCE_PENALTY
@@ -367,15 +374,16 @@ def transit_data_to_mapsme(
                 for k in ("entrances", "exits"):
                     st[k].append(
                         {
-                            "osm_type": OSM_TYPES[stop.station.id[0]][1],
-                            "osm_id": int(stop.station.id[1:]),
+                            "osm_type": stop.station.element["type"],
+                            "osm_id": stop.station.element["id"],
                             "lon": stop.centers[stop.id][0],
                             "lat": stop.centers[stop.id][1],
                             "distance": 60,
                         }
                     )
 
-        stops[stop_id] = st
+        # Cached stops of recovered cities are keyed by string ids
+        stops[unpack_id(stop_id)] = st
         cache.add_stop(stop_id, st)
 
     pairwise_transfers: TransferTimesT = {}
@@ -385,7 +393,7 @@ def transit_data_to_mapsme(
             for i_second in range(i_first + 1, len(stoparea_ids)):
                 stoparea1_id = stoparea_ids[i_first]
                 stoparea2_id = stoparea_ids[i_second]
-                if stoparea1_id in stops and stoparea2_id in stops:
+                if stoparea1_id in stop_areas and stoparea2_id in stop_areas:
                     uid1 = uid(stoparea1_id)
                     uid2 = uid(stoparea2_id)
                     uid1, uid2 = sorted([uid1, uid2])
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import logging
+import math
+import typing
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+
+from subways.osm_element import el_center
+from subways.types import LonLat, OsmElementT, RailT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if typing.TYPE_CHECKING:
+    from subways.structure.city import City
+
+
+DEFAULT_CELL_SIZE = 1.0  # degrees
+
+EARTH_RADIUS = 6378137  # in meters, as in geom_utils.distance()
+
+# Cities with bbox spanning more grid cells are not put into the grid
+# and are checked for every element
+MAX_CELLS_PER_CITY = 1024
+
+
+class CityIndex:
+    """Uniform grid over city bboxes to quickly find cities that
+    may contain an element. Cities are always returned in the order
+    they follow in the list given to the constructor.
+    """
+
+    def __init__(
+        self, cities: list[City], cell_size: float = DEFAULT_CELL_SIZE
+    ) -> None:
+        self.cities = cities
+        self.cell_size = cell_size
+        # (lon cell, lat cell) => indices of cities in increasing order
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        self.large_cities: list[int] = []
+        for i, city in enumerate(cities):
+            if city.bbox is None:
+                continue
+            lat_min, lon_min, lat_max, lon_max = city.bbox
+            x_min, y_min = self._cell(lon_min, lat_min)
+            x_max, y_max = self._cell(lon_max, lat_max)
+            if (x_max - x_min + 1) * (y_max - y_min + 1) > MAX_CELLS_PER_CITY:
+                self.large_cities.append(i)
+                continue
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    self.cells[(x, y)].append(i)
+
+    def _cell(self, lon: float, lat: float) -> tuple[int, int]:
+        return (
+            math.floor(lon / self.cell_size),
+            math.floor(lat / self.cell_size),
+        )
+
+    def find_cities(self, el: OsmElementT) -> list[City]:
+        """Return cities whose bbox contains the element center."""
+        center = el_center(el)
+        if not center:
+            return []
+        candidates = self.cells.get(self._cell(*center), [])
+        if self.large_cities:
+            candidates = sorted(candidates + self.large_cities)
+        return [
+            self.cities[i] for i in candidates if self.cities[i].contains(el)
+        ]
+
+    def find_cities_many(
+        self, elements: Sequence[OsmElementT]
+    ) -> list[list[City]]:
+        return [self.find_cities(el) for el in elements]
+
+
+class VectorizedCityIndex(CityIndex):
+    """The same grid as in CityIndex, in which cities are found for
+    an array of element centers at once with NumPy. Gives the same result
+    as CityIndex.
+    """
+
+    def __init__(
+        self, cities: list[City], cell_size: float = DEFAULT_CELL_SIZE
+    ) -> None:
+        super().__init__(cities, cell_size)
+        # Columns are lat_min, lon_min, lat_max, lon_max
+        self.bboxes = np.array(
+            [c.bbox or [np.nan] * 4 for c in cities], dtype=np.float64
+        ).reshape(-1, 4)
+        # Cells as sorted keys and city indices in CSR layout
+        keys = sorted(self.cells)
+        self.cell_keys = self._cell_keys(
+            np.array([k[0] for k in keys], dtype=np.int64),
+            np.array([k[1] for k in keys], dtype=np.int64),
+        )
+        self.cell_offsets = np.cumsum(
+            [0] + [len(self.cells[k]) for k in keys], dtype=np.int64
+        )
+        self.cell_cities = np.array(
+            [i for k in keys for i in self.cells[k]], dtype=np.int64
+        )
+        self.large_city_indices = np.array(self.large_cities, dtype=np.int64)
+
+    @staticmethod
+    def _cell_keys(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return (x << 32) + (y + (1 << 31))
+
+    def find_city_indices(
+        self, centers: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find cities whose bbox contains (lon, lat) centers, NaN for
+        elements without center. Return arrays of indices of centers and
+        of cities in the list given to the constructor, ordered by center
+        index and then by city index.
+        """
+        (has_center,) = np.nonzero(~np.isnan(centers[:, 0]))
+        lon = centers[has_center, 0]
+        lat = centers[has_center, 1]
+        keys = self._cell_keys(
+            np.floor(lon / self.cell_size).astype(np.int64),
+            np.floor(lat / self.cell_size).astype(np.int64),
+        )
+        cells = np.searchsorted(self.cell_keys, keys)
+        cells[cells == len(self.cell_keys)] = 0
+        is_in_grid = (
+            self.cell_keys[cells] == keys
+            if len(self.cell_keys)
+            else np.zeros(len(keys), dtype=bool)
+        )
+
+        # Pairs of an element and a candidate city from its cell
+        (elements,) = np.nonzero(is_in_grid)
+        starts = self.cell_offsets[cells[elements]]
+        counts = self.cell_offsets[cells[elements] + 1] - starts
+        ends = np.cumsum(counts)
+        items = np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+            starts - ends + counts, counts
+        )
+        pair_elements = np.repeat(elements, counts)
+        pair_cities = self.cell_cities[items]
+        if len(large := self.large_city_indices):
+            pair_elements = np.concatenate(
+                (pair_elements, np.repeat(np.arange(len(keys)), len(large)))
+            )
+            pair_cities = np.concatenate(
+                (pair_cities, np.tile(large, len(keys)))
+            )
+            order = np.lexsort((pair_cities, pair_elements))
+            pair_elements = pair_elements[order]
+            pair_cities = pair_cities[order]
+
+        bboxes = self.bboxes[pair_cities]
+        pair_lon = lon[pair_elements]
+        pair_lat = lat[pair_elements]
+        inside = (
+            (bboxes[:, 0] <= pair_lat)
+            & (pair_lat <= bboxes[:, 2])
+            & (bboxes[:, 1] <= pair_lon)
+            & (pair_lon <= bboxes[:, 3])
+        )
+        return has_center[pair_elements[inside]], pair_cities[inside]
+
+    def find_cities_many(
+        self, elements: Sequence[OsmElementT]
+    ) -> list[list[City]]:
+        centers = np.array(
+            [el_center(el) or (np.nan, np.nan) for el in elements],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        result = [[] for _ in range(len(elements))]
+        cities = self.cities
+        for el_i, city_i in zip(
+            *(a.tolist() for a in self.find_city_indices(centers))
+        ):
+            result[el_i].append(cities[city_i])
+        return result
+
+
+def make_city_index(
+    cities: list[City], vectorized: bool = False
+) -> CityIndex | VectorizedCityIndex:
+    if vectorized:
+        if np is not None:
+            return VectorizedCityIndex(cities)
+        logging.warning(
+            "NumPy is not installed, falling back to non-vectorized "
+            "assignment of elements to cities"
+        )
+    return CityIndex(cities)
+
+
+class PointGrid:
+    """Uniform grid over element centers to find elements that may lie
+    within the given distance from a point. Cell size is not less than
+    the distance, so only the cell of the point and its 8 neighbours are
+    looked through.
+    """
+
+    def __init__(self, elements: Iterable[OsmElementT], radius: float) -> None:
+        """
+        :param elements: elements without center are skipped
+        :param radius: search distance in meters
+        """
+        self.radius = radius
+        self.elements: list[OsmElementT] = []
+        centers: list[LonLat] = []
+        for el in elements:
+            if center := el_center(el):
+                self.elements.append(el)
+                centers.append(center)
+
+        # A small margin protects from rounding errors
+        self.cell_height = math.degrees(radius / EARTH_RADIUS) * 1.01
+        # Longitude degrees shrink towards poles. The middle latitude
+        # of two points within the radius is less than max latitude + 1°.
+        max_lat = max((abs(c[1]) for c in centers), default=0.0) + 1.0
+        self.cell_width = (
+            self.cell_height / math.cos(math.radians(max_lat))
+            if max_lat < 89.0
+            else math.inf
+        )
+        # (lon cell, lat cell) => indices of elements in increasing order
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for i, center in enumerate(centers):
+            self.cells[self._cell(center)].append(i)
+
+    def _cell(self, point: LonLat) -> tuple[int, int]:
+        x = (
+            math.floor(point[0] / self.cell_width)
+            if self.cell_width != math.inf
+            else 0
+        )
+        return x, math.floor(point[1] / self.cell_height)
+
+    def find_near(self, point: LonLat) -> list[OsmElementT]:
+        """Return elements from the cells around the point, in the order
+        they were given to the constructor. The caller is to check
+        the exact distance.
+        """
+        if not self.elements:
+            return []
+        x, y = self._cell(point)
+        indices = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                indices.extend(self.cells.get((x + dx, y + dy), ()))
+        indices.sort()
+        return [self.elements[i] for i in indices]
+
+
+class SegmentGrid:
+    """Uniform grid over segments of a line to find segments that may
+    lie within the given distance from a point. A segment is put into
+    all cells that its bbox, expanded by the distance, overlaps, so only
+    the cell of the point is looked through.
+    """
+
+    # Cell size in units of the search distance
+    CELL_SIZE_FACTOR = 4
+
+    def __init__(
+        self, line: RailT, radius: float, planar: bool = False
+    ) -> None:
+        """
+        :param line: list of (lon, lat) vertices
+        :param radius: search distance in meters
+        :param planar: whether vertices are in metres of
+            a geom_utils.LocalProjection rather than (lon, lat)
+        """
+        # A small margin protects from rounding errors
+        if planar:
+            self.margin_lat = self.margin_lon = radius * 1.01
+        else:
+            self.margin_lat = math.degrees(radius / EARTH_RADIUS) * 1.01
+            max_lat = max((abs(v[1]) for v in line), default=0.0) + 1.0
+            self.margin_lon = (
+                self.margin_lat / math.cos(math.radians(max_lat))
+                if max_lat < 89.0
+                else 360.0
+            )
+        self.cell_height = self.margin_lat * self.CELL_SIZE_FACTOR
+        self.cell_width = self.margin_lon * self.CELL_SIZE_FACTOR
+        # (lon cell, lat cell) => indices of segments in increasing order
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for i in range(len(line) - 1):
+            (lon1, lat1), (lon2, lat2) = line[i], line[i + 1]
+            x_min, y_min = self._cell(
+                (
+                    min(lon1, lon2) - self.margin_lon,
+                    min(lat1, lat2) - self.margin_lat,
+                )
+            )
+            x_max, y_max = self._cell(
+                (
+                    max(lon1, lon2) + self.margin_lon,
+                    max(lat1, lat2) + self.margin_lat,
+                )
+            )
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    self.cells[(x, y)].append(i)
+
+    def _cell(self, point: LonLat) -> tuple[int, int]:
+        return (
+            math.floor(point[0] / self.cell_width),
+            math.floor(point[1] / self.cell_height),
+        )
+
+    def find_segments(self, point: LonLat) -> list[int]:
+        """Return indices of the first vertices of segments that may lie
+        within the distance from the point, in increasing order.
+        """
+        return self.cells.get(self._cell(point), [])
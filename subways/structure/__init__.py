@@ -3,6 +3,7 @@ from .route import Route
 from .route_master import RouteMaster
 from .route_stop import RouteStop
 from .station import Station
+from .station_registry import StationRegistry
 from .stop_area import StopArea
 
 
@@ -13,5 +14,6 @@ __all__ = [
     "RouteMaster",
     "RouteStop",
     "Station",
+    "StationRegistry",
     "StopArea",
 ]
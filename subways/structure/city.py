@@ -1,21 +1,32 @@
 from __future__ import annotations
 
 from collections import Counter, defaultdict
-from collections.abc import Collection, Iterator
+from collections.abc import Collection, Iterable, Iterator
 from itertools import chain
+from typing import Any, NamedTuple
 
 from subways.consts import (
     DEFAULT_MODES_OVERGROUND,
     DEFAULT_MODES_RAPID,
 )
-from subways.osm_element import el_center, el_id, get_network
+from subways.geom_utils import LocalProjection
+from subways.osm_element import (
+    el_center,
+    el_id,
+    el_packed_id,
+    get_network,
+    unpack_id,
+)
+from subways.spatial_index import PointGrid
 from subways.structure.route import Route
 from subways.structure.route_master import RouteMaster
 from subways.structure.station import Station
+from subways.structure.station_registry import StationRegistry
 from subways.structure.stop_area import StopArea
 from subways.types import (
-    IdT,
+    LonLat,
     OsmElementT,
+    PackedIdT,
     TransfersT,
     TransferT,
 )
@@ -25,22 +36,82 @@ ALLOWED_TRANSFERS_MISMATCH = 0.07  # part of total interchanges count
 
 used_entrances = set()
 
+# Kinds of elements which are iterated during validation. City.add() puts
+# each element into the buckets of all its kinds.
+ELEMENT_KINDS = (
+    "stations",
+    "routes",
+    "route_masters",
+    "stop_areas",
+    "stop_area_groups",
+    "entrances",
+)
+
 
-def format_elid_list(ids: Collection[IdT]) -> str:
-    msg = ", ".join(sorted(ids)[:20])
+def format_elid_list(ids: Collection[PackedIdT]) -> str:
+    msg = ", ".join(sorted(map(unpack_id, ids))[:20])
     if len(ids) > 20:
         msg += ", ..."
     return msg
 
 
+class ElidList(tuple):
+    """Message argument that is formatted with format_elid_list()
+    only when the message is rendered.
+    """
+
+    def __str__(self) -> str:
+        return format_elid_list(self)
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+
+class Message(NamedTuple):
+    """Validation message which is rendered to text on demand.
+    The template is also the type of the message.
+    """
+
+    template: str
+    args: tuple
+    # Type, id and name of the element the message is about, if any
+    el_type: str | None = None
+    el_id: int | None = None
+    el_name: str = ""
+
+    @classmethod
+    def make(
+        cls, template: str, el: OsmElementT | None, args: tuple
+    ) -> Message:
+        if not el:
+            return cls(template, args)
+        tags = el.get("tags", {})
+        return cls(
+            template,
+            args,
+            el["type"],
+            el.get("id", el.get("ref")),
+            tags.get("name", tags.get("ref", "")),
+        )
+
+    def render(self) -> str:
+        message = (
+            self.template.format(*self.args) if self.args else self.template
+        )
+        if self.el_type is not None:
+            message += f' ({self.el_type} {self.el_id}, "{self.el_name}")'
+        return message
+
+
 class City:
     route_class = Route
 
     def __init__(self, city_data: dict, overground: bool = False) -> None:
         self.validate_called = False
-        self.errors: list[str] = []
-        self.warnings: list[str] = []
-        self.notices: list[str] = []
+        # Messages are rendered by errors/warnings/notices properties
+        self._errors: list[Message] = []
+        self._warnings: list[Message] = []
+        self._notices: list[Message] = []
         self.id = None
         self.try_fill_int_attribute(city_data, "id")
         self.name = city_data["name"]
@@ -84,16 +155,43 @@ class City:
             self.bbox = [float(bbox[i]) for i in (1, 0, 3, 2)]
         else:
             self.bbox = None
+        # Metric frame for geometry calculations on city routes
+        self.local_projection: LocalProjection | None = (
+            LocalProjection.around(
+                (
+                    (self.bbox[1] + self.bbox[3]) / 2,
+                    (self.bbox[0] + self.bbox[2]) / 2,
+                )
+            )
+            if self.bbox
+            else None
+        )
 
-        self.elements: dict[IdT, OsmElementT] = {}
-        self.stations: dict[IdT, list[StopArea]] = defaultdict(list)
+        # Elements and stations are keyed by packed ids, which are
+        # converted to strings only for messages and outputs
+        self.elements: dict[PackedIdT, OsmElementT] = {}
+        # Elements from self.elements by kind, in the same order
+        self.elements_by_kind: dict[str, dict[PackedIdT, OsmElementT]] = {
+            kind: {} for kind in ELEMENT_KINDS
+        }
+        self.stations: dict[PackedIdT, list[StopArea]] = defaultdict(list)
         self.routes: dict[str, RouteMaster] = {}  # keys are route_master refs
-        self.masters: dict[IdT, OsmElementT] = {}  # Route id → master element
-        self.stop_areas: [IdT, list[OsmElementT]] = defaultdict(list)
+        # Route packed id → master element
+        self.masters: dict[PackedIdT, OsmElementT] = {}
+        self.stop_areas: [PackedIdT, list[OsmElementT]] = defaultdict(list)
         self.transfers: list[set[StopArea]] = []
-        self.station_ids: set[IdT] = set()
-        self.stops_and_platforms: set[IdT] = set()
+        # Stop area id → id of the stop_area_group relation it is in.
+        # Kept in the city since StopAreas may be shared between cities.
+        self.stoparea_transfers: dict[PackedIdT, PackedIdT] = {}
+        # Ids of stop areas on routes, filled in extract_routes()
+        self.stoparea_ids: set[PackedIdT] = set()
+        self.station_ids: set[PackedIdT] = set()
+        self.stops_and_platforms: set[PackedIdT] = set()
+        # Entrances of the city stations, also gathered into the global
+        # used_entrances set, which is not shared between processes
+        self.used_entrances: set[PackedIdT] = set()
         self.recovery_data = None
+        self._entrance_grid: PointGrid | None = None  # built on demand
 
     def try_fill_int_attribute(
         self, city_data: dict, attr: str, default: str | None = None
@@ -124,31 +222,81 @@ class City:
 
     @staticmethod
     def log_message(message: str, el: OsmElementT) -> str:
-        if el:
-            tags = el.get("tags", {})
-            message += ' ({} {}, "{}")'.format(
-                el["type"],
-                el.get("id", el.get("ref")),
-                tags.get("name", tags.get("ref", "")),
-            )
-        return message
+        return Message.make(message, el, ()).render()
 
-    def notice(self, message: str, el: OsmElementT | None = None) -> None:
-        """This type of message may point to a potential problem."""
-        msg = City.log_message(message, el)
-        self.notices.append(msg)
+    def notice(
+        self, message: str, el: OsmElementT | None = None, *args: Any
+    ) -> None:
+        """This type of message may point to a potential problem.
+        :param message: message text, or a template for str.format()
+            if args are given. The text is built only when needed.
+        """
+        self._notices.append(Message.make(message, el, args))
 
-    def warn(self, message: str, el: OsmElementT | None = None) -> None:
+    def warn(
+        self, message: str, el: OsmElementT | None = None, *args: Any
+    ) -> None:
         """A warning is definitely a problem but is doesn't prevent
         from building a routing file and doesn't invalidate the city.
         """
-        msg = City.log_message(message, el)
-        self.warnings.append(msg)
+        self._warnings.append(Message.make(message, el, args))
 
-    def error(self, message: str, el: OsmElementT | None = None) -> None:
+    def error(
+        self, message: str, el: OsmElementT | None = None, *args: Any
+    ) -> None:
         """Error is a critical problem that invalidates the city."""
-        msg = City.log_message(message, el)
-        self.errors.append(msg)
+        self._errors.append(Message.make(message, el, args))
+
+    @property
+    def errors(self) -> list[str]:
+        return [m.render() for m in self._errors]
+
+    @property
+    def warnings(self) -> list[str]:
+        return [m.render() for m in self._warnings]
+
+    @property
+    def notices(self) -> list[str]:
+        return [m.render() for m in self._notices]
+
+    def get_message_marks(self) -> tuple[int, int, int]:
+        """Return numbers of errors, warnings and notices, to get messages
+        logged after this moment with get_messages_since().
+        """
+        return len(self._errors), len(self._warnings), len(self._notices)
+
+    def get_messages_since(
+        self, marks: tuple[int, int, int]
+    ) -> tuple[tuple[Message, ...], ...]:
+        """Return errors, warnings and notices logged after the marks."""
+        return tuple(
+            tuple(messages[mark:])
+            for messages, mark in zip(
+                (self._errors, self._warnings, self._notices), marks
+            )
+        )
+
+    def add_messages(self, messages: tuple[tuple[Message, ...], ...]) -> None:
+        """Add errors, warnings and notices got from get_messages_since(),
+        possibly of another city.
+        """
+        errors, warnings, notices = messages
+        self._errors.extend(errors)
+        self._warnings.extend(warnings)
+        self._notices.extend(notices)
+
+    def get_message_counts(self) -> dict[str, Counter[str]]:
+        """Return numbers of messages of each type, that is of each
+        message template, for "errors", "warnings" and "notices".
+        """
+        return {
+            level: Counter(m.template for m in messages)
+            for level, messages in (
+                ("errors", self._errors),
+                ("warnings", self._warnings),
+                ("notices", self._notices),
+            )
+        }
 
     def contains(self, el: OsmElementT) -> bool:
         center = el_center(el)
@@ -159,25 +307,55 @@ class City:
             )
         return False
 
+    def get_element_kinds(self, el: OsmElementT) -> list[str]:
+        """Kinds from ELEMENT_KINDS the element belongs to."""
+        kinds = []
+        tags = el.get("tags")
+        if not tags:
+            return kinds
+        if Station.is_station(el, self.modes):
+            kinds.append("stations")
+        if tags.get("railway") in (
+            "subway_entrance",
+            "train_station_entrance",
+        ):
+            kinds.append("entrances")
+        if el["type"] != "relation":
+            return kinds
+        if Route.is_route(el, self.modes):
+            kinds.append("routes")
+        if tags.get("type") == "route_master":
+            kinds.append("route_masters")
+        public_transport = tags.get("public_transport")
+        if public_transport == "stop_area":
+            kinds.append("stop_areas")
+        elif public_transport == "stop_area_group":
+            kinds.append("stop_area_groups")
+        return kinds
+
     def add(self, el: OsmElementT) -> None:
         if el["type"] == "relation" and "members" not in el:
             return
 
-        self.elements[el_id(el)] = el
-        if not (el["type"] == "relation" and "tags" in el):
-            return
+        element_id = el_packed_id(el)
+        self.elements[element_id] = el
+        kinds = self.get_element_kinds(el)
+        for kind in kinds:
+            self.elements_by_kind[kind][element_id] = el
+        if "entrances" in kinds:
+            self._entrance_grid = None
 
-        relation_type = el["tags"].get("type")
-        if relation_type == "route_master":
+        if "route_masters" in kinds:
             for m in el["members"]:
                 if m["type"] != "relation":
                     continue
 
-                if el_id(m) in self.masters:
+                if (route_id := el_packed_id(m)) in self.masters:
                     self.error("Route in two route_masters", m)
-                self.masters[el_id(m)] = el
+                self.masters[route_id] = el
 
-        elif el["tags"].get("public_transport") == "stop_area":
+        elif "stop_areas" in kinds:
+            relation_type = el["tags"].get("type")
             if relation_type != "public_transport":
                 self.warn(
                     "stop_area relation with "
@@ -188,17 +366,29 @@ class City:
 
             warned_about_duplicates = False
             for m in el["members"]:
-                stop_areas = self.stop_areas[el_id(m)]
+                stop_areas = self.stop_areas[el_packed_id(m)]
                 if el in stop_areas and not warned_about_duplicates:
                     self.warn("Duplicate element in a stop area", el)
                     warned_about_duplicates = True
                 else:
                     stop_areas.append(el)
 
+    def get_entrances_near(
+        self, point: LonLat, radius: float
+    ) -> list[OsmElementT]:
+        """Return subway and train station entrances that may lie within
+        radius meters from the point, in the order of self.elements.
+        """
+        if self._entrance_grid is None or self._entrance_grid.radius != radius:
+            self._entrance_grid = PointGrid(
+                self.elements_by_kind["entrances"].values(), radius
+            )
+        return self._entrance_grid.find_near(point)
+
     def make_transfer(self, stoparea_group: OsmElementT) -> None:
         transfer: set[StopArea] = set()
         for m in stoparea_group["members"]:
-            k = el_id(m)
+            k = el_packed_id(m)
             el = self.elements.get(k)
             if not el:
                 # A stoparea_group member may validly not belong to the city
@@ -206,7 +396,9 @@ class City:
                 continue
             if "tags" not in el:
                 self.warn(
-                    "An untagged object {} in a stop_area_group".format(k),
+                    "An untagged object {} in a stop_area_group".format(
+                        unpack_id(k)
+                    ),
                     stoparea_group,
                 )
                 continue
@@ -219,7 +411,7 @@ class City:
             if k in self.stations:
                 stoparea = self.stations[k][0]
                 transfer.add(stoparea)
-                if stoparea.transfer:
+                if stoparea.id in self.stoparea_transfers:
                     # TODO: properly process such cases.
                     # Counterexample 1: Paris,
                     #            Châtelet subway station <->
@@ -231,99 +423,109 @@ class City:
                     #             Звенигородская
                     self.warn(
                         "Stop area {} belongs to multiple interchanges".format(
-                            k
+                            unpack_id(k)
                         )
                     )
-                stoparea.transfer = el_id(stoparea_group)
+                self.stoparea_transfers[stoparea.id] = el_packed_id(
+                    stoparea_group
+                )
         if len(transfer) > 1:
             self.transfers.append(transfer)
 
-    def extract_routes(self) -> None:
+    def get_transfer(self, stoparea: StopArea) -> PackedIdT | None:
+        """Return id of the stop_area_group relation the stop area
+        is in, if any.
+        """
+        return self.stoparea_transfers.get(stoparea.id)
+
+    def extract_routes(self, registry: StationRegistry | None = None) -> None:
+        """:param registry: stations and stop areas shared with other
+        cities, if the city is validated along with them.
+        """
+        if registry is None:
+            registry = StationRegistry()
+
         # Extract stations
         processed_stop_areas = set()
-        for el in self.elements.values():
-            if Station.is_station(el, self.modes):
-                # See PR https://github.com/mapsme/subways/pull/98
+        for el in self.elements_by_kind["stations"].values():
+            # See PR https://github.com/mapsme/subways/pull/98
+            if (
+                el["type"] == "relation"
+                and el["tags"].get("type") != "multipolygon"
+            ):
+                rel_type = el["tags"].get("type")
+                self.warn(
+                    "A railway station cannot be a relation of type "
+                    f"{rel_type}",
+                    el,
+                )
+                continue
+            st = registry.get_station(el, self)
+            self.station_ids.add(st.id)
+            if st.id in self.stop_areas:
+                stations = []
+                for sa in self.stop_areas[st.id]:
+                    stations.append(registry.get_stoparea(st, self, sa))
+            else:
+                stations = [registry.get_stoparea(st, self)]
+
+            for station in stations:
+                if station.id not in processed_stop_areas:
+                    processed_stop_areas.add(station.id)
+                    for st_el in station.get_elements():
+                        self.stations[st_el].append(station)
+
+                    # Check that stops and platforms belong to
+                    # a single stop_area
+                    for sp in chain(station.stops, station.platforms):
+                        if sp in self.stops_and_platforms:
+                            self.notice(
+                                f"A stop or a platform {unpack_id(sp)} "
+                                "belongs to multiple stop areas, "
+                                "might be correct"
+                            )
+                        else:
+                            self.stops_and_platforms.add(sp)
+
+        # Extract routes
+        for el in self.elements_by_kind["routes"].values():
+            if el["tags"].get("access") in ("no", "private"):
+                continue
+            route_id = el_packed_id(el)
+            master_element = self.masters.get(route_id, None)
+            if self.networks:
+                network = get_network(el)
+                if master_element:
+                    master_network = get_network(master_element)
+                else:
+                    master_network = None
                 if (
-                    el["type"] == "relation"
-                    and el["tags"].get("type") != "multipolygon"
+                    network not in self.networks
+                    and master_network not in self.networks
                 ):
-                    rel_type = el["tags"].get("type")
-                    self.warn(
-                        "A railway station cannot be a relation of type "
-                        f"{rel_type}",
-                        el,
-                    )
                     continue
-                st = Station(el, self)
-                self.station_ids.add(st.id)
-                if st.id in self.stop_areas:
-                    stations = []
-                    for sa in self.stop_areas[st.id]:
-                        stations.append(StopArea(st, self, sa))
-                else:
-                    stations = [StopArea(st, self)]
-
-                for station in stations:
-                    if station.id not in processed_stop_areas:
-                        processed_stop_areas.add(station.id)
-                        for st_el in station.get_elements():
-                            self.stations[st_el].append(station)
-
-                        # Check that stops and platforms belong to
-                        # a single stop_area
-                        for sp in chain(station.stops, station.platforms):
-                            if sp in self.stops_and_platforms:
-                                self.notice(
-                                    f"A stop or a platform {sp} belongs to "
-                                    "multiple stop areas, might be correct"
-                                )
-                            else:
-                                self.stops_and_platforms.add(sp)
 
-        # Extract routes
-        for el in self.elements.values():
-            if Route.is_route(el, self.modes):
-                if el["tags"].get("access") in ("no", "private"):
-                    continue
-                route_id = el_id(el)
-                master_element = self.masters.get(route_id, None)
-                if self.networks:
-                    network = get_network(el)
-                    if master_element:
-                        master_network = get_network(master_element)
-                    else:
-                        master_network = None
-                    if (
-                        network not in self.networks
-                        and master_network not in self.networks
-                    ):
-                        continue
-
-                route = self.route_class(el, self, master_element)
-                if not route.stops:
-                    self.warn("Route has no stops", el)
-                    continue
-                elif len(route.stops) == 1:
-                    self.warn("Route has only one stop", el)
-                    continue
+            route = self.route_class(el, self, master_element)
+            if not route.stops:
+                self.warn("Route has no stops", el)
+                continue
+            elif len(route.stops) == 1:
+                self.warn("Route has only one stop", el)
+                continue
 
-                master_id = el_id(master_element) or route.ref
-                route_master = self.routes.setdefault(
-                    master_id, RouteMaster(self, master_element)
-                )
-                route_master.add(route)
+            master_id = el_id(master_element) or route.ref
+            route_master = self.routes.setdefault(
+                master_id, RouteMaster(self, master_element)
+            )
+            route_master.add(route)
 
-            # And while we're iterating over relations, find interchanges
-            if (
-                el["type"] == "relation"
-                and el.get("tags", {}).get("public_transport", None)
-                == "stop_area_group"
-            ):
-                self.make_transfer(el)
+        # Find interchanges
+        for el in self.elements_by_kind["stop_area_groups"].values():
+            self.make_transfer(el)
 
         # Filter transfers, leaving only stations that belong to routes
         own_stopareas = set(self.stopareas())
+        self.stoparea_ids = {stoparea.id for stoparea in own_stopareas}
 
         self.transfers = [
             inner_transfer
@@ -347,12 +549,12 @@ class City:
 
     @property
     def is_good(self) -> bool:
-        if not (self.errors or self.validate_called):
+        if not (self._errors or self.validate_called):
             raise RuntimeError(
                 "You mustn't refer to City.is_good property before calling "
                 "the City.validate() method unless an error already occurred."
             )
-        return len(self.errors) == 0
+        return len(self._errors) == 0
 
     def get_validation_result(self) -> dict:
         result = {
@@ -402,24 +604,18 @@ class City:
     def count_unused_entrances(self) -> None:
         global used_entrances
         stop_areas = set()
-        for el in self.elements.values():
-            if (
-                el["type"] == "relation"
-                and "tags" in el
-                and el["tags"].get("public_transport") == "stop_area"
-                and "members" in el
-            ):
-                stop_areas.update([el_id(m) for m in el["members"]])
+        for el in self.elements_by_kind["stop_areas"].values():
+            stop_areas.update([el_packed_id(m) for m in el["members"]])
         unused = []
         not_in_sa = []
-        for el in self.elements.values():
+        for el in self.elements_by_kind["entrances"].values():
             if (
                 el["type"] == "node"
-                and "tags" in el
                 and el["tags"].get("railway") == "subway_entrance"
             ):
-                i = el_id(el)
+                i = el_packed_id(el)
                 if i in self.stations:
+                    self.used_entrances.add(i)
                     used_entrances.add(i)
                 if i not in stop_areas:
                     not_in_sa.append(i)
@@ -429,13 +625,17 @@ class City:
         self.entrances_not_in_stop_areas = len(not_in_sa)
         if unused:
             self.notice(
-                f"{len(unused)} subway entrances are not connected to a "
-                f"station: {format_elid_list(unused)}"
+                "{} subway entrances are not connected to a station: {}",
+                None,
+                len(unused),
+                ElidList(unused),
             )
         if not_in_sa:
             self.notice(
-                f"{len(not_in_sa)} subway entrances are not in stop_area "
-                f"relations: {format_elid_list(not_in_sa)}"
+                "{} subway entrances are not in stop_area relations: {}",
+                None,
+                len(not_in_sa),
+                ElidList(not_in_sa),
             )
 
     def validate_lines(self) -> None:
@@ -493,15 +693,16 @@ class City:
                 rmaster.check_return_routes()
             route_stations = set()
             for sa in rmaster.stopareas():
-                route_stations.add(sa.transfer or sa.id)
+                route_stations.add(self.get_transfer(sa) or sa.id)
                 unused_stations.discard(sa.station.id)
             self.found_stations += len(route_stations)
         if unused_stations:
             self.unused_stations = len(unused_stations)
             self.notice(
-                "{} unused stations: {}".format(
-                    self.unused_stations, format_elid_list(unused_stations)
-                )
+                "{} unused stations: {}",
+                None,
+                self.unused_stations,
+                ElidList(unused_stations),
             )
         self.count_unused_entrances()
         self.found_interchanges = len(self.transfers)
@@ -559,35 +760,35 @@ class City:
                 route.calculate_distances()
 
 
+def is_stop_area_group(el: OsmElementT) -> bool:
+    return (
+        el["type"] == "relation"
+        and "members" in el
+        and el.get("tags", {}).get("public_transport") == "stop_area_group"
+    )
+
+
 def find_transfers(
-    elements: list[OsmElementT], cities: Collection[City]
+    stop_area_groups: Iterable[OsmElementT], cities: Collection[City]
 ) -> TransfersT:
     """As for now, two Cities may contain the same stoparea, but those
-    StopArea instances would have different python id. So we don't store
+    StopArea instances may be different python objects. So we don't store
     references to StopAreas, but only their ids. This is important at
     inter-city interchanges.
+    :param stop_area_groups: stop_area_group relations, e.g. collected
+        while adding elements to cities. Other elements are skipped,
+        so all elements may be passed as well.
     """
-    stop_area_groups = [
-        el
-        for el in elements
-        if el["type"] == "relation"
-        and "members" in el
-        and el.get("tags", {}).get("public_transport") == "stop_area_group"
-    ]
-
-    stopareas_in_cities_ids = set(
-        stoparea.id
-        for city in cities
-        if city.is_good
-        for stoparea in city.stopareas()
+    stopareas_in_cities_ids = set().union(
+        *(city.stoparea_ids for city in cities if city.is_good)
     )
 
     transfers = []
-    for stop_area_group in stop_area_groups:
+    for stop_area_group in filter(is_stop_area_group, stop_area_groups):
         transfer: TransferT = set(
             member_id
             for member_id in (
-                el_id(member) for member in stop_area_group["members"]
+                el_packed_id(member) for member in stop_area_group["members"]
             )
             if member_id in stopareas_in_cities_ids
         )
@@ -605,7 +806,7 @@ def get_unused_subway_entrances_geojson(elements: list[OsmElementT]) -> dict:
             and "tags" in el
             and el["tags"].get("railway") == "subway_entrance"
         ):
-            if el_id(el) not in used_entrances:
+            if el_packed_id(el) not in used_entrances:
                 geometry = {"type": "Point", "coordinates": el_center(el)}
                 properties = {
                     k: v
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 import re
 import typing
 from collections.abc import Callable, Collection, Iterator
@@ -13,16 +14,34 @@ from subways.consts import (
 from subways.css_colours import normalize_colour
 from subways.geom_utils import (
     angle_between,
+    angles_along,
     distance,
-    distance_on_line,
+    distance_many,
     find_segment,
+    MAX_DISTANCE_TO_PROJECT,
     project_on_line,
+    project_points_on_line,
 )
-from subways.osm_element import el_id, el_center, get_network
+from subways.osm_element import (
+    el_center,
+    el_id,
+    el_packed_id,
+    get_network,
+    pack_id,
+    unpack_id,
+)
+from subways.spatial_index import SegmentGrid
 from subways.structure.route_stop import RouteStop
 from subways.structure.station import Station
 from subways.structure.stop_area import StopArea
-from subways.types import CriticalValidationError, IdT, OsmElementT, RailT
+from subways.types import (
+    CriticalValidationError,
+    IdT,
+    LonLat,
+    OsmElementT,
+    PackedIdT,
+    RailT,
+)
 
 if typing.TYPE_CHECKING:
     from subways.structure.city import City
@@ -129,6 +148,31 @@ def get_route_duration(tags: dict) -> int | None:
 class Route:
     """The longest route for a city with a unique ref."""
 
+    __slots__ = (
+        "city",
+        "element",
+        "id",
+        "ref",
+        "name",
+        "mode",
+        "colour",
+        "infill",
+        "network",
+        "interval",
+        "duration",
+        "start_time",
+        "end_time",
+        "is_circular",
+        "stops",
+        "tracks",
+        "first_stop_on_rails_index",
+        "last_stop_on_rails_index",
+    )
+
+    # Whether to calculate distances, angles and projections of all stops
+    # at once with batched functions from geom_utils
+    batched_geometry = False
+
     @staticmethod
     def is_route(el: OsmElementT, modes: set[str]) -> bool:
         if (
@@ -191,19 +235,21 @@ class Route:
         stop_position_elements = self.process_stop_members()
         self.process_tracks(stop_position_elements)
 
-    def build_longest_line(self) -> tuple[list[IdT], set[IdT]]:
-        line_nodes: set[IdT] = set()
-        last_track: list[IdT] = []
-        track: list[IdT] = []
+    def build_longest_line(
+        self,
+    ) -> tuple[list[PackedIdT], set[PackedIdT]]:
+        line_nodes: set[PackedIdT] = set()
+        last_track: list[PackedIdT] = []
+        track: list[PackedIdT] = []
         warned_about_holes = False
         for m in self.element["members"]:
-            el = self.city.elements.get(el_id(m), None)
+            el = self.city.elements.get(el_packed_id(m), None)
             if not el or not StopArea.is_track(el):
                 continue
             if "nodes" not in el or len(el["nodes"]) < 2:
                 self.city.error("Cannot find nodes in a railway", el)
                 continue
-            nodes: list[IdT] = ["n{}".format(n) for n in el["nodes"]]
+            nodes: list[PackedIdT] = [pack_id("node", n) for n in el["nodes"]]
             if m["role"] == "backward":
                 nodes.reverse()
             line_nodes.update(nodes)
@@ -230,10 +276,9 @@ class Route:
                     # Store the track if it is long and clean it
                     if not warned_about_holes:
                         self.city.warn(
-                            "Hole in route rails near node {}".format(
-                                track[-1]
-                            ),
+                            "Hole in route rails near node {}",
                             self.element,
+                            unpack_id(track[-1]),
                         )
                         warned_about_holes = True
                     if len(track) > len(last_track):
@@ -251,7 +296,29 @@ class Route:
         return last_track, line_nodes
 
     def get_stop_projections(self) -> tuple[list[dict], Callable[[int], bool]]:
-        projected = [project_on_line(x.stop, self.tracks) for x in self.stops]
+        # Stops are projected onto tracks in the metric frame of the city,
+        # if the city has one, and projected points are converted back
+        projection = self.city.local_projection
+        planar = projection is not None
+        if planar:
+            line = [projection.to_xy(v) for v in self.tracks]
+            stops = [projection.to_xy(x.stop) for x in self.stops]
+        else:
+            line = self.tracks
+            stops = [x.stop for x in self.stops]
+        if self.batched_geometry:
+            projected = project_points_on_line(stops, line, planar)
+        else:
+            index = SegmentGrid(line, MAX_DISTANCE_TO_PROJECT, planar)
+            projected = [
+                project_on_line(stop, line, index, planar) for stop in stops
+            ]
+        if planar:
+            for item in projected:
+                if item["projected_point"] is not None:
+                    item["projected_point"] = self.get_point_on_tracks(
+                        item["positions_on_line"][0]
+                    )
 
         def stop_near_tracks_criterion(stop_index: int) -> bool:
             return (
@@ -295,10 +362,10 @@ class Route:
 
             if projected[i]["projected_point"] is None:
                 self.city.error(
-                    'Stop "{}" {} is nowhere near the tracks'.format(
-                        route_stop.stoparea.name, route_stop.stop
-                    ),
+                    'Stop "{}" {} is nowhere near the tracks',
                     self.element,
+                    route_stop.stoparea.name,
+                    route_stop.stop,
                 )
             else:
                 stop_data = {
@@ -312,10 +379,11 @@ class Route:
                 d = round(distance(route_stop.stop, projected_point))
                 if d > MAX_DISTANCE_STOP_TO_LINE:
                     self.city.notice(
-                        'Stop "{}" {} is {} meters from the tracks'.format(
-                            route_stop.stoparea.name, route_stop.stop, d
-                        ),
+                        'Stop "{}" {} is {} meters from the tracks',
                         self.element,
+                        route_stop.stoparea.name,
+                        route_stop.stop,
+                        d,
                     )
                 else:
                     stop_data["coords"] = projected_point
@@ -325,20 +393,107 @@ class Route:
                 projected_stops_data["stops_on_longest_line"].append(stop_data)
         return projected_stops_data
 
+    def get_point_on_tracks(self, position: float) -> LonLat:
+        """Return (lon, lat) of the point at the position on self.tracks."""
+        vertex = math.floor(position)
+        if vertex == position:
+            return self.tracks[vertex]
+        u = position - vertex
+        (lon1, lat1), (lon2, lat2) = (
+            self.tracks[vertex],
+            self.tracks[vertex + 1],
+        )
+        return lon1 + u * (lon2 - lon1), lat1 + u * (lat2 - lat1)
+
+    def get_tracks_cumulative_lengths(self) -> list[float]:
+        """Return distances along self.tracks from the first vertex
+        to each vertex.
+        """
+        if self.batched_geometry:
+            segment_lengths = distance_many(self.tracks[:-1], self.tracks[1:])
+        else:
+            segment_lengths = [
+                distance(self.tracks[i], self.tracks[i + 1])
+                for i in range(len(self.tracks) - 1)
+            ]
+        lengths = [0.0]
+        for segment_length in segment_lengths:
+            lengths.append(lengths[-1] + segment_length)
+        return lengths
+
+    @staticmethod
+    def _get_segment_index(position: float, start_vertex: int) -> int:
+        """Index of the first segment, not less than start_vertex,
+        which contains the position on tracks.
+        """
+        return max(math.ceil(position) - 1, start_vertex)
+
+    def _get_distance_on_tracks(
+        self,
+        route_stop1: RouteStop,
+        route_stop2: RouteStop,
+        start_vertex: int,
+        lengths: list[float],
+    ) -> tuple[float, int] | None:
+        """The same as geom_utils.distance_on_line() for coordinates of two
+        stops, but is calculated with positions of the stops on tracks and
+        cumulative lengths of the tracks.
+        :return: distance and the segment index of the second stop
+            to continue calculations from, or None if any stop is not
+            on the tracks after start_vertex
+        """
+        if not (route_stop1.is_on_tracks and route_stop2.is_on_tracks):
+            return None
+
+        def length_at(position: float) -> float:
+            seg = min(int(position), len(lengths) - 2)
+            return lengths[seg] + (position - seg) * (
+                lengths[seg + 1] - lengths[seg]
+            )
+
+        pos1 = next(
+            (p for p in route_stop1.positions_on_rails if p >= start_vertex),
+            None,
+        )
+        if pos1 is None:
+            return None
+        seg1 = self._get_segment_index(pos1, start_vertex)
+        pos2 = next(
+            (p for p in route_stop2.positions_on_rails if p >= seg1), None
+        )
+        if pos2 is not None:
+            d = abs(length_at(pos2) - length_at(pos1))
+            return d, self._get_segment_index(pos2, seg1)
+        if self.tracks[0] == self.tracks[-1]:
+            # Pass the start of circular tracks
+            pos2 = route_stop2.positions_on_rails[0]
+            d = lengths[-1] - length_at(pos1) + length_at(pos2)
+            return d, self._get_segment_index(pos2, 0)
+        return None
+
     def calculate_distances(self) -> None:
         dist = 0
         vertex = 0
+        lengths = self.get_tracks_cumulative_lengths()
+        stop_coords = [stop.stop for stop in self.stops]
+        if self.batched_geometry:
+            direct_distances = distance_many(stop_coords[1:], stop_coords[:-1])
+        else:
+            direct_distances = [
+                distance(stop_coords[i], stop_coords[i - 1])
+                for i in range(1, len(stop_coords))
+            ]
         for i, stop in enumerate(self.stops):
             if i > 0:
-                direct = distance(stop.stop, self.stops[i - 1].stop)
+                direct = direct_distances[i - 1]
                 d_line = None
                 if (
                     self.first_stop_on_rails_index
                     <= i
                     <= self.last_stop_on_rails_index
                 ):
-                    d_line = distance_on_line(
-                        self.stops[i - 1].stop, stop.stop, self.tracks, vertex
+                    d_line = self._get_distance_on_tracks(
+                        self.stops[i - 1], stop, vertex, lengths
                     )
                 if d_line and direct - 10 <= d_line[0] <= direct * 2:
                     vertex = d_line[1]
@@ -409,7 +564,7 @@ class Route:
         for m in self.element["members"]:
             if "inactive" in m["role"]:
                 continue
-            k = el_id(m)
+            k = el_packed_id(m)
             if k in self.city.stations:
                 st_list = self.city.stations[k]
                 st = st_list[0]
@@ -427,7 +582,7 @@ class Route:
                     if m["role"] and actual_role not in m["role"]:
                         self.city.warn(
                             "Wrong role '{}' for {} {}".format(
-                                m["role"], actual_role, k
+                                m["role"], actual_role, unpack_id(k)
                             ),
                             self.element,
                         )
@@ -466,7 +621,9 @@ class Route:
                         ):
                             self.city.error(
                                 'Found an out-of-place {}: "{}" ({})'.format(
-                                    actual_role, el["tags"].get("name", ""), k
+                                    actual_role,
+                                    el["tags"].get("name", ""),
+                                    unpack_id(k),
                                 ),
                                 self.element,
                             )
@@ -480,7 +637,7 @@ class Route:
                         if repeat_pos >= len(self.stops):
                             self.city.error(
                                 "Incorrect order of {}s at {}".format(
-                                    actual_role, k
+                                    actual_role, unpack_id(k)
                                 ),
                                 self.element,
                             )
@@ -507,7 +664,7 @@ class Route:
             el = self.city.elements[k]
             if "tags" not in el:
                 self.city.error(
-                    f"Untagged object {k} in a route", self.element
+                    f"Untagged object {unpack_id(k)} in a route", self.element
                 )
                 continue
 
@@ -515,8 +672,9 @@ class Route:
             for ck in CONSTRUCTION_KEYS:
                 if ck in el["tags"]:
                     self.city.warn(
-                        f"Under construction {m['role'] or 'feature'} {k} "
-                        "in route. Consider setting 'inactive' role or "
+                        f"Under construction {m['role'] or 'feature'} "
+                        f"{unpack_id(k)} in route. Consider setting "
+                        "'inactive' role or "
                         "removing construction attributes",
                         self.element,
                     )
@@ -560,13 +718,12 @@ class Route:
         tracks, line_nodes = self.build_longest_line()
 
         for stop_el in stop_position_elements:
-            stop_id = el_id(stop_el)
-            if stop_id not in line_nodes:
+            if el_packed_id(stop_el) not in line_nodes:
                 self.city.warn(
-                    'Stop position "{}" ({}) is not on tracks'.format(
-                        stop_el["tags"].get("name", ""), stop_id
-                    ),
+                    'Stop position "{}" ({}) is not on tracks',
                     self.element,
+                    stop_el["tags"].get("name", ""),
+                    el_id(stop_el),
                 )
 
         # self.tracks would be a list of (lon, lat) for the longest stretch.
@@ -578,8 +735,9 @@ class Route:
             self.tracks = []
             for n in filter(lambda x: x not in self.city.elements, tracks):
                 self.city.warn(
-                    f"The dataset is missing the railway tracks node {n}",
+                    "The dataset is missing the railway tracks node {}",
                     self.element,
+                    unpack_id(n),
                 )
                 break
 
@@ -613,6 +771,7 @@ class Route:
             route_stop.positions_on_rails = stop_data["positions_on_rails"]
             if stop_coords := stop_data["coords"]:
                 route_stop.stop = stop_coords
+                route_stop.is_on_tracks = True
 
     def get_extended_tracks(self) -> RailT:
         """Amend tracks with points of leading/trailing self.stops
@@ -686,14 +845,20 @@ class Route:
     def check_stops_order_by_angle(self) -> tuple[list[str], list[str]]:
         disorder_warnings = []
         disorder_errors = []
-        for i, route_stop in enumerate(
-            islice(self.stops, 1, len(self.stops) - 1), start=1
+        if self.batched_geometry:
+            angles = angles_along([route_stop.stop for route_stop in self])
+        else:
+            angles = [
+                angle_between(
+                    self.stops[i - 1].stop,
+                    self.stops[i].stop,
+                    self.stops[i + 1].stop,
+                )
+                for i in range(1, len(self.stops) - 1)
+            ]
+        for route_stop, angle in zip(
+            islice(self.stops, 1, len(self.stops) - 1), angles
         ):
-            angle = angle_between(
-                self.stops[i - 1].stop,
-                route_stop.stop,
-                self.stops[i + 1].stop,
-            )
             if angle < ALLOWED_ANGLE_BETWEEN_STOPS:
                 msg = (
                     "Angle between stops around "
@@ -880,32 +1045,33 @@ class Route:
         ]
         return True
 
-    def get_end_transfers(self) -> tuple[IdT, IdT]:
+    def get_end_transfers(self) -> tuple[PackedIdT, PackedIdT]:
         """Using transfer ids because a train can arrive at different
         stations within a transfer. But disregard transfer that may give
         an impression of a circular route (for example,
         Simonis / Elisabeth station and route 2 in Brussels).
         """
+        first_transfer = self.city.get_transfer(self[0].stoparea)
+        last_transfer = self.city.get_transfer(self[-1].stoparea)
         return (
             (self[0].stoparea.id, self[-1].stoparea.id)
-            if (
-                self[0].stoparea.transfer is not None
-                and self[0].stoparea.transfer == self[-1].stoparea.transfer
-            )
+            if first_transfer is not None and first_transfer == last_transfer
             else (
-                self[0].stoparea.transfer or self[0].stoparea.id,
-                self[-1].stoparea.transfer or self[-1].stoparea.id,
+                first_transfer or self[0].stoparea.id,
+                last_transfer or self[-1].stoparea.id,
             )
         )
 
-    def get_transfers_sequence(self) -> list[IdT]:
+    def get_transfers_sequence(self) -> list[PackedIdT]:
         """Return a list of stoparea or transfer (if not None) ids."""
         transfer_seq = [
-            stop.stoparea.transfer or stop.stoparea.id for stop in self
+            self.city.get_transfer(stop.stoparea) or stop.stoparea.id
+            for stop in self
         ]
+        first_transfer = self.city.get_transfer(self[0].stoparea)
         if (
-            self[0].stoparea.transfer is not None
-            and self[0].stoparea.transfer == self[-1].stoparea.transfer
+            first_transfer is not None
+            and first_transfer == self.city.get_transfer(self[-1].stoparea)
         ):
             transfer_seq[0], transfer_seq[-1] = self.get_end_transfers()
         return transfer_seq
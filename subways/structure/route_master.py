@@ -260,12 +260,13 @@ class RouteMaster:
             if route in routes_having_backward:
                 continue
             transfer_sequence1 = [
-                stop.stoparea.transfer or stop.stoparea.id for stop in route
+                self.city.get_transfer(stop.stoparea) or stop.stoparea.id
+                for stop in route
             ]
             transfer_sequence1.pop()
             for potential_backward_route in routes - {route}:
                 transfer_sequence2 = [
-                    stop.stoparea.transfer or stop.stoparea.id
+                    self.city.get_transfer(stop.stoparea) or stop.stoparea.id
                     for stop in potential_backward_route
                 ][
                     -2::-1
@@ -397,11 +398,14 @@ class RouteMaster:
         stops1 = route1.stops
         stops2 = route2.stops[::-1]
 
+        city = route1.city
+
         def stops_match(stop1: RouteStop, stop2: RouteStop) -> bool:
-            return (
-                stop1.stoparea == stop2.stoparea
-                or stop1.stoparea.transfer is not None
-                and stop1.stoparea.transfer == stop2.stoparea.transfer
+            if stop1.stoparea == stop2.stoparea:
+                return True
+            transfer = city.get_transfer(stop1.stoparea)
+            return transfer is not None and transfer == city.get_transfer(
+                stop2.stoparea
             )
 
         d = [[0] * (len(stops2) + 1) for _ in range(len(stops1) + 1)]
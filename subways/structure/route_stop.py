@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import typing
 
-from subways.osm_element import el_center, el_id
+from subways.osm_element import el_center, el_id, el_packed_id
 from subways.structure.station import Station
 from subways.structure.stop_area import StopArea
 from subways.types import LonLat, OsmElementT
@@ -11,19 +11,55 @@ if typing.TYPE_CHECKING:
     from subways.structure.city import City
 
 
+class _Flag:
+    """Boolean attribute stored as a bit of the _flags integer."""
+
+    __slots__ = ("mask",)
+
+    def __init__(self, bit: int) -> None:
+        self.mask = 1 << bit
+
+    def __get__(self, instance: RouteStop | None, owner: type) -> bool:
+        if instance is None:
+            return self
+        return bool(instance._flags & self.mask)
+
+    def __set__(self, instance: RouteStop, value: bool) -> None:
+        if value:
+            instance._flags |= self.mask
+        else:
+            instance._flags &= ~self.mask
+
+
 class RouteStop:
+    __slots__ = (
+        "stoparea",
+        "stop",
+        "distance",
+        "positions_on_rails",
+        "platform_entry",
+        "platform_exit",
+        "_flags",
+    )
+
+    is_on_tracks = _Flag(0)  # If the stop position is snapped to tracks
+    can_enter = _Flag(1)
+    can_exit = _Flag(2)
+    seen_stop = _Flag(3)
+    seen_platform_entry = _Flag(4)
+    seen_platform_exit = _Flag(5)
+    seen_station = _Flag(6)
+
     def __init__(self, stoparea: StopArea) -> None:
         self.stoparea: StopArea = stoparea
         self.stop: LonLat = None  # Stop position, possibly projected
         self.distance = 0  # In meters from the start of the route
-        self.platform_entry = None  # Platform el_id
-        self.platform_exit = None  # Platform el_id
-        self.can_enter = False
-        self.can_exit = False
-        self.seen_stop = False
-        self.seen_platform_entry = False
-        self.seen_platform_exit = False
-        self.seen_station = False
+        # Fractional indices of route tracks vertices where the stop is
+        # projected, several if the route passes the same tracks again
+        self.positions_on_rails: list[float] | None = None
+        self.platform_entry = None  # Platform packed id
+        self.platform_exit = None  # Platform packed id
+        self._flags = 0  # All boolean flags are False
 
     @property
     def seen_platform(self) -> bool:
@@ -45,7 +81,7 @@ class RouteStop:
         return None
 
     def add(self, member: dict, relation: OsmElementT, city: City) -> None:
-        el = city.elements[el_id(member)]
+        el = city.elements[el_packed_id(member)]
         role = member["role"]
 
         if StopArea.is_stop(el):
@@ -72,10 +108,10 @@ class RouteStop:
             if "stop" in role:
                 city.warn("Platform in a stop role in a route", el)
             if "exit_only" not in role:
-                self.platform_entry = el_id(el)
+                self.platform_entry = el_packed_id(el)
                 self.can_enter = True
             if "entry_only" not in role:
-                self.platform_exit = el_id(el)
+                self.platform_exit = el_packed_id(el)
                 self.can_exit = True
             if not self.seen_stop:
                 self.stop = el_center(el)
@@ -92,9 +128,11 @@ class RouteStop:
             else:
                 if role != "platform" and "stop" not in role:
                     city.warn(
-                        f'Platform "{el["tags"].get("name", "")}" '
-                        f'({el_id(el)}) with invalid role "{role}" in route',
+                        'Platform "{}" ({}) with invalid role "{}" in route',
                         relation,
+                        el["tags"].get("name", ""),
+                        el_id(el),
+                        role,
                     )
                 multiple_check = self.seen_platform
                 self.seen_platform_entry = True
@@ -105,10 +143,11 @@ class RouteStop:
         if multiple_check:
             log_function = city.error if actual_role == "stop" else city.notice
             log_function(
-                f'Multiple {actual_role}s for a station "'
-                f'{el["tags"].get("name", "")} '
-                f"({el_id(el)}) in a route relation",
+                'Multiple {}s for a station "{} ({}) in a route relation',
                 relation,
+                actual_role,
+                el["tags"].get("name", ""),
+                el_id(el),
             )
 
     def __repr__(self) -> str:
@@ -4,17 +4,27 @@ import typing
 
 from subways.consts import ALL_MODES, CONSTRUCTION_KEYS
 from subways.css_colours import normalize_colour
-from subways.osm_element import el_center, el_id
-from subways.types import IdT, OsmElementT
+from subways.osm_element import el_center, el_packed_id
+from subways.types import OsmElementT, PackedIdT
 
 if typing.TYPE_CHECKING:
     from subways.structure.city import City
 
 
 class Station:
+    __slots__ = (
+        "id",
+        "element",
+        "modes",
+        "name",
+        "int_name",
+        "colour",
+        "center",
+    )
+
     def __init__(self, el: OsmElementT, city: City) -> None:
         """Call this with a railway=station OSM feature."""
-        self.id: IdT = el_id(el)
+        self.id: PackedIdT = el_packed_id(el)
         self.element: OsmElementT = el
         self.modes = Station.get_modes(el)
         self.name = el["tags"].get("name", "?")
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import typing
+from typing import NamedTuple
+
+from subways.osm_element import el_packed_id
+from subways.structure.station import Station
+from subways.structure.stop_area import StopArea
+from subways.types import OsmElementT, PackedIdT
+
+if typing.TYPE_CHECKING:
+    from subways.structure.city import City, Message
+
+
+class _Entry(NamedTuple):
+    obj: Station | StopArea
+    inputs: tuple
+    # Errors, warnings and notices logged while building the object
+    messages: tuple[tuple[Message, ...], ...]
+
+
+class StationRegistry:
+    """Stations and stop areas shared between cities.
+
+    Cities with overlapping bboxes contain the same elements. A Station
+    or a StopArea is built once, for the first city, and is reused in
+    other cities if it does not depend on differences between the cities.
+    Validation messages logged while building the object are added to
+    each city it is used in.
+    """
+
+    def __init__(self) -> None:
+        self.stations: dict[PackedIdT, _Entry] = {}
+        self.stopareas: dict[tuple[PackedIdT, PackedIdT], _Entry] = {}
+
+    @staticmethod
+    def _build(
+        city: City, cls: type, *args: typing.Any
+    ) -> tuple[Station | StopArea, tuple[tuple[Message, ...], ...]]:
+        marks = city.get_message_marks()
+        obj = cls(*args)
+        return obj, city.get_messages_since(marks)
+
+    def get_station(self, el: OsmElementT, city: City) -> Station:
+        entry = self.stations.get(station_id := el_packed_id(el))
+        if entry and entry.obj.element is el:
+            city.add_messages(entry.messages)
+            return entry.obj
+        station, messages = self._build(city, Station, el, city)
+        self.stations[station_id] = _Entry(station, (), messages)
+        return station
+
+    def get_stoparea(
+        self,
+        station: Station,
+        city: City,
+        stop_area: OsmElementT | None = None,
+    ) -> StopArea:
+        element = stop_area or station.element
+        key = (el_packed_id(element), station.id)
+        inputs = StopArea.get_inputs(station, city, stop_area)
+        entry = self.stopareas.get(key)
+        if (
+            entry
+            and entry.obj.station is station
+            and entry.obj.element is element
+            and entry.inputs == inputs
+        ):
+            city.add_messages(entry.messages)
+            return entry.obj
+        stoparea, messages = self._build(
+            city, StopArea, station, city, stop_area
+        )
+        self.stopareas[key] = _Entry(stoparea, inputs, messages)
+        return stoparea
@@ -6,9 +6,9 @@ from itertools import chain
 from subways.consts import RAILWAY_TYPES
 from subways.css_colours import normalize_colour
 from subways.geom_utils import distance
-from subways.osm_element import el_id, el_center
+from subways.osm_element import el_center, el_packed_id
 from subways.structure.station import Station
-from subways.types import IdT, OsmElementT
+from subways.types import OsmElementT, PackedIdT
 
 if typing.TYPE_CHECKING:
     from subways.structure.city import City
@@ -43,6 +43,22 @@ class StopArea:
             return False
         return el["tags"].get("railway") in RAILWAY_TYPES
 
+    __slots__ = (
+        "element",
+        "id",
+        "station",
+        "stops",
+        "platforms",
+        "exits",
+        "entrances",
+        "center",
+        "centers",
+        "modes",
+        "name",
+        "int_name",
+        "colour",
+    )
+
     def __init__(
         self,
         station: Station,
@@ -52,17 +68,16 @@ class StopArea:
         """Call this with a Station object."""
 
         self.element: OsmElementT = stop_area or station.element
-        self.id: IdT = el_id(self.element)
+        self.id: PackedIdT = el_packed_id(self.element)
         self.station: Station = station
-        self.stops = set()  # set of el_ids of stop_positions
-        self.platforms = set()  # set of el_ids of platforms
-        self.exits = set()  # el_id of subway_entrance/train_station_entrance
+        self.stops = set()  # packed ids of stop_positions
+        self.platforms = set()  # packed ids of platforms
+        self.exits = set()  # ids of subway/train_station entrances
         # for leaving the platform
-        self.entrances = set()  # el_id of subway/train_station entrance
+        self.entrances = set()  # ids of subway/train_station entrances
         # for entering the platform
         self.center = None  # lon, lat of the station centre point
-        self.centers = {}  # el_id -> (lon, lat) for all elements
-        self.transfer = None  # el_id of a transfer relation
+        self.centers = {}  # packed id -> (lon, lat) for all elements
 
         self.modes = station.modes
         self.name = station.name
@@ -112,13 +127,20 @@ class StopArea:
             for i in range(2):
                 self.center[i] /= len(self.stops) + len(self.platforms)
 
+        # Sets of ids are not modified after construction and are mostly
+        # small, so they are kept as more compact tuples
+        self.stops = tuple(self.stops)
+        self.platforms = tuple(self.platforms)
+        self.exits = tuple(self.exits)
+        self.entrances = tuple(self.entrances)
+
     def _process_members(
         self, station: Station, city: City, stop_area: OsmElementT
     ) -> None:
         # If we have a stop area, add all elements from it
         tracks_detected = False
         for m in stop_area["members"]:
-            k = el_id(m)
+            k = el_packed_id(m)
             m_el = city.elements.get(k)
             if not m_el or "tags" not in m_el:
                 continue
@@ -153,14 +175,11 @@ class StopArea:
 
     def _add_nearby_entrances(self, station: Station, city: City) -> None:
         center = station.center
-        for entrance_el in (
-            el
-            for el in city.elements.values()
-            if "tags" in el
-            and (entrance_type := el["tags"].get("railway"))
-            in ("subway_entrance", "train_station_entrance")
+        for entrance_el in city.get_entrances_near(
+            center, MAX_DISTANCE_TO_ENTRANCES
         ):
-            entrance_id = el_id(entrance_el)
+            entrance_type = entrance_el["tags"]["railway"]
+            entrance_id = el_packed_id(entrance_el)
             if entrance_id in city.stop_areas:
                 continue  # This entrance belongs to some stop_area
             c_center = el_center(entrance_el)
@@ -176,7 +195,35 @@ class StopArea:
                 if etag != "entrance":
                     self.exits.add(entrance_id)
 
-    def get_elements(self) -> set[IdT]:
+    @staticmethod
+    def get_inputs(
+        station: Station, city: City, stop_area: OsmElementT | None = None
+    ) -> tuple:
+        """Return what a StopArea built in the city depends on besides
+        the station and the stop_area elements. StopAreas built with
+        equal inputs in different cities are the same.
+        """
+        if stop_area:
+            return (
+                frozenset(city.modes),
+                tuple(
+                    k
+                    for k in (el_packed_id(m) for m in stop_area["members"])
+                    if k in city.elements
+                ),
+            )
+        return tuple(
+            entrance_id
+            for entrance_id in (
+                el_packed_id(entrance_el)
+                for entrance_el in city.get_entrances_near(
+                    station.center, MAX_DISTANCE_TO_ENTRANCES
+                )
+            )
+            if entrance_id not in city.stop_areas
+        )
+
+    def get_elements(self) -> set[PackedIdT]:
         result = {self.id, self.station.id}
         result.update(self.entrances)
         result.update(self.exits)
@@ -187,5 +234,5 @@ class StopArea:
     def __repr__(self) -> str:
         return (
             f"StopArea(id={self.id}, name={self.name}, station={self.station},"
-            f" transfer={self.transfer}, center={self.center})"
+            f" center={self.center})"
         )
@@ -1,33 +1,43 @@
 from __future__ import annotations
 
+import codecs
 import json
 import logging
+import re
 import typing
 from collections import OrderedDict
+from collections.abc import Iterator
 from io import BufferedIOBase
-from typing import Any, TextIO
+from typing import Any, BinaryIO, TextIO
 
+from subways.osm_element import Node, OsmElement, Relation, unpack_id, Way
 from subways.types import OsmElementT
 
+# Tag dicts of at most this size are shared by elements in iter_xml()
+# and iter_json()
+MAX_SHARED_TAGS_SIZE = 2
+# Number of bytes or characters iter_json() reads at once
+JSON_CHUNK_SIZE = 1 << 16
+
 if typing.TYPE_CHECKING:
     from subways.structure.city import City
     from subways.structure.stop_area import StopArea
 
 
-def load_xml(f: BufferedIOBase | str) -> list[OsmElementT]:
+def iter_xml(f: BufferedIOBase | str) -> Iterator[OsmElement]:
+    """Yield OSM elements one by one as they are parsed from the XML file,
+    so that they can be processed without waiting for the end of parsing.
+    """
     try:
         from lxml import etree
     except ImportError:
         import xml.etree.ElementTree as etree
 
-    elements: list[OsmElementT] = []
-
+    # Small tag sets repeat a lot, e.g. on railway ways, and are shared
+    # by elements. Such dicts must not be modified.
+    shared_tags: dict[tuple[tuple[str, str], ...], dict[str, str]] = {}
     for event, element in etree.iterparse(f):
         if element.tag in ("node", "way", "relation"):
-            el = {"type": element.tag, "id": int(element.get("id"))}
-            if element.tag == "node":
-                for n in ("lat", "lon"):
-                    el[n] = float(element.get(n))
             tags = {}
             nd = []
             members = []
@@ -44,16 +54,176 @@ def load_xml(f: BufferedIOBase | str) -> list[OsmElementT]:
                             "role": sub.get("role", ""),
                         }
                     )
-            if tags:
-                el["tags"] = tags
-            if nd:
-                el["nodes"] = nd
-            if members:
-                el["members"] = members
-            elements.append(el)
+            if len(tags) <= MAX_SHARED_TAGS_SIZE:
+                tags = shared_tags.setdefault(tuple(tags.items()), tags)
+            osm_id = int(element.get("id"))
+            if element.tag == "node":
+                el = Node(
+                    osm_id,
+                    float(element.get("lat")),
+                    float(element.get("lon")),
+                    tags or None,
+                )
+            elif element.tag == "way":
+                el = Way(osm_id, tags or None, nd)
+            else:
+                el = Relation(osm_id, tags or None, members or None)
+            yield el
             element.clear()
 
-    return elements
+
+def load_xml(f: BufferedIOBase | str) -> list[OsmElement]:
+    return list(iter_xml(f))
+
+
+_ELEMENT_CLASSES = {"node": Node, "way": Way, "relation": Relation}
+
+
+def _make_element(
+    data: dict, shared_tags: dict[tuple[tuple[str, str], ...], dict]
+) -> OsmElementT:
+    """Convert an element decoded from JSON into an OsmElement,
+    or return it as is if it has keys unknown to OsmElement classes.
+    """
+    if not isinstance(data, dict):
+        return data
+    cls = _ELEMENT_CLASSES.get(data.get("type"))
+    if (
+        cls is None
+        or "id" not in data
+        or any(key != "type" and key not in cls._keys for key in data)
+        or cls is Node
+        and ("lat" not in data or "lon" not in data)
+    ):
+        return data
+    tags = data.get("tags")
+    if tags is not None and len(tags) <= MAX_SHARED_TAGS_SIZE:
+        tags = shared_tags.setdefault(tuple(tags.items()), tags)
+    if cls is Node:
+        return Node(data["id"], data["lat"], data["lon"], tags)
+    el = cls(data["id"], tags)
+    for key in ("nodes", "members", "center"):
+        if data.get(key) is not None:
+            el[key] = data[key]
+    return el
+
+
+class _JsonStream:
+    """Reader of consecutive JSON values from a text or binary stream,
+    which keeps only a chunk of the stream in memory.
+    """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f: TextIO | BinaryIO) -> None:
+        self.f = f
+        self.utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size: int = JSON_CHUNK_SIZE) -> None:
+        data = self.f.read(size)
+        if isinstance(data, bytes):
+            text = self.utf8_decoder.decode(data, final=not data)
+        else:
+            text = data
+        self.eof = not data
+        self.buffer = self.buffer[self.pos :] + text  # noqa E203
+        self.pos = 0
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, or "" at the end."""
+        while True:
+            self.pos = self._WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]  # noqa E203
+            self._read()
+
+    def expect(self, chars: str) -> str:
+        """Consume the next non-whitespace character, one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of '{chars}'", self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def decode(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        # Reading size grows so that a long value is not decoded
+        # from its start too many times
+        read_size = JSON_CHUNK_SIZE
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(
+                    self.buffer, self.pos
+                )
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the buffer may be incomplete
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            self._read(read_size)
+            read_size *= 2
+
+    def iter_array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json(
+    f: TextIO | BinaryIO, remarks: list[str] | None = None
+) -> Iterator[OsmElementT]:
+    """Yield OSM elements one by one as they are decoded from a JSON
+    response of Overpass API or a JSON list of elements, without holding
+    the whole text or the whole decoded tree in memory.
+    :param remarks: if given, a "remark" of the response, by which
+        Overpass API reports runtime errors, is appended there instead
+        of being logged
+    """
+    stream = _JsonStream(f)
+    shared_tags = {}
+    if stream.peek() == "[":
+        for data in stream.iter_array():
+            yield _make_element(data, shared_tags)
+    else:
+        stream.expect("{")
+        separator = stream.expect("}") if stream.peek() == "}" else ","
+        while separator == ",":
+            key = stream.decode()
+            stream.expect(":")
+            if key == "elements":
+                for data in stream.iter_array():
+                    yield _make_element(data, shared_tags)
+            else:
+                value = stream.decode()
+                if key == "remark":
+                    if remarks is not None:
+                        remarks.append(value)
+                    else:
+                        logging.warning("Overpass API remark: %s", value)
+            separator = stream.expect(",}")
+    if stream.peek():
+        raise json.JSONDecodeError("Extra data", stream.buffer, stream.pos)
+
+
+def load_json(
+    f: TextIO | BinaryIO, remarks: list[str] | None = None
+) -> list[OsmElementT]:
+    return list(iter_json(f, remarks))
 
 
 _YAML_SPECIAL_CHARACTERS = "!&*{}[],#|>@`'\""
@@ -99,7 +269,10 @@ def dump_yaml(city: City, f: TextIO) -> None:
     routes = []
     for route in city:
         stations = OrderedDict(
-            [(sa.transfer or sa.id, sa.name) for sa in route.stopareas()]
+            [
+                (city.get_transfer(sa) or sa.id, sa.name)
+                for sa in route.stopareas()
+            ]
         )
         rte = {
             "type": route.mode,
@@ -118,18 +291,24 @@ def dump_yaml(city: City, f: TextIO) -> None:
                     s = st.stoparea
                     if s.id == s.station.id:
                         v_stops.append(
-                            "{} ({})".format(s.station.name, s.station.id)
+                            "{} ({})".format(
+                                s.station.name, unpack_id(s.station.id)
+                            )
                         )
                     else:
                         v_stops.append(
                             "{} ({}) in {} ({})".format(
-                                s.station.name, s.station.id, s.name, s.id
+                                s.station.name,
+                                unpack_id(s.station.id),
+                                s.name,
+                                unpack_id(s.id),
                             )
                         )
             else:
                 v_stops = [
                     "{} ({})".format(
-                        s.stoparea.station.name, s.stoparea.station.id
+                        s.stoparea.station.name,
+                        unpack_id(s.stoparea.station.id),
                     )
                     for s in variant
                 ]
@@ -138,7 +317,7 @@ def dump_yaml(city: City, f: TextIO) -> None:
         routes.append(rte)
     transfers = []
     for t in city.transfers:
-        v_stops = ["{} ({})".format(s.name, s.id) for s in t]
+        v_stops = ["{} ({})".format(s.name, unpack_id(s.id)) for s in t]
         transfers.append(sorted(v_stops))
 
     result = {
@@ -285,7 +464,7 @@ def write_recovery_data(
                         station_name = station.int_name
                     itin["stations"].append(
                         {
-                            "oms_id": station.id,
+                            "oms_id": unpack_id(station.id),
                             "name": station_name,
                             "center": station.center,
                         }
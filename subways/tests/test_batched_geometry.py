@@ -0,0 +1,198 @@
+import random
+import unittest
+from unittest import mock
+
+from subways import geom_utils, validation
+from subways.geom_utils import (
+    angle_between,
+    angles_along,
+    distance,
+    distance_many,
+    LocalProjection,
+    project_on_line,
+    project_points_on_line,
+)
+from subways.tests.sample_data_for_build_tracks import metro_samples
+from subways.tests.sample_data_for_outputs import (
+    metro_samples as output_samples,
+)
+from subways.tests.util import TestCase
+from subways.types import LonLat, RailT
+
+
+def make_line(rnd: random.Random, lon: float, lat: float) -> RailT:
+    """A random walk with steps from 10 to 1000 meters, which follows
+    a part of itself again, like Oslo Line 5, and has a degenerate segment.
+    """
+    line = [(lon, lat)]
+    for _ in range(300):
+        step = 10 ** rnd.uniform(-4, -2)
+        line.append(
+            (
+                line[-1][0] + rnd.uniform(-step, step),
+                line[-1][1] + rnd.uniform(-step, step),
+            )
+        )
+    line.append(line[-1])
+    line += line[100:150]
+    return line
+
+
+def make_points(rnd: random.Random, line: RailT) -> list[LonLat]:
+    points = [
+        (
+            v[0] + rnd.uniform(-0.005, 0.005),
+            v[1] + rnd.uniform(-0.005, 0.005),
+        )
+        for v in rnd.choices(line, k=300)
+    ]
+    points += rnd.choices(line, k=30)
+    return points
+
+
+CENTERS = ((10.75, 59.91), (-58.4, -34.6), (139.7, 35.7))
+
+
+class TestBatchedGeometry(unittest.TestCase):
+    """Batched functions of geom_utils should return the same as
+    the scalar ones, with and without NumPy.
+    """
+
+    def _run_with_and_without_numpy(self, test_func) -> None:
+        if geom_utils.np is not None:
+            with self.subTest(msg="NumPy"):
+                test_func()
+        with self.subTest(msg="no NumPy"):
+            with mock.patch.object(geom_utils, "np", None):
+                test_func()
+
+    def test_distance_many(self) -> None:
+        def check() -> None:
+            rnd = random.Random(0)
+            for lon, lat in CENTERS:
+                line = make_line(rnd, lon, lat)[:300]
+                points = make_points(rnd, line)[:300]
+                distances = distance_many(points, line)
+                self.assertEqual(len(line), len(distances))
+                for p1, p2, d in zip(points, line, distances):
+                    self.assertAlmostEqual(distance(p1, p2), d, places=6)
+            self.assertListEqual([], distance_many([], []))
+            with self.assertRaises(ValueError):
+                distance_many([(0.0, 0.0)], [])
+
+        self._run_with_and_without_numpy(check)
+
+    def test_project_points_on_line(self) -> None:
+        def check() -> None:
+            rnd = random.Random(0)
+            for lon, lat in CENTERS:
+                line = make_line(rnd, lon, lat)
+                points = make_points(rnd, line)
+                self.assertListEqual(
+                    [project_on_line(p, line) for p in points],
+                    project_points_on_line(points, line),
+                )
+                projection = LocalProjection.around((lon, lat))
+                line = [projection.to_xy(v) for v in line]
+                points = [projection.to_xy(p) for p in points]
+                self.assertListEqual(
+                    [project_on_line(p, line, planar=True) for p in points],
+                    project_points_on_line(points, line, planar=True),
+                )
+            point = CENTERS[0]
+            for line in ([], [point], [point, point]):
+                self.assertListEqual(
+                    [project_on_line(point, line)],
+                    project_points_on_line([point], line),
+                )
+
+        self._run_with_and_without_numpy(check)
+
+    def test_project_points_on_line__small_chunks(self) -> None:
+        rnd = random.Random(0)
+        line = make_line(rnd, *CENTERS[0])
+        points = make_points(rnd, line)
+        with mock.patch.object(geom_utils, "PROJECTION_CHUNK_ITEMS", 1000):
+            self.assertListEqual(
+                [project_on_line(p, line) for p in points],
+                project_points_on_line(points, line),
+            )
+
+    def test_angles_along(self) -> None:
+        def check() -> None:
+            rnd = random.Random(0)
+            for lon, lat in CENTERS:
+                points = make_line(rnd, lon, lat)
+                self.assertListEqual(
+                    [
+                        angle_between(points[i - 1], points[i], points[i + 1])
+                        for i in range(1, len(points) - 1)
+                    ],
+                    angles_along(points),
+                )
+            straight = [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0), (1.0, 0.0)]
+            self.assertListEqual([180, 0], angles_along(straight))
+            self.assertListEqual([], angles_along(straight[:2]))
+
+        self._run_with_and_without_numpy(check)
+
+
+class TestRouteBatchedGeometry(TestCase):
+    """Routes built with batched geometry functions should be the same
+    as built with the scalar ones.
+    """
+
+    @staticmethod
+    def _get_routes_data(cities: list) -> list:
+        return [
+            (
+                route.id,
+                route.first_stop_on_rails_index,
+                route.last_stop_on_rails_index,
+                [
+                    (rs.stop, rs.distance, rs.positions_on_rails)
+                    for rs in route
+                ],
+            )
+            for city in cities
+            for route_master in city
+            for route in route_master
+        ]
+
+    def test_batched_geometry(self) -> None:
+        for sample in metro_samples + output_samples:
+            with self.subTest(msg=sample["name"]):
+                cities, _ = self.prepare_cities(sample)
+                batched_cities, _ = self.prepare_cities(
+                    sample, batched_geometry=True
+                )
+                self._assert_cities_equal(cities, batched_cities)
+
+    def test_batched_geometry__jobs(self) -> None:
+        """The option is applied in worker processes."""
+        sample = output_samples[0]
+        cities, _ = self.prepare_cities(sample, batched_geometry=True)
+        with mock.patch(
+            "subways.validation.ProcessPoolExecutor",
+            wraps=validation.ProcessPoolExecutor,
+        ) as executor_mock:
+            batched_cities, _ = self.prepare_cities(
+                sample, validation_jobs=2, batched_geometry=True
+            )
+        self.assertEqual((True,), executor_mock.call_args.kwargs["initargs"])
+        self._assert_cities_equal(cities, batched_cities)
+
+    def _assert_cities_equal(self, cities: list, batched_cities: list) -> None:
+        for city, batched_city in zip(cities, batched_cities, strict=True):
+            self.assertListEqual(
+                sorted(city.errors + city.warnings + city.notices),
+                sorted(
+                    batched_city.errors
+                    + batched_city.warnings
+                    + batched_city.notices
+                ),
+            )
+        self.assertListEqual(
+            self._get_routes_data(cities),
+            self._get_routes_data(batched_cities),
+        )
@@ -1,4 +1,9 @@
+from subways.geom_utils import distance, distance_on_line
+from subways.structure.route import Route
 from subways.tests.sample_data_for_build_tracks import metro_samples
+from subways.tests.sample_data_for_outputs import (
+    metro_samples as output_samples,
+)
 from subways.tests.util import JsonLikeComparisonMixin, TestCase
 
 
@@ -110,3 +115,42 @@ class TestOneRouteTracks(JsonLikeComparisonMixin, TestCase):
             sample["cities_info"][0]["name"] = sample_name
             with self.subTest(msg=sample_name):
                 self._test_stop_positions_on_rails_for_network(sample)
+
+
+class TestStopDistances(TestCase):
+    """Stop distances calculated with cumulative lengths of tracks should
+    be the same as with walking along tracks with distance_on_line().
+    """
+
+    @staticmethod
+    def _calculate_distances_on_line(route: Route) -> list[int]:
+        distances = [0]
+        vertex = 0
+        for i in range(1, len(route.stops)):
+            p1, p2 = route.stops[i - 1].stop, route.stops[i].stop
+            direct = distance(p1, p2)
+            d_line = None
+            if (
+                route.first_stop_on_rails_index
+                <= i
+                <= route.last_stop_on_rails_index
+            ):
+                d_line = distance_on_line(p1, p2, route.tracks, vertex)
+            if d_line and direct - 10 <= d_line[0] <= direct * 2:
+                vertex = d_line[1]
+                distances.append(distances[-1] + round(d_line[0]))
+            else:
+                distances.append(distances[-1] + round(direct))
+        return distances
+
+    def test_stop_distances(self) -> None:
+        for sample in metro_samples + output_samples:
+            with self.subTest(msg=sample["name"]):
+                cities, transfers = self.prepare_cities(sample)
+                for city in cities:
+                    for route_master in city:
+                        for route in route_master:
+                            self.assertListEqual(
+                                self._calculate_distances_on_line(route),
+                                [rs.distance for rs in route],
+                            )
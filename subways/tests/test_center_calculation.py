@@ -1,11 +1,31 @@
 import io
-from unittest import TestCase
+from unittest import mock, TestCase
 
-from subways.validation import calculate_centers
-from subways.subway_io import load_xml
+from subways import validation
+from subways.validation import (
+    calculate_centers,
+    localize_and_add_to_cities,
+)
+from subways.subway_io import iter_xml, load_xml
 from subways.tests.sample_data_for_center_calculation import metro_samples
 
 
+class _CityStub:
+    """Accepts all elements that have got a center by the moment
+    they are added.
+    """
+
+    def __init__(self) -> None:
+        self.bbox = [-90.0, -180.0, 90.0, 180.0]
+        self.added: list[tuple[str, int, dict | None]] = []
+
+    def contains(self, el: dict) -> bool:
+        return el["type"] == "node" or "center" in el
+
+    def add(self, el: dict) -> None:
+        self.added.append((el["type"], el["id"], el.get("center")))
+
+
 class TestCenterCalculation(TestCase):
     """Test center calculation. Test data [should] contain among others
     the following edge cases:
@@ -52,3 +72,83 @@ class TestCenterCalculation(TestCase):
                 self.assertAlmostEqual(
                     calculated_center["lon"], correct_center["lon"], places=10
                 )
+
+    def test_localize_and_add_to_cities(self) -> None:
+        for sample in metro_samples:
+            with self.subTest(msg=sample["name"]):
+                xml = sample["xml"].encode()
+                expected_elements = load_xml(io.BytesIO(xml))
+                calculate_centers(expected_elements)
+                expected_city = _CityStub()
+                for el in expected_elements:
+                    if expected_city.contains(el):
+                        expected_city.add(el)
+
+                city = _CityStub()
+                elements = []
+                element_count = localize_and_add_to_cities(
+                    iter_xml(io.BytesIO(xml)), [city], elements=elements
+                )
+
+                self.assertEqual(len(expected_elements), element_count)
+                self.assertListEqual(expected_elements, elements)
+                self.assertListEqual(expected_city.added, city.added)
+
+    def test_calculate_centers__deep_nesting(self) -> None:
+        """Each relation of a long chain of nested relations, where
+        a parent precedes its child, and of a membership cycle should get
+        the center calculated once.
+        """
+        depth = 2000
+        elements = [
+            {"type": "node", "id": 1, "lat": 10.0, "lon": 20.0},
+            {"type": "node", "id": 2, "lat": 30.0, "lon": 40.0},
+        ]
+        elements += [
+            {
+                "type": "relation",
+                "id": i,
+                "members": [{"type": "relation", "ref": i + 1, "role": ""}],
+            }
+            for i in range(1, depth)
+        ]
+        elements.append(
+            {
+                "type": "relation",
+                "id": depth,
+                "members": [{"type": "node", "ref": 1, "role": ""}],
+            }
+        )
+        # Cycle: relation -1 contains -2 and node 2; -2 contains -1
+        elements += [
+            {
+                "type": "relation",
+                "id": -1,
+                "members": [
+                    {"type": "relation", "ref": -2, "role": ""},
+                    {"type": "node", "ref": 2, "role": ""},
+                ],
+            },
+            {
+                "type": "relation",
+                "id": -2,
+                "members": [{"type": "relation", "ref": -1, "role": ""}],
+            },
+        ]
+
+        with mock.patch.object(
+            validation,
+            "get_relation_center",
+            wraps=validation.get_relation_center,
+        ) as get_relation_center:
+            calculate_centers(elements)
+
+        relations = [el for el in elements if el["type"] == "relation"]
+        # Once while adding and once in the topological pass
+        self.assertEqual(
+            2 * len(relations) - 1, get_relation_center.call_count
+        )
+        for rel in relations[:depth]:
+            self.assertDictEqual({"lat": 10.0, "lon": 20.0}, rel["center"])
+        for rel in relations[depth:]:
+            self.assertDictEqual({"lat": 30.0, "lon": 40.0}, rel["center"])
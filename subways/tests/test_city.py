@@ -0,0 +1,93 @@
+from subways.osm_element import pack_id, unpack_id
+from subways.structure.city import City, ELEMENT_KINDS
+from subways.tests.util import TestCase
+
+
+class TestElementKinds(TestCase):
+    def _make_city(self) -> City:
+        return City(self.CITY_TEMPLATE | {"id": 1, "num_stations": 1})
+
+    def test_add(self) -> None:
+        elements = [
+            {"type": "node", "id": 1, "lat": 0.0, "lon": 0.0},
+            {
+                "type": "node",
+                "id": 2,
+                "lat": 0.0,
+                "lon": 0.0,
+                "tags": {"railway": "station", "station": "subway"},
+            },
+            {
+                "type": "node",
+                "id": 3,
+                "lat": 0.0,
+                "lon": 0.0,
+                "tags": {"railway": "subway_entrance"},
+            },
+            {
+                "type": "node",
+                "id": 4,
+                "lat": 0.0,
+                "lon": 0.0,
+                "tags": {"railway": "station", "station": "train"},
+            },
+            {
+                "type": "relation",
+                "id": 5,
+                "tags": {"type": "route", "route": "subway", "ref": "1"},
+                "members": [{"type": "node", "ref": 2, "role": ""}],
+            },
+            {
+                "type": "relation",
+                "id": 6,
+                "tags": {"type": "route_master", "route_master": "subway"},
+                "members": [{"type": "relation", "ref": 5, "role": ""}],
+            },
+            {
+                "type": "relation",
+                "id": 7,
+                "tags": {
+                    "type": "public_transport",
+                    "public_transport": "stop_area",
+                },
+                "members": [{"type": "node", "ref": 2, "role": ""}],
+            },
+            {
+                "type": "relation",
+                "id": 8,
+                "tags": {
+                    "type": "public_transport",
+                    "public_transport": "stop_area_group",
+                },
+                "members": [{"type": "relation", "ref": 7, "role": ""}],
+            },
+            # Not added: a relation without members
+            {
+                "type": "relation",
+                "id": 9,
+                "tags": {"type": "route", "route": "subway", "ref": "2"},
+            },
+        ]
+        city = self._make_city()
+        for el in elements:
+            city.add(el)
+
+        self.assertEqual(8, len(city.elements))
+        self.assertDictEqual(
+            {
+                "stations": ["n2"],
+                "routes": ["r5"],
+                "route_masters": ["r6"],
+                "stop_areas": ["r7"],
+                "stop_area_groups": ["r8"],
+                "entrances": ["n3"],
+            },
+            {
+                kind: list(map(unpack_id, city.elements_by_kind[kind]))
+                for kind in ELEMENT_KINDS
+            },
+        )
+        self.assertIs(elements[5], city.masters[pack_id("relation", 5)])
+        self.assertListEqual(
+            [elements[6]], city.stop_areas[pack_id("node", 2)]
+        )
@@ -0,0 +1,143 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+import unittest
+from unittest import mock, TestCase
+
+from subways import element_cache
+from subways.element_cache import (
+    ElementCache,
+    is_element_cache,
+    write_element_cache,
+)
+from subways.structure.city import City
+from subways.subway_io import load_xml
+from subways.tests.sample_data_for_center_calculation import (
+    metro_samples as center_samples,
+)
+from subways.tests.sample_data_for_outputs import (
+    metro_samples as output_samples,
+)
+from subways.tests.util import TestCase as SubwaysTestCase
+from subways.validation import add_osm_elements_to_cities, calculate_centers
+
+
+class TestElementCache(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "elements.bin")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def _load_sample(sample: dict, calculate: bool = True) -> list[dict]:
+        if "xml" in sample:
+            xml_file = io.BytesIO(sample["xml"].encode())
+        else:
+            xml_file = Path(__file__).resolve().parent / sample["xml_file"]
+        elements = load_xml(xml_file)
+        if calculate:
+            calculate_centers(elements)
+        return elements
+
+    def test__element_cache__round_trip(self) -> None:
+        for sample in center_samples + output_samples:
+            with self.subTest(msg=sample["name"]):
+                elements = self._load_sample(sample)
+                write_element_cache(self.cache_path, elements)
+                self.assertTrue(is_element_cache(self.cache_path))
+
+                cache = ElementCache(self.cache_path)
+                self.assertEqual(len(elements), len(cache))
+                self.assertListEqual(elements, [dict(el) for el in cache])
+                for el, cached_el in zip(elements, cache):
+                    for key in ("tags", "nodes", "members", "center"):
+                        self.assertEqual(key in el, key in cached_el)
+
+    def test__element_cache__writable_center(self) -> None:
+        elements = load_xml(io.BytesIO(center_samples[0]["xml"].encode()))
+        write_element_cache(self.cache_path, elements)
+
+        cache = ElementCache(self.cache_path)
+        calculate_centers(cache)
+        calculate_centers(elements)
+        self.assertListEqual(elements, [dict(el) for el in cache])
+
+    def test__element_cache__abstract_views(self) -> None:
+        write_element_cache(self.cache_path, [])
+        cache = ElementCache(self.cache_path)
+        for view_class in (
+            element_cache._ElementView,
+            element_cache._CenteredElementView,
+        ):
+            with self.subTest(msg=view_class.__name__):
+                with self.assertRaises(TypeError):
+                    view_class(cache, 0)
+
+    def _test__element_cache__calculate_centers(self) -> None:
+        for sample in center_samples + output_samples:
+            with self.subTest(msg=sample["name"]):
+                elements = self._load_sample(sample, calculate=False)
+                write_element_cache(self.cache_path, elements)
+                cache = ElementCache(self.cache_path)
+                cache.calculate_centers()
+                calculate_centers(elements)
+                # Centers should be exactly equal, not just almost equal
+                self.assertListEqual(elements, [dict(el) for el in cache])
+
+    @unittest.skipIf(element_cache.np is None, "NumPy is not installed")
+    def test__element_cache__calculate_centers__numpy(self) -> None:
+        self._test__element_cache__calculate_centers()
+
+    def test__element_cache__calculate_centers__no_numpy(self) -> None:
+        with mock.patch.object(element_cache, "np", None):
+            self._test__element_cache__calculate_centers()
+
+    def _make_cities(self) -> list[City]:
+        bboxes = [
+            "-179, -89, 179, 89",  # too large to be put into the grid
+            "0, 0, 0.01, 0.01",
+            "-0.005, -0.005, 0.005, 0.005",
+            "",  # no bbox
+        ]
+        return [
+            City(
+                SubwaysTestCase.CITY_TEMPLATE
+                | {
+                    "id": i,
+                    "name": f"City {i}",
+                    "bbox": bbox,
+                    "num_stations": 1,
+                }
+            )
+            for i, bbox in enumerate(bboxes, start=1)
+        ]
+
+    @unittest.skipIf(element_cache.np is None, "NumPy is not installed")
+    def test__element_cache__add_to_cities(self) -> None:
+        for sample in center_samples + output_samples:
+            with self.subTest(msg=sample["name"]):
+                elements = self._load_sample(sample)
+                write_element_cache(self.cache_path, elements)
+                cache = ElementCache(self.cache_path)
+
+                expected_cities = self._make_cities()
+                expected_groups = []
+                add_osm_elements_to_cities(
+                    cache, expected_cities, stop_area_groups=expected_groups
+                )
+                cities = self._make_cities()
+                stop_area_groups = []
+                cache.add_to_cities(cities, True, stop_area_groups)
+
+                self.assertListEqual(expected_groups, stop_area_groups)
+                for city, expected_city in zip(cities, expected_cities):
+                    self.assertListEqual(
+                        list(expected_city.elements.items()),
+                        list(city.elements.items()),
+                    )
+                # Cities share views of the same elements
+                for el_id, el in cities[1].elements.items():
+                    self.assertIs(el, cities[0].elements[el_id])
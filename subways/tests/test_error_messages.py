@@ -1,5 +1,7 @@
 import itertools
 
+from subways.osm_element import pack_id
+from subways.structure.city import ElidList, format_elid_list
 from subways.tests.sample_data_for_error_messages import (
     metro_samples as metro_samples_error,
 )
@@ -34,3 +36,52 @@ class TestValidationMessages(TestCase):
                 continue
             with self.subTest(msg=sample["name"]):
                 self._test_validation_messages_for_network(sample)
+
+    def test_message_counts(self) -> None:
+        for sample in metro_samples_error:
+            if "errors" not in sample:
+                continue
+            with self.subTest(msg=sample["name"]):
+                cities, transfers = self.prepare_cities(sample)
+                city = cities[0]
+                counts = city.get_message_counts()
+                for err_level in ("errors", "warnings", "notices"):
+                    self.assertEqual(
+                        len(sample[err_level]),
+                        sum(counts[err_level].values()),
+                    )
+
+
+class TestDeferredMessages(TestCase):
+    def test_rendering(self) -> None:
+        city = self.city_class(
+            self.CITY_TEMPLATE | {"id": 1, "num_stations": 1}
+        )
+        el = {"type": "node", "id": 1, "tags": {"ref": "A"}}
+        ids = {pack_id("node", i) for i in range(25)}
+        city.warn("Plain {message}", el)
+        city.warn("{} unused stations: {}", None, len(ids), ElidList(ids))
+        ids.clear()  # The message keeps its own copy of ids
+        city.error("Hole near node {}", el, "n2")
+        city.notice("Hole near node {}", None, "n3")
+        self.assertListEqual(
+            [
+                'Plain {message} (node 1, "A")',
+                "25 unused stations: "
+                + format_elid_list([pack_id("node", i) for i in range(25)]),
+            ],
+            city.warnings,
+        )
+        self.assertListEqual(['Hole near node n2 (node 1, "A")'], city.errors)
+        self.assertListEqual(["Hole near node n3"], city.notices)
+        self.assertDictEqual(
+            {
+                "errors": {"Hole near node {}": 1},
+                "warnings": {
+                    "Plain {message}": 1,
+                    "{} unused stations: {}": 1,
+                },
+                "notices": {"Hole near node {}": 1},
+            },
+            city.get_message_counts(),
+        )
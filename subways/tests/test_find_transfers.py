@@ -1,7 +1,16 @@
 from copy import deepcopy
+from pathlib import Path
 
+from subways.osm_element import unpack_id
+from subways.structure.city import City, find_transfers, is_stop_area_group
+from subways.subway_io import load_xml
 from subways.tests.sample_data_for_outputs import metro_samples
 from subways.tests.util import TestCase, JsonLikeComparisonMixin
+from subways.validation import (
+    add_osm_elements_to_cities,
+    calculate_centers,
+    validate_cities,
+)
 
 
 class TestTransfers(JsonLikeComparisonMixin, TestCase):
@@ -13,7 +22,7 @@ class TestTransfers(JsonLikeComparisonMixin, TestCase):
 
         self.assertSequenceAlmostEqualIgnoreOrder(
             expected_transfers,
-            transfers,
+            [set(map(unpack_id, transfer)) for transfer in transfers],
             cmp=lambda transfer_as_set: sorted(transfer_as_set),
         )
 
@@ -28,3 +37,30 @@ class TestTransfers(JsonLikeComparisonMixin, TestCase):
         for sample in sample1, sample2:
             with self.subTest(msg=sample["name"]):
                 self._test__find_transfers__for_sample(sample)
+
+    def test__find_transfers__all_elements(self) -> None:
+        """Stop_area_groups collected while adding elements to cities
+        give the same transfers as the list of all elements.
+        """
+        sample = metro_samples[0]
+        elements = load_xml(
+            Path(__file__).resolve().parent / sample["xml_file"]
+        )
+        calculate_centers(elements)
+        cities = [
+            City(self.CITY_TEMPLATE | city_info)
+            for city_info in sample["cities_info"]
+        ]
+        stop_area_groups = []
+        add_osm_elements_to_cities(
+            elements, cities, stop_area_groups=stop_area_groups
+        )
+        validate_cities(cities)
+        self.assertListEqual(
+            [el for el in elements if is_stop_area_group(el)],
+            stop_area_groups,
+        )
+        self.assertListEqual(
+            find_transfers(elements, cities),
+            find_transfers(stop_area_groups, cities),
+        )
@@ -0,0 +1,218 @@
+import io
+import json
+import pickle
+from array import array
+from unittest import mock, TestCase
+
+from subways import subway_io
+
+from subways.osm_element import (
+    el_center,
+    el_id,
+    el_packed_id,
+    Node,
+    pack_id,
+    Relation,
+    unpack_id,
+    Way,
+)
+from subways.structure.stop_area import StopArea
+from subways.subway_io import iter_json, load_json, load_xml
+
+
+class TestPackedIds(TestCase):
+    def test_pack_and_unpack(self) -> None:
+        for el_type in ("node", "way", "relation"):
+            for osm_id in (0, 1, 123, 2**40 + 5, -1, -12345):
+                with self.subTest(msg=f"{el_type} {osm_id}"):
+                    el = {"type": el_type, "id": osm_id}
+                    packed_id = pack_id(el_type, osm_id)
+                    self.assertEqual(packed_id, el_packed_id(el))
+                    self.assertEqual(el_id(el), unpack_id(packed_id))
+
+    def test_packed_ids_differ_by_type(self) -> None:
+        self.assertEqual(
+            3, len({pack_id(t, 1) for t in ("node", "way", "relation")})
+        )
+
+    def test_member_packed_id(self) -> None:
+        member = {"type": "way", "ref": 42, "role": ""}
+        self.assertEqual(pack_id("way", 42), el_packed_id(member))
+        self.assertIsNone(el_packed_id(None))
+
+
+class TestOsmElement(TestCase):
+    def _make_elements(self) -> list:
+        return [
+            Node(1, 55.7, 37.6, {"railway": "station"}),
+            Node(2, 55.8, 37.7),
+            Way(3, {"railway": "subway"}, [1, 2]),
+            Relation(
+                4,
+                {"type": "route", "route": "subway"},
+                [{"type": "way", "ref": 3, "role": ""}],
+            ),
+        ]
+
+    def test_same_as_dicts(self) -> None:
+        dicts = [
+            {
+                "type": "node",
+                "id": 1,
+                "lat": 55.7,
+                "lon": 37.6,
+                "tags": {"railway": "station"},
+            },
+            {"type": "node", "id": 2, "lat": 55.8, "lon": 37.7},
+            {
+                "type": "way",
+                "id": 3,
+                "tags": {"railway": "subway"},
+                "nodes": [1, 2],
+            },
+            {
+                "type": "relation",
+                "id": 4,
+                "tags": {"type": "route", "route": "subway"},
+                "members": [{"type": "way", "ref": 3, "role": ""}],
+            },
+        ]
+        elements = self._make_elements()
+        self.assertListEqual(dicts, elements)
+        for el, el_dict in zip(elements, dicts):
+            self.assertListEqual(list(el_dict), list(el))
+            self.assertDictEqual(el_dict, el.to_dict())
+            self.assertEqual(el_id(el_dict), el_id(el))
+            self.assertEqual(el_center(el_dict), el_center(el))
+            self.assertEqual(StopArea.is_track(el_dict), StopArea.is_track(el))
+            for key in ("tags", "nodes", "members", "center", "lat"):
+                self.assertEqual(key in el_dict, key in el)
+            for key in ("tags", "members", "center", "lat"):
+                self.assertEqual(el_dict.get(key), el.get(key))
+
+        self.assertNotIn("tags", elements[1])
+        with self.assertRaises(KeyError):
+            elements[1]["tags"]
+
+    def test_center(self) -> None:
+        way = self._make_elements()[2]
+        self.assertIsNone(el_center(way))
+        way["center"] = {"lon": 37.65, "lat": 55.75}
+        self.assertEqual((37.65, 55.75), el_center(way))
+        self.assertListEqual(
+            ["type", "id", "tags", "nodes", "center"], list(way)
+        )
+        with self.assertRaises(KeyError):
+            way["lat"] = 55.75
+
+    def test_pickle(self) -> None:
+        elements = self._make_elements()
+        elements[2]["center"] = {"lon": 37.65, "lat": 55.75}
+        self.assertListEqual(elements, pickle.loads(pickle.dumps(elements)))
+
+    def test_load_xml(self) -> None:
+        xml = b"""<?xml version='1.0' encoding='UTF-8'?>
+<osm version='0.6'>
+  <node id='1' lat='55.7' lon='37.6' />
+  <node id='2' lat='55.8' lon='37.7'>
+    <tag k='railway' v='subway_entrance' />
+  </node>
+  <node id='3' lat='55.9' lon='37.8'>
+    <tag k='railway' v='subway_entrance' />
+  </node>
+  <way id='4'>
+    <nd ref='1' />
+    <nd ref='2' />
+  </way>
+</osm>
+"""
+        elements = load_xml(io.BytesIO(xml))
+        self.assertListEqual(
+            [Node, Node, Node, Way], [type(el) for el in elements]
+        )
+        self.assertIsInstance(elements[3]["nodes"], array)
+        self.assertListEqual([1, 2], list(elements[3]["nodes"]))
+        # Small tag sets are shared
+        self.assertIs(elements[1]["tags"], elements[2]["tags"])
+
+
+class TestIterJson(TestCase):
+    RESPONSE = {
+        "version": 0.6,
+        "osm3s": {"copyright": "© OpenStreetMap contributors"},
+        "elements": [
+            {
+                "type": "node",
+                "id": 1,
+                "lat": 55.7,
+                "lon": 37.6,
+                "tags": {"railway": "station", "name": "Охотный Ряд"},
+            },
+            {"type": "node", "id": 2, "lat": 55.8, "lon": 37.7},
+            {
+                "type": "way",
+                "id": 3,
+                "center": {"lat": 55.75, "lon": 37.65},
+                "nodes": [1, 2],
+                "tags": {"railway": "subway"},
+            },
+            {
+                "type": "relation",
+                "id": 4,
+                "members": [{"type": "way", "ref": 3, "role": ""}],
+                "tags": {"type": "route", "route": "subway"},
+            },
+            # Unknown to OsmElement classes
+            {"type": "area", "id": 5},
+        ],
+        "remark": "runtime error: Query timed out",
+    }
+
+    def test_load_json(self) -> None:
+        text = json.dumps(self.RESPONSE, ensure_ascii=False, indent=1)
+        for chunk_size in (1, 7, subway_io.JSON_CHUNK_SIZE):
+            for f in (io.StringIO(text), io.BytesIO(text.encode())):
+                with (
+                    self.subTest(msg=f"{chunk_size} {type(f).__name__}"),
+                    mock.patch.object(
+                        subway_io, "JSON_CHUNK_SIZE", chunk_size
+                    ),
+                    self.assertLogs(level="WARNING"),
+                ):
+                    elements = load_json(f)
+                    self.assertListEqual(self.RESPONSE["elements"], elements)
+                    self.assertListEqual(
+                        [Node, Node, Way, Relation, dict],
+                        [type(el) for el in elements],
+                    )
+
+    def test_remarks(self) -> None:
+        text = json.dumps(self.RESPONSE)
+        remarks = []
+        with self.assertNoLogs(level="WARNING"):
+            elements = load_json(io.StringIO(text), remarks)
+        self.assertListEqual(self.RESPONSE["elements"], elements)
+        self.assertListEqual([self.RESPONSE["remark"]], remarks)
+
+    def test_list_of_elements(self) -> None:
+        elements = self.RESPONSE["elements"]
+        f = io.StringIO(json.dumps(elements))
+        self.assertListEqual(elements, load_json(f))
+        for text in ("[]", '{"elements": []}', " {} "):
+            self.assertListEqual([], load_json(io.StringIO(text)))
+
+    def test_lazy_decoding(self) -> None:
+        """Elements are yielded before the rest of the stream is read."""
+        elements = self.RESPONSE["elements"][:2]
+        text = json.dumps({"elements": elements}) + "garbage"
+        with mock.patch.object(subway_io, "JSON_CHUNK_SIZE", 10):
+            iterator = iter_json(io.StringIO(text))
+            self.assertListEqual(elements, [next(iterator), next(iterator)])
+            with self.assertRaises(json.JSONDecodeError):
+                next(iterator)
+
+    def test_truncated(self) -> None:
+        text = json.dumps(self.RESPONSE)
+        for length in (len(text) // 2, text.index("]")):
+            with self.assertRaises(json.JSONDecodeError):
+                load_json(io.StringIO(text[:length]))
@@ -0,0 +1,202 @@
+import io
+import os
+import struct
+import tempfile
+import zlib
+from collections.abc import Sequence
+from unittest import TestCase
+
+from subways.osm_element import Node, Relation, Way
+from subways.osm_pbf import load_pbf
+from subways.subway_io import load_xml
+from subways.tests.sample_data_for_center_calculation import metro_samples
+from subways.types import OsmElementT
+
+
+def _varint(n: int) -> bytes:
+    n &= (1 << 64) - 1
+    result = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            result.append(b | 0x80)
+        else:
+            result.append(b)
+            return bytes(result)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _field(number: int, value: int | bytes) -> bytes:
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _packed(values: list[int]) -> bytes:
+    return b"".join(_varint(v) for v in values)
+
+
+def _deltas(values: Sequence[int]) -> list[int]:
+    return [_zigzag(v - prev) for v, prev in zip(values, [0, *values])]
+
+
+class _PbfWriter:
+    """Minimal PBF encoder to prepare test data: dense nodes,
+    ways and relations in one zlib-compressed block.
+    """
+
+    def __init__(self) -> None:
+        self.strings = [""]
+
+    def sid(self, s: str) -> int:
+        if s not in self.strings:
+            self.strings.append(s)
+        return self.strings.index(s)
+
+    def tags(self, el: OsmElementT) -> bytes:
+        tags = el.get("tags", {})
+        return _field(2, _packed([self.sid(k) for k in tags])) + _field(
+            3, _packed([self.sid(v) for v in tags.values()])
+        )
+
+    def dense(self, nodes: list[OsmElementT]) -> bytes:
+        keys_vals = []
+        for n in nodes:
+            for k, v in n.get("tags", {}).items():
+                keys_vals.extend((self.sid(k), self.sid(v)))
+            keys_vals.append(0)
+        return (
+            _field(1, _packed(_deltas([n["id"] for n in nodes])))
+            + _field(
+                8, _packed(_deltas([round(n["lat"] * 1e7) for n in nodes]))
+            )
+            + _field(
+                9, _packed(_deltas([round(n["lon"] * 1e7) for n in nodes]))
+            )
+            + _field(10, _packed(keys_vals))
+        )
+
+    def way(self, way: OsmElementT) -> bytes:
+        return (
+            _field(1, way["id"])
+            + self.tags(way)
+            + _field(8, _packed(_deltas(way.get("nodes", []))))
+        )
+
+    def relation(self, rel: OsmElementT) -> bytes:
+        members = rel.get("members", [])
+        types = ("node", "way", "relation")
+        return (
+            _field(1, rel["id"])
+            + self.tags(rel)
+            + _field(8, _packed([self.sid(m["role"]) for m in members]))
+            + _field(9, _packed(_deltas([m["ref"] for m in members])))
+            + _field(10, _packed([types.index(m["type"]) for m in members]))
+        )
+
+    @staticmethod
+    def blob(blob_type: str, data: bytes) -> bytes:
+        blob = _field(2, len(data)) + _field(3, zlib.compress(data))
+        header = _field(1, blob_type.encode()) + _field(3, len(blob))
+        return struct.pack("!I", len(header)) + header + blob
+
+    def write(self, elements: list[OsmElementT]) -> bytes:
+        nodes, ways, relations = (
+            [el for el in elements if el["type"] == t]
+            for t in ("node", "way", "relation")
+        )
+        groups = (
+            _field(2, _field(2, self.dense(nodes)))
+            + _field(2, b"".join(_field(3, self.way(w)) for w in ways))
+            + _field(
+                2, b"".join(_field(4, self.relation(r)) for r in relations)
+            )
+        )
+        string_table = b"".join(_field(1, s.encode()) for s in self.strings)
+        block = _field(1, string_table) + groups
+        header = _field(4, b"OsmSchema-V0.6") + _field(4, b"DenseNodes")
+        return self.blob("OSMHeader", header) + self.blob("OSMData", block)
+
+
+class TestOsmPbf(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _write_pbf(self, elements: list[OsmElementT]) -> str:
+        path = os.path.join(self.tmp_dir.name, "test.osm.pbf")
+        with open(path, "wb") as f:
+            f.write(_PbfWriter().write(elements))
+        return path
+
+    def test__load_pbf__same_as_xml(self) -> None:
+        for sample in metro_samples:
+            with self.subTest(msg=sample["name"]):
+                xml_elements = load_xml(io.BytesIO(sample["xml"].encode()))
+                pbf_path = self._write_pbf(xml_elements)
+                pbf_elements = load_pbf(pbf_path, filter_tags=False)
+                self.assertListEqual(xml_elements, pbf_elements)
+                self.assertListEqual(
+                    [type(el) for el in xml_elements],
+                    [type(el) for el in pbf_elements],
+                )
+
+    def test__load_pbf__tag_filter(self) -> None:
+        elements = [
+            {"type": "node", "id": 1, "lat": 1.0, "lon": 2.0},
+            {"type": "node", "id": 2, "lat": 1.1, "lon": 2.1},
+            {"type": "node", "id": 3, "lat": 1.2, "lon": 2.2},
+            {
+                "type": "node",
+                "id": 4,
+                "lat": 1.3,
+                "lon": 2.3,
+                "tags": {"railway": "subway_entrance"},
+            },
+            {
+                "type": "node",
+                "id": 5,
+                "lat": 1.4,
+                "lon": 2.4,
+                "tags": {"railway": "level_crossing"},
+            },
+            {"type": "way", "id": 1, "nodes": [1, 2]},
+            {"type": "way", "id": 2, "nodes": [2, 3]},
+            # A member relation not matching the filter goes first
+            # in the file, and keeps its place in the result
+            {
+                "type": "relation",
+                "id": 2,
+                "tags": {"type": "multipolygon"},
+                "members": [{"type": "way", "ref": 2, "role": "outer"}],
+            },
+            {
+                "type": "relation",
+                "id": 1,
+                "tags": {"type": "route", "route": "subway"},
+                "members": [
+                    {"type": "way", "ref": 1, "role": ""},
+                    {"type": "relation", "ref": 2, "role": ""},
+                ],
+            },
+            {
+                "type": "relation",
+                "id": 3,
+                "tags": {"type": "route", "route": "bus"},
+                "members": [{"type": "way", "ref": 2, "role": ""}],
+            },
+        ]
+        pbf_path = self._write_pbf(elements)
+        loaded = load_pbf(pbf_path)
+        loaded_ids = [el["type"][0] + str(el["id"]) for el in loaded]
+        self.assertListEqual(["n1", "n2", "n4", "w1", "r2", "r1"], loaded_ids)
+        self.assertListEqual(
+            [Node, Node, Node, Way, Relation, Relation],
+            [type(el) for el in loaded],
+        )
@@ -1,6 +1,24 @@
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase, mock
 
-from subways.overpass import compose_overpass_request, overpass_request
+from subways import overpass
+from subways.overpass import (
+    compose_overpass_request,
+    get_overpass_slots,
+    merge_bboxes,
+    multi_overpass,
+    overpass_request,
+)
+from subways.overpass_cache import OverpassCache
 
 
 class TestOverpassQuery(TestCase):
@@ -150,14 +168,257 @@ class TestOverpassQuery(TestCase):
             "%28._%3B%3E%3E%3B%29%3Bout%20body%20center%20qt%3B"
         )
 
-        with mock.patch("subways.overpass.json.load") as load_mock:
-            load_mock.return_value = {"elements": []}
+        with mock.patch(
+            "subways.overpass.urllib.request.urlopen"
+        ) as urlopen_mock:
+            urlopen_mock.return_value.getcode.return_value = 200
+            urlopen_mock.return_value.read.side_effect = [
+                b'{"elements": []}',
+                b"",
+            ]
 
-            with mock.patch(
-                "subways.overpass.urllib.request.urlopen"
-            ) as urlopen_mock:
-                urlopen_mock.return_value.getcode.return_value = 200
-
-                overpass_request(overground, overpass_api, bboxes)
+            self.assertListEqual(
+                [], overpass_request(overground, overpass_api, bboxes)
+            )
 
         urlopen_mock.assert_called_once_with(expected_url, timeout=1000)
+
+
+class TestMergeBboxes(TestCase):
+    def test_merge_bboxes(self) -> None:
+        cases = [
+            ([], []),
+            ([[0, 0, 1, 1]], [[0, 0, 1, 1]]),
+            # Separate bboxes
+            ([[0, 0, 1, 1], [2, 0, 3, 1]], [[0, 0, 1, 1], [2, 0, 3, 1]]),
+            # Nested and equal bboxes
+            ([[0, 0, 3, 3], [1, 1, 2, 2], [0, 0, 3, 3]], [[0, 0, 3, 3]]),
+            # Adjacent bboxes
+            ([[0, 0, 1, 1], [1, 0, 2, 1]], [[0, 0, 2, 1]]),
+            # Overlapping bboxes with little extra area
+            ([[0, 0, 1, 1], [0.5, 0.1, 1.5, 1.1]], [[0, 0, 1.5, 1.1]]),
+            # Overlapping bboxes with too much extra area
+            (
+                [[0, 0, 1, 1], [0.9, 0.9, 1.9, 1.9]],
+                [[0, 0, 1, 1], [0.9, 0.9, 1.9, 1.9]],
+            ),
+            # A merged bbox is merged with a previous one
+            (
+                [[0, 0, 1, 1], [2, 0, 3, 1], [1, 0, 2, 1]],
+                [[0, 0, 3, 1]],
+            ),
+        ]
+        for bboxes, expected in cases:
+            with self.subTest(msg=f"{bboxes}"):
+                self.assertListEqual(expected, merge_bboxes(bboxes))
+
+
+class _OverpassHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _reply(self, code: int, body: bytes, content_type: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if code == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/api/status":
+            status = f"Connected as: 1\nRate limit: {server.slots}\n"
+            self._reply(200, status.encode(), "text/plain")
+            return
+
+        query = urllib.parse.parse_qs(url.query)["data"][0]
+        bboxes = list(dict.fromkeys(server.BBOX_RE.findall(query)))
+        first_coord = bboxes[0][0]
+        remark = None
+        with server.lock:
+            server.requests.append(first_coord)
+            if server.active == server.slots:
+                server.rejected += 1
+                code = 429
+            elif server.remarks.get(first_coord):
+                server.remarks[first_coord] -= 1
+                code = 200
+                remark = "runtime error: Query timed out"
+            elif server.failures.get(first_coord):
+                server.failures[first_coord] -= 1
+                code = server.failure_code
+            else:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+                code = 200
+        if code != 200:
+            self._reply(code, b"", "text/plain")
+            return
+        time.sleep(0.05)
+        with server.lock:
+            server.active -= 1
+        elements = [
+            {"type": "node", "id": int(float(bbox[0])), "lat": 0.0, "lon": 0.0}
+            for bbox in bboxes
+        ]
+        if remark:
+            # Partial response
+            response = {"elements": elements[:1], "remark": remark}
+        else:
+            response = {"elements": elements}
+        body = json.dumps(response).encode()
+        self._reply(200, body, "application/json")
+
+
+class _OverpassStandIn(ThreadingHTTPServer):
+    """Local stand-in for Overpass API. It answers with a node per bbox
+    of the query, with node id equal to the integer part of the first
+    bbox coordinate.
+    Only `slots` requests are processed at once, others get HTTP 429.
+    Requests whose first bbox is in `failures` get `failure_code`
+    the given number of times, and ones whose first bbox is in `remarks`
+    get a partial response with a runtime error remark.
+    """
+
+    BBOX_RE = re.compile(r"\(([-.\d]+),([-.\d]+),([-.\d]+),([-.\d]+)\)")
+
+    def __init__(self, slots: int = 2) -> None:
+        super().__init__(("127.0.0.1", 0), _OverpassHandler)
+        self.slots = slots
+        self.failures: dict[str, int] = {}
+        self.failure_code = 504
+        self.remarks: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.rejected = 0
+        self.requests: list[str] = []  # first coordinates of bboxes
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/interpreter"
+
+
+class TestMultiOverpass(TestCase):
+    def setUp(self) -> None:
+        self.server = _OverpassStandIn()
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.01}
+        ).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        patcher = mock.patch.object(overpass, "BACKOFF_BASE", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bboxes = [[i, 0, i + 0.5, 1] for i in range(25)]
+
+    def _multi_overpass(self, **kwargs) -> list[int]:
+        elements = multi_overpass(
+            False, self.server.api_url, self.bboxes, **kwargs
+        )
+        return [el["id"] for el in elements]
+
+    def test_get_overpass_slots(self) -> None:
+        self.assertEqual(2, get_overpass_slots(self.server.api_url))
+
+    def test_concurrency(self) -> None:
+        self.assertListEqual(
+            list(range(25)), self._multi_overpass(concurrency=4)
+        )
+        self.assertLessEqual(self.server.max_active, self.server.slots)
+        self.assertEqual(3 + self.server.rejected, len(self.server.requests))
+
+    def test_retry(self) -> None:
+        self.server.failures = {"10": 2}
+        self.assertListEqual(
+            list(range(25)), self._multi_overpass(concurrency=1)
+        )
+        self.assertListEqual(
+            ["0", "10", "10", "10", "20"], self.server.requests
+        )
+
+    def test_max_retries(self) -> None:
+        self.server.failures = {"10": 10}
+        with mock.patch.object(overpass, "MAX_RETRIES", 2):
+            with self.assertRaises(urllib.error.HTTPError) as cm:
+                self._multi_overpass(concurrency=1)
+        self.assertEqual(504, cm.exception.code)
+        self.assertEqual(3, self.server.requests.count("10"))
+
+    def test_remark(self) -> None:
+        with TemporaryDirectory() as cache_dir:
+            cache = OverpassCache(cache_dir)
+            self.server.remarks = {"10": 1}
+            self.assertListEqual(
+                list(range(25)),
+                self._multi_overpass(concurrency=1, cache=cache),
+            )
+            self.assertListEqual(["0", "10", "10", "20"], self.server.requests)
+
+            # A response with a remark is not cached
+            self.server.remarks = {"30": 10}
+            self.bboxes = [[30, 0, 30.5, 1], [31, 0, 31.5, 1]]
+            with mock.patch.object(overpass, "MAX_RETRIES", 1):
+                with self.assertRaisesRegex(Exception, "Query timed out"):
+                    self._multi_overpass(concurrency=1, cache=cache)
+            self.assertEqual(2, self.server.requests.count("30"))
+            self.assertEqual(3, len(list(Path(cache_dir).iterdir())))
+
+    def test_resume(self) -> None:
+        self.server.failures = {"10": 1}
+        self.server.failure_code = 400
+        fetched_slices = {}
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self._multi_overpass(fetched_slices=fetched_slices)
+        self.assertEqual(400, cm.exception.code)
+        self.assertSetEqual({0, 2}, set(fetched_slices))
+
+        self.server.requests.clear()
+        self.assertListEqual(
+            list(range(25)),
+            self._multi_overpass(fetched_slices=fetched_slices),
+        )
+        self.assertListEqual(["10"], self.server.requests)
+
+    def test_cache(self) -> None:
+        with TemporaryDirectory() as cache_dir:
+            cache = OverpassCache(cache_dir)
+            self.bboxes = self.bboxes[:15]
+            self.assertListEqual(
+                list(range(15)), self._multi_overpass(cache=cache)
+            )
+            self.assertEqual(0, cache.hits)
+
+            # Responses are replayed without network access
+            with mock.patch.object(
+                overpass.urllib.request,
+                "urlopen",
+                side_effect=AssertionError("Network access"),
+            ):
+                self.assertListEqual(
+                    list(range(15)), self._multi_overpass(cache=cache)
+                )
+            self.assertEqual(2, cache.hits)
+
+            # Only a new slice is fetched
+            self.bboxes.append([15, 0, 15.5, 1])
+            self.server.requests.clear()
+            self.assertListEqual(
+                list(range(16)), self._multi_overpass(cache=cache)
+            )
+            self.assertListEqual(["10"], self.server.requests)
+
+    def test_deduplication(self) -> None:
+        # Elements of the last bbox are also in the first slice
+        self.bboxes = self.bboxes[:12] + [[0.2, 5, 0.7, 6]]
+        logging.disable(logging.NOTSET)
+        with self.assertLogs(level="INFO") as cm:
+            self.assertListEqual(
+                list(range(12)), self._multi_overpass(concurrency=1)
+            )
+        self.assertIn("Skipped 1 duplicate elements", cm.output[-1])
@@ -0,0 +1,97 @@
+import gzip
+import os
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock, TestCase
+
+from subways.overpass_cache import OverpassCache
+
+API = "http://overpass.example/api/interpreter"
+
+
+def make_elements(n: int) -> list[dict]:
+    return [
+        {"type": "node", "id": i, "lat": 0.0, "lon": 0.0, "tags": {"i": i}}
+        for i in range(n)
+    ]
+
+
+class TestOverpassCache(TestCase):
+    def setUp(self) -> None:
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = Path(tmp_dir.name) / "overpass"
+
+    def _set_times(
+        self, cache: OverpassCache, query: str, used: float, fetched: float
+    ) -> None:
+        path = cache.cache_dir / (cache.get_key(API, query) + ".json.gz")
+        os.utime(path, (used, fetched))
+
+    def test_get_and_put(self) -> None:
+        cache = OverpassCache(self.cache_dir)
+        self.assertIsNone(cache.get(API, "query"))
+        cache.put(API, "query", make_elements(3))
+        self.assertListEqual(make_elements(3), cache.get(API, "query"))
+        self.assertEqual(1, cache.hits)
+
+        # The key depends on both the query and the API URL
+        self.assertIsNone(cache.get(API, "another query"))
+        self.assertIsNone(cache.get("http://another.example/", "query"))
+
+        # Responses are compressed and persist between runs
+        (path,) = self.cache_dir.iterdir()
+        with gzip.open(path, "rt") as f:
+            self.assertIn('"elements"', f.read())
+        self.assertListEqual(
+            make_elements(3), OverpassCache(self.cache_dir).get(API, "query")
+        )
+
+    def test_ttl(self) -> None:
+        cache = OverpassCache(self.cache_dir, ttl=3600)
+        cache.put(API, "query", make_elements(1))
+        now = time.time()
+        self._set_times(cache, "query", now, now - 3500)
+        self.assertIsNotNone(cache.get(API, "query"))
+        self._set_times(cache, "query", now, now - 3700)
+        self.assertIsNone(cache.get(API, "query"))
+        self.assertListEqual([], list(self.cache_dir.iterdir()))
+
+    def test_lru_eviction(self) -> None:
+        cache = OverpassCache(self.cache_dir)
+        now = time.time()
+        for i, query in enumerate(("q1", "q2", "q3")):
+            cache.put(API, query, make_elements(100))
+            self._set_times(cache, query, now - 100 + i, now)
+        # q1 is fetched first but used last
+        cache.get(API, "q1")
+        size = sum(p.stat().st_size for p in self.cache_dir.iterdir())
+
+        cache.max_size = size - 1
+        cache.evict()
+        self.assertIsNone(cache.get(API, "q2"))
+        self.assertIsNotNone(cache.get(API, "q3"))
+        self.assertIsNotNone(cache.get(API, "q1"))
+
+        cache.max_size = 0
+        cache.evict()
+        self.assertListEqual([], list(self.cache_dir.iterdir()))
+
+    def test_failed_put(self) -> None:
+        cache = OverpassCache(self.cache_dir)
+        with mock.patch(
+            "subways.overpass_cache.json.dump", side_effect=OSError
+        ):
+            with self.assertRaises(OSError):
+                cache.put(API, "query", make_elements(1))
+        self.assertListEqual([], list(self.cache_dir.iterdir()))
+
+    def test_corrupted_file(self) -> None:
+        cache = OverpassCache(self.cache_dir)
+        cache.put(API, "query", make_elements(1))
+        (path,) = self.cache_dir.iterdir()
+        path.write_bytes(b"not gzip")
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(cache.get(API, "query"))
+        self.assertFalse(path.exists())
@@ -1,8 +1,17 @@
 import collections
 import itertools
+import random
 import unittest
 
-from subways.geom_utils import project_on_segment
+from subways.geom_utils import (
+    distance,
+    LocalProjection,
+    MAX_DISTANCE_TO_PROJECT,
+    planar_distance,
+    project_on_line,
+    project_on_segment,
+)
+from subways.spatial_index import SegmentGrid
 from subways.types import LonLat
 
 
@@ -164,3 +173,105 @@ class TestProjection(unittest.TestCase):
         answers = [None] * len(points)
 
         self._test_projection_in_bulk(points, segments, answers)
+
+
+class TestProjectionOnLine(unittest.TestCase):
+    """project_on_line() with a segment index should return the same
+    as without it.
+    """
+
+    def test_project_on_line_with_index(self) -> None:
+        rnd = random.Random(0)
+        for lon, lat in ((10.75, 59.91), (-58.4, -34.6), (139.7, 35.7)):
+            with self.subTest(msg=f"{lon}, {lat}"):
+                # A random walk with steps from 10 to 1000 meters
+                line = [(lon, lat)]
+                for _ in range(300):
+                    step = 10 ** rnd.uniform(-4, -2)
+                    line.append(
+                        (
+                            line[-1][0] + rnd.uniform(-step, step),
+                            line[-1][1] + rnd.uniform(-step, step),
+                        )
+                    )
+                # The line follows a part of itself again, like Oslo Line 5
+                line += line[100:150]
+                index = SegmentGrid(line, MAX_DISTANCE_TO_PROJECT)
+
+                points = [
+                    (
+                        v[0] + rnd.uniform(-0.005, 0.005),
+                        v[1] + rnd.uniform(-0.005, 0.005),
+                    )
+                    for v in rnd.choices(line, k=300)
+                ]
+                points += rnd.choices(line, k=30)
+                for point in points:
+                    self.assertDictEqual(
+                        project_on_line(point, line),
+                        project_on_line(point, line, index),
+                    )
+
+                projection = LocalProjection.around((lon, lat))
+                planar_line = [projection.to_xy(v) for v in line]
+                planar_index = SegmentGrid(
+                    planar_line, MAX_DISTANCE_TO_PROJECT, planar=True
+                )
+                for point in map(projection.to_xy, points):
+                    self.assertDictEqual(
+                        project_on_line(point, planar_line, planar=True),
+                        project_on_line(
+                            point, planar_line, planar_index, planar=True
+                        ),
+                    )
+
+
+class TestLocalProjection(unittest.TestCase):
+    def test_conversion(self) -> None:
+        rnd = random.Random(0)
+        for center in ((10.75, 59.91), (-58.4, -34.6), (18.95, 69.65)):
+            projection = LocalProjection.around(center)
+            for _ in range(100):
+                p1, p2 = (
+                    (
+                        center[0] + rnd.uniform(-0.1, 0.1),
+                        center[1] + rnd.uniform(-0.05, 0.05),
+                    )
+                    for _ in range(2)
+                )
+                xy1 = projection.to_xy(p1)
+                for a, b in zip(p1, projection.to_lonlat(xy1)):
+                    self.assertAlmostEqual(a, b, places=10)
+                d = distance(p1, p2)
+                self.assertAlmostEqual(
+                    d,
+                    planar_distance(xy1, projection.to_xy(p2)),
+                    delta=d * 0.005,
+                )
+
+    def test_projection_at_high_latitude(self) -> None:
+        """A projected point should be the closest point of a segment,
+        which is not so for projection in degrees far from the equator.
+        """
+        segment = [(18.90, 69.60), (18.95, 69.65)]
+        point = (18.928, 69.6235)
+        projection = LocalProjection.around(point)
+        result = project_on_line(
+            projection.to_xy(point),
+            [projection.to_xy(v) for v in segment],
+            planar=True,
+        )
+        projected_point = projection.to_lonlat(result["projected_point"])
+        d = distance(point, projected_point)
+        (lon1, lat1), (lon2, lat2) = segment
+        for i in range(101):
+            u = i / 100
+            self.assertLessEqual(
+                d,
+                distance(
+                    point, (lon1 + u * (lon2 - lon1), lat1 + u * (lat2 - lat1))
+                )
+                + 0.01,
+            )
+        # The point in degrees is projected too far from the closest one
+        self.assertIsNone(project_on_line(point, segment)["projected_point"])
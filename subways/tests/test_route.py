@@ -5,6 +5,7 @@ from subways.structure.route import (
     osm_interval_to_seconds,
     parse_time_range,
 )
+from subways.structure.route_stop import RouteStop
 
 
 class TestTimeIntervalsParsing(TestCase):
@@ -139,3 +140,33 @@ class TestRouteIntervals(TestCase):
                     case["answer"],
                     get_interval_in_seconds_from_tags(case["tags"], keys),
                 )
+
+
+class TestRouteStopFlags(TestCase):
+    def test_flags(self) -> None:
+        flags = (
+            "is_on_tracks",
+            "can_enter",
+            "can_exit",
+            "seen_stop",
+            "seen_platform_entry",
+            "seen_platform_exit",
+            "seen_station",
+        )
+        route_stop = RouteStop(None)
+        for flag in flags:
+            self.assertIs(False, getattr(route_stop, flag))
+        for i, flag in enumerate(flags):
+            with self.subTest(msg=flag):
+                setattr(route_stop, flag, True)
+                self.assertListEqual(
+                    [j <= i for j in range(len(flags))],
+                    [getattr(route_stop, f) for f in flags],
+                )
+        route_stop.seen_platform_entry = False
+        self.assertTrue(route_stop.seen_platform)
+        route_stop.seen_platform_exit = False
+        self.assertFalse(route_stop.seen_platform)
+        self.assertTrue(route_stop.seen_station)
+        with self.assertRaises(AttributeError):
+            route_stop.unknown_attribute = 1
@@ -0,0 +1,146 @@
+import random
+import unittest
+from unittest import mock
+
+from subways import spatial_index
+from subways.geom_utils import distance
+from subways.spatial_index import (
+    CityIndex,
+    make_city_index,
+    PointGrid,
+    VectorizedCityIndex,
+)
+from subways.structure.city import City
+from subways.tests.util import TestCase
+
+
+class TestCityIndex(TestCase):
+    def _make_cities(self, bboxes: list[str]) -> list[City]:
+        cities = []
+        for i, bbox in enumerate(bboxes, start=1):
+            city_info = self.CITY_TEMPLATE.copy()
+            city_info.update(id=i, name=f"City {i}", bbox=bbox, num_stations=1)
+            cities.append(City(city_info))
+        return cities
+
+    def _make_test_cities(self) -> list[City]:
+        return self._make_cities(
+            [
+                "37.3, 55.5, 37.9, 56.0",  # lon_min, lat_min, lon_max, lat_max
+                "37.0, 55.0, 38.0, 56.0",  # contains the previous one
+                "-0.5, 51.3, 0.3, 51.7",  # crosses the zero meridian
+                "-74.3, 40.5, -73.7, 40.9",
+                "-179, -89, 179, 89",  # too large to be put into the grid
+                "",  # no bbox
+            ]
+        )
+
+    @staticmethod
+    def _make_test_points() -> list[tuple[float, float]]:
+        rnd = random.Random(0)
+        points = [
+            (rnd.uniform(-80, 40), rnd.uniform(35, 60)) for _ in range(2000)
+        ]
+        # Points on bbox boundaries and on grid cell boundaries
+        points += [
+            (37.3, 55.5),
+            (37.9, 56.0),
+            (38.0, 55.0),
+            (0.0, 51.5),
+            (-0.5, 51.7),
+            (-74.0, 40.5),
+            (-73.7, 40.9),
+        ]
+        return points
+
+    def test_find_cities(self) -> None:
+        cities = self._make_test_cities()
+        index = CityIndex(cities, cell_size=0.5)
+        points = self._make_test_points()
+        searchable_cities = [c for c in cities if c.bbox is not None]
+        for lon, lat in points:
+            el = {"type": "node", "id": 1, "lon": lon, "lat": lat}
+            expected = [c for c in searchable_cities if c.contains(el)]
+            self.assertListEqual(expected, index.find_cities(el))
+
+        self.assertListEqual(
+            [], index.find_cities({"type": "relation", "id": 1})
+        )
+        self.assertListEqual(
+            [cities[0], cities[1], cities[4]],
+            index.find_cities(
+                {"type": "way", "id": 1, "center": {"lon": 37.5, "lat": 55.7}}
+            ),
+        )
+
+    @unittest.skipIf(spatial_index.np is None, "NumPy is not installed")
+    def test_vectorized_city_index(self) -> None:
+        cities = self._make_test_cities()
+        elements = [
+            {"type": "node", "id": i, "lon": lon, "lat": lat}
+            for i, (lon, lat) in enumerate(self._make_test_points())
+        ]
+        elements += [
+            {"type": "relation", "id": 1},
+            {"type": "way", "id": 1, "center": {"lon": 37.5, "lat": 55.7}},
+        ]
+        for cell_size in (0.5, 1.0, 100.0):
+            with self.subTest(msg=f"{cell_size=}"):
+                index = VectorizedCityIndex(cities, cell_size)
+                self.assertListEqual(
+                    CityIndex(cities, cell_size).find_cities_many(elements),
+                    index.find_cities_many(elements),
+                )
+                self.assertListEqual([], index.find_cities_many([]))
+
+    def test_make_city_index__no_numpy(self) -> None:
+        cities = self._make_test_cities()
+        with mock.patch.object(spatial_index, "np", None):
+            with self.assertLogs(level="WARNING"):
+                city_index = make_city_index(cities, vectorized=True)
+        self.assertIsInstance(city_index, CityIndex)
+        self.assertIsInstance(make_city_index(cities), CityIndex)
+
+
+class TestPointGrid(TestCase):
+    def test_find_near(self) -> None:
+        rnd = random.Random(0)
+        radius = 300
+        for lon, lat in ((37.6, 55.7), (-43.2, -22.9), (18.1, 69.6)):
+            with self.subTest(msg=f"{lon}, {lat}"):
+                elements = [
+                    {
+                        "type": "node",
+                        "id": i,
+                        "lon": lon + rnd.uniform(-0.05, 0.05),
+                        "lat": lat + rnd.uniform(-0.03, 0.03),
+                    }
+                    for i in range(2000)
+                ]
+                grid = PointGrid(elements, radius)
+                for _ in range(200):
+                    point = (
+                        lon + rnd.uniform(-0.05, 0.05),
+                        lat + rnd.uniform(-0.03, 0.03),
+                    )
+                    candidates = grid.find_near(point)
+                    self.assertLess(len(candidates), len(elements) / 10)
+                    self.assertListEqual(
+                        [
+                            el
+                            for el in elements
+                            if distance(point, (el["lon"], el["lat"]))
+                            <= radius
+                        ],
+                        [
+                            el
+                            for el in candidates
+                            if distance(point, (el["lon"], el["lat"]))
+                            <= radius
+                        ],
+                    )
+
+    def test_find_near__empty(self) -> None:
+        self.assertListEqual(
+            [], PointGrid([{"type": "relation", "id": 1}], 300).find_near(None)
+        )
@@ -0,0 +1,113 @@
+from subways.osm_element import pack_id
+from subways.structure.city import City
+from subways.structure.station_registry import StationRegistry
+from subways.tests.sample_data_for_outputs import metro_samples
+from subways.tests.util import TestCase
+
+
+class TestStationRegistry(TestCase):
+    def _make_city(self, city_id: int, elements: list[dict]) -> City:
+        city = City(
+            self.CITY_TEMPLATE
+            | {"id": city_id, "name": f"City {city_id}", "num_stations": 1}
+        )
+        for el in elements:
+            city.add(el)
+        return city
+
+    def test_get_stoparea(self) -> None:
+        station_el = {
+            "type": "node",
+            "id": 1,
+            "lat": 0.0,
+            "lon": 0.0,
+            "tags": {
+                "railway": "station",
+                "station": "subway",
+                "name": "Station",
+                "colour": "no-colour",
+            },
+        }
+        platform_el = {
+            "type": "node",
+            "id": 2,
+            "lat": 0.0,
+            "lon": 0.001,
+            "tags": {"railway": "platform"},
+        }
+        stop_area_el = {
+            "type": "relation",
+            "id": 3,
+            "tags": {
+                "type": "public_transport",
+                "public_transport": "stop_area",
+            },
+            "members": [
+                {"type": "node", "ref": 1, "role": ""},
+                {"type": "node", "ref": 2, "role": "platform"},
+            ],
+        }
+        city1 = self._make_city(1, [station_el, platform_el, stop_area_el])
+        city2 = self._make_city(2, [station_el, platform_el, stop_area_el])
+        # The platform is outside of the city
+        city3 = self._make_city(3, [station_el, stop_area_el])
+
+        registry = StationRegistry()
+        stations = [
+            registry.get_station(station_el, city)
+            for city in (city1, city2, city3)
+        ]
+        self.assertIs(stations[0], stations[1])
+        self.assertIs(stations[0], stations[2])
+
+        stopareas = [
+            registry.get_stoparea(station, city, stop_area_el)
+            for station, city in zip(stations, (city1, city2, city3))
+        ]
+        self.assertIs(stopareas[0], stopareas[1])
+        self.assertIsNot(stopareas[0], stopareas[2])
+        self.assertTupleEqual((pack_id("node", 2),), stopareas[0].platforms)
+        self.assertTupleEqual((), stopareas[2].platforms)
+
+        # Messages are logged in each city
+        for city in (city1, city2, city3):
+            self.assertEqual(1, len(city.warnings))
+            self.assertIn("no-colour", city.warnings[0])
+
+    def test_validation(self) -> None:
+        """Cities validated together should be the same as validated
+        one by one, though the tiny_world cities share stations.
+        """
+        sample = metro_samples[0]
+        cities, _ = self.prepare_cities(sample)
+        self.assertTrue(
+            set(cities[0].stations).intersection(cities[1].stations)
+        )
+        for city in cities:
+            for other_city in cities:
+                for k in set(city.stations).intersection(other_city.stations):
+                    self.assertIs(
+                        city.stations[k][0], other_city.stations[k][0]
+                    )
+
+        for city in cities:
+            with self.subTest(msg=city.name):
+                city_sample = sample | {
+                    "cities_info": [
+                        info
+                        for info in sample["cities_info"]
+                        if info["name"] == city.name
+                    ]
+                }
+                (single_city,), _ = self.prepare_cities(city_sample)
+                for attr in ("errors", "warnings", "notices"):
+                    self.assertListEqual(
+                        sorted(getattr(single_city, attr)),
+                        sorted(getattr(city, attr)),
+                    )
+                self.assertDictEqual(
+                    single_city.stoparea_transfers, city.stoparea_transfers
+                )
+                self.assertEqual(
+                    single_city.found_interchanges, city.found_interchanges
+                )
@@ -0,0 +1,46 @@
+from subways.structure.city import City
+from subways.tests.sample_data_for_error_messages import (
+    metro_samples as metro_samples_with_errors,
+)
+from subways.tests.sample_data_for_outputs import metro_samples
+from subways.tests.util import TestCase
+
+
+class TestValidateCities(TestCase):
+    """Validation of cities in several processes should give the same
+    result as in the main process.
+    """
+
+    def test_validate_cities__jobs(self) -> None:
+        for sample in metro_samples + metro_samples_with_errors:
+            with self.subTest(msg=sample["name"]):
+                self._test_validate_cities__jobs__for_sample(sample)
+
+    @staticmethod
+    def _get_routes(city: City) -> dict:
+        return {
+            route.id: [(rs.stoparea.id, rs.distance) for rs in route]
+            for route_master in city
+            for route in route_master
+        }
+
+    def _test_validate_cities__jobs__for_sample(
+        self, metro_sample: dict
+    ) -> None:
+        cities, transfers = self.prepare_cities(metro_sample)
+        cities2, transfers2 = self.prepare_cities(
+            metro_sample, validation_jobs=2
+        )
+
+        self.assertListEqual(
+            sorted(map(sorted, transfers)), sorted(map(sorted, transfers2))
+        )
+        for city, city2 in zip(cities, cities2, strict=True):
+            self.assertEqual(city.is_good, city2.is_good)
+            self.assertListEqual(sorted(city.errors), sorted(city2.errors))
+            self.assertListEqual(sorted(city.warnings), sorted(city2.warnings))
+            self.assertListEqual(sorted(city.notices), sorted(city2.notices))
+            self.assertSetEqual(city.used_entrances, city2.used_entrances)
+            self.assertDictEqual(
+                self._get_routes(city), self._get_routes(city2)
+            )
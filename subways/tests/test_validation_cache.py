@@ -0,0 +1,74 @@
+import os
+import tempfile
+from unittest import mock
+
+from subways.osm_element import pack_id
+from subways.structure.city import City
+from subways.tests.sample_data_for_outputs import metro_samples
+from subways.tests.util import TestCase
+from subways.validation_cache import get_city_fingerprint, ValidationCache
+
+
+class TestValidationCache(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "cache.pkl")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_validation_cache(self) -> None:
+        for sample in metro_samples:
+            with self.subTest(msg=sample["name"]):
+                self._test_validation_cache_for_sample(sample)
+
+    def _test_validation_cache_for_sample(self, metro_sample: dict) -> None:
+        cache = ValidationCache(self.cache_path)
+        cities, transfers = self.prepare_cities(
+            metro_sample, validation_cache=cache
+        )
+        self.assertEqual(0, cache.hits)
+        cache.save()
+
+        cache = ValidationCache(self.cache_path)
+        with mock.patch.object(
+            City, "extract_routes", side_effect=AssertionError
+        ):
+            cities2, transfers2 = self.prepare_cities(
+                metro_sample, validation_cache=cache
+            )
+        self.assertEqual(len(cities), cache.hits)
+
+        self.assertListEqual(
+            sorted(map(sorted, transfers)), sorted(map(sorted, transfers2))
+        )
+        for city, city2 in zip(cities, cities2, strict=True):
+            self.assertEqual(city.is_good, city2.is_good)
+            self.assertListEqual(sorted(city.errors), sorted(city2.errors))
+            self.assertListEqual(sorted(city.warnings), sorted(city2.warnings))
+            self.assertListEqual(sorted(city.notices), sorted(city2.notices))
+            self.assertSetEqual(
+                {route.id for route_master in city for route in route_master},
+                {route.id for route_master in city2 for route in route_master},
+            )
+
+    def test_city_fingerprint(self) -> None:
+        city_info = self.CITY_TEMPLATE.copy()
+        city_info.update(id=1, num_stations=1)
+        city = City(city_info)
+        city.add({"type": "node", "id": 1, "lat": 1.0, "lon": 2.0})
+        fingerprint = get_city_fingerprint(city)
+
+        city2 = City(city_info)
+        city2.add({"type": "node", "id": 1, "lat": 1.0, "lon": 2.0})
+        self.assertEqual(fingerprint, get_city_fingerprint(city2))
+        self.assertNotEqual(
+            fingerprint, get_city_fingerprint(city2, batched_geometry=True)
+        )
+
+        city2.elements[pack_id("node", 1)]["lat"] = 1.5
+        self.assertNotEqual(fingerprint, get_city_fingerprint(city2))
+
+        city3 = City(city_info | {"num_lines": 2})
+        city3.add({"type": "node", "id": 1, "lat": 1.0, "lon": 2.0})
+        self.assertNotEqual(fingerprint, get_city_fingerprint(city3))
@@ -11,6 +11,7 @@ from subways.validation import (
     validate_cities,
     calculate_centers,
 )
+from subways.validation_cache import ValidationCache
 
 TestCaseMixin: TypeAlias = Self | unittestTestCase
 
@@ -34,7 +35,13 @@ class TestCase(unittestTestCase):
     def setUpClass(cls) -> None:
         cls.city_class = City
 
-    def prepare_cities(self, metro_sample: dict) -> tuple:
+    def prepare_cities(
+        self,
+        metro_sample: dict,
+        validation_jobs: int = 1,
+        validation_cache: ValidationCache | None = None,
+        batched_geometry: bool = False,
+    ) -> tuple:
         """Load cities from file/string, validate them and return cities
         and transfers.
         """
@@ -71,9 +78,14 @@ class TestCase(unittestTestCase):
             )
         elements = load_xml(xml_file)
         calculate_centers(elements)
-        add_osm_elements_to_cities(elements, cities)
-        validate_cities(cities)
-        transfers = find_transfers(elements, cities)
+        stop_area_groups = []
+        add_osm_elements_to_cities(
+            elements, cities, stop_area_groups=stop_area_groups
+        )
+        validate_cities(
+            cities, validation_jobs, validation_cache, batched_geometry
+        )
+        transfers = find_transfers(stop_area_groups, cities)
         return cities, transfers
 
 
@@ -3,7 +3,9 @@ from typing import TypeAlias
 
 OsmElementT: TypeAlias = dict
 IdT: TypeAlias = str  # Type of feature ids
-TransferT: TypeAlias = set[IdT]  # A transfer is a set of StopArea IDs
+# Feature id with type bits, used internally instead of IdT strings
+PackedIdT: TypeAlias = int
+TransferT: TypeAlias = set[PackedIdT]  # A set of StopArea IDs
 TransfersT: TypeAlias = list[TransferT]
 LonLat: TypeAlias = tuple[float, float]
 RailT: TypeAlias = list[LonLat]
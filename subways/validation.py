@@ -1,10 +1,20 @@
 import csv
 import logging
 import urllib.request
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
-from subways.structure.city import City
+from subways.spatial_index import (
+    CityIndex,
+    make_city_index,
+    VectorizedCityIndex,
+)
+from subways.structure.city import City, is_stop_area_group, used_entrances
+from subways.structure.route import Route
+from subways.structure.station_registry import StationRegistry
 from subways.types import CriticalValidationError, LonLat, OsmElementT
+from subways.validation_cache import get_city_fingerprint, ValidationCache
 
 DEFAULT_SPREADSHEET_ID = "1SEW1-NiNOnA2qDwievcxYV1FOaQl1mb1fdeyqAxHu3k"
 DEFAULT_CITIES_INFO_URL = (
@@ -13,6 +23,9 @@ DEFAULT_CITIES_INFO_URL = (
 )
 BAD_MARK = "[bad]"
 
+# Number of elements that are assigned to cities at once
+ASSIGNMENT_CHUNK_SIZE = 16384
+
 
 def get_way_center(
     element: OsmElementT, node_centers: dict[int, LonLat]
@@ -109,95 +122,325 @@ def get_relation_center(
     return element["center"]["lon"], element["center"]["lat"]
 
 
-def calculate_centers(elements: list[OsmElementT]) -> None:
-    """Adds 'center' key to each way/relation in elements,
-    except for empty ways or relations.
-    Relies on nodes-ways-relations order in the elements list.
+class CenterCalculator:
+    """Incremental calculation of way and relation centers. Elements
+    are expected to come in nodes-ways-relations order.
     """
-    nodes: dict[int, LonLat] = {}  # id => LonLat
-    ways: dict[int, LonLat] = {}  # id => approx center LonLat
-    relations: dict[int, LonLat] = {}  # id => approx center LonLat
 
-    unlocalized_relations: list[OsmElementT] = []  # 'unlocalized' means
-    # the center of the relation has not been calculated yet
+    def __init__(self) -> None:
+        self.nodes: dict[int, LonLat] = {}  # id => LonLat
+        self.ways: dict[int, LonLat] = {}  # id => approx center LonLat
+        self.relations: dict[int, LonLat] = {}  # id => approx center LonLat
 
-    for el in elements:
+        self.unlocalized_relations: list[OsmElementT] = []  # 'unlocalized'
+        # means the center of the relation has not been calculated yet
+
+    def add(self, el: OsmElementT) -> bool:
+        """Calculate the center of the element if possible and
+        return if the element has obtained a center.
+        """
         if el["type"] == "node":
-            nodes[el["id"]] = (el["lon"], el["lat"])
+            self.nodes[el["id"]] = (el["lon"], el["lat"])
+            return True
         elif el["type"] == "way":
-            if center := get_way_center(el, nodes):
-                ways[el["id"]] = center
+            if center := get_way_center(el, self.nodes):
+                self.ways[el["id"]] = center
+                return True
         elif el["type"] == "relation":
-            if center := get_relation_center(el, nodes, ways, relations):
-                relations[el["id"]] = center
-            else:
-                unlocalized_relations.append(el)
-
-    def iterate_relation_centers_calculation(
-        ignore_unlocalized_child_relations: bool,
-    ) -> list[OsmElementT]:
-        unlocalized_relations_upd = []
-        for rel in unlocalized_relations:
             if center := get_relation_center(
-                rel, nodes, ways, relations, ignore_unlocalized_child_relations
+                el, self.nodes, self.ways, self.relations
             ):
-                relations[rel["id"]] = center
-            else:
-                unlocalized_relations_upd.append(rel)
-        return unlocalized_relations_upd
-
-    # Calculate centers for relations that have no one yet
-    while unlocalized_relations:
-        unlocalized_relations_upd = iterate_relation_centers_calculation(False)
-        progress = len(unlocalized_relations_upd) < len(unlocalized_relations)
-        if not progress:
-            unlocalized_relations_upd = iterate_relation_centers_calculation(
-                True
-            )
-            progress = len(unlocalized_relations_upd) < len(
-                unlocalized_relations
-            )
-            if not progress:
-                break
-        unlocalized_relations = unlocalized_relations_upd
+                self.relations[el["id"]] = center
+                return True
+            self.unlocalized_relations.append(el)
+        return False
+
+    def _iter_unlocalized_relation_components(
+        self,
+    ) -> Iterator[list[OsmElementT]]:
+        """Yield strongly connected components of the graph whose vertices
+        are unlocalized relations and edges lead from a relation to its
+        unlocalized child relations. Components come in topological order,
+        children first (Tarjan's algorithm, non-recursive). Relations
+        in each component retain their original order.
+        """
+        relations = {rel["id"]: rel for rel in self.unlocalized_relations}
+        order = {rel_id: i for i, rel_id in enumerate(relations)}
+
+        def children(rel_id: int) -> Iterator[int]:
+            for m in relations[rel_id].get("members", []):
+                if m["type"] == "relation" and m["ref"] in relations:
+                    yield m["ref"]
+
+        index: dict[int, int] = {}
+        lowlink: dict[int, int] = {}
+        stack: list[int] = []
+        on_stack: set[int] = set()
+
+        def visit(rel_id: int) -> None:
+            index[rel_id] = lowlink[rel_id] = len(index)
+            stack.append(rel_id)
+            on_stack.add(rel_id)
+
+        for root_id in relations:
+            if root_id in index:
+                continue
+            visit(root_id)
+            path = [(root_id, children(root_id))]
+            while path:
+                rel_id, child_ids = path[-1]
+                for child_id in child_ids:
+                    if child_id not in index:
+                        visit(child_id)
+                        path.append((child_id, children(child_id)))
+                        break
+                    elif child_id in on_stack:
+                        lowlink[rel_id] = min(lowlink[rel_id], index[child_id])
+                else:
+                    path.pop()
+                    if path:
+                        parent_id = path[-1][0]
+                        lowlink[parent_id] = min(
+                            lowlink[parent_id], lowlink[rel_id]
+                        )
+                    if lowlink[rel_id] == index[rel_id]:
+                        component = []
+                        while True:
+                            member_id = stack.pop()
+                            on_stack.remove(member_id)
+                            component.append(member_id)
+                            if member_id == rel_id:
+                                break
+                        component.sort(key=order.__getitem__)
+                        yield [relations[i] for i in component]
+
+    def finish(self) -> None:
+        """Calculate centers for relations that have no one yet.
+        Relations are processed in topological order of relation
+        membership, so that the center of each relation is calculated
+        once, after centers of all its child relations. Relations that
+        form a membership cycle, or have children which cannot be
+        localized (empty or absent in the data), obtain centers of their
+        localized members only.
+        """
+        for component in self._iter_unlocalized_relation_components():
+            for rel in component:
+                if center := get_relation_center(
+                    rel,
+                    self.nodes,
+                    self.ways,
+                    self.relations,
+                    ignore_unlocalized_child_relations=True,
+                ):
+                    self.relations[rel["id"]] = center
+        self.unlocalized_relations = [
+            rel
+            for rel in self.unlocalized_relations
+            if rel["id"] not in self.relations
+        ]
+
+
+def calculate_centers(elements: Iterable[OsmElementT]) -> None:
+    """Adds 'center' key to each way/relation in elements,
+    except for empty ways or relations.
+    Relies on nodes-ways-relations order in the elements list.
+    """
+    calculator = CenterCalculator()
+    for el in elements:
+        calculator.add(el)
+    calculator.finish()
+
+
+def _add_chunk_to_cities(
+    chunk: list[OsmElementT],
+    city_index: CityIndex | VectorizedCityIndex,
+    stop_area_groups: list[OsmElementT] | None = None,
+) -> None:
+    for el, el_cities in zip(chunk, city_index.find_cities_many(chunk)):
+        for c in el_cities:
+            c.add(el)
+    if stop_area_groups is not None:
+        stop_area_groups.extend(filter(is_stop_area_group, chunk))
+
+
+def _add_osm_elements_to_indexed_cities(
+    osm_elements: Iterable[OsmElementT],
+    city_index: CityIndex | VectorizedCityIndex,
+    stop_area_groups: list[OsmElementT] | None = None,
+) -> None:
+    chunk = []
+    for el in osm_elements:
+        chunk.append(el)
+        if len(chunk) == ASSIGNMENT_CHUNK_SIZE:
+            _add_chunk_to_cities(chunk, city_index, stop_area_groups)
+            chunk = []
+    _add_chunk_to_cities(chunk, city_index, stop_area_groups)
 
 
 def add_osm_elements_to_cities(
-    osm_elements: list[OsmElementT], cities: list[City]
+    osm_elements: Iterable[OsmElementT],
+    cities: list[City],
+    vectorized: bool = False,
+    stop_area_groups: list[OsmElementT] | None = None,
 ) -> None:
+    """Add elements to cities whose bbox contain them.
+    :param vectorized: use NumPy if it is installed
+    :param stop_area_groups: list to collect all stop_area_group
+        relations into, including ones outside the cities, for
+        find_transfers()
+    """
+    _add_osm_elements_to_indexed_cities(
+        osm_elements, make_city_index(cities, vectorized), stop_area_groups
+    )
+
+
+def localize_and_add_to_cities(
+    osm_elements: Iterable[OsmElementT],
+    cities: list[City],
+    vectorized: bool = False,
+    stop_area_groups: list[OsmElementT] | None = None,
+    elements: list[OsmElementT] | None = None,
+) -> int:
+    """Single-pass equivalent of calculate_centers() followed by
+    add_osm_elements_to_cities(). Elements may come from a stream,
+    e.g. from an XML parser; every element is added to cities as soon
+    as its center is known (in chunks, if vectorized). Relations
+    starting from the first one whose center depends on relations that
+    come later are postponed till the end of the stream, so that
+    elements are added to cities in the original order.
+    :param stop_area_groups: list to collect all stop_area_group
+        relations into, as in add_osm_elements_to_cities()
+    :param elements: list to collect all elements into. Elements are
+        not kept otherwise, so that ones outside the cities are freed
+        as the stream goes.
+    :return: number of elements
+    """
+    calculator = CenterCalculator()
+    city_index = make_city_index(cities, vectorized)
+    chunk_size = ASSIGNMENT_CHUNK_SIZE if vectorized else 1
+    element_count = 0
+    chunk = []
+    postponed_elements = []
     for el in osm_elements:
-        for c in cities:
-            if c.contains(el):
-                c.add(el)
-
-
-def validate_cities(cities: list[City]) -> list[City]:
-    """Validate cities. Return list of good cities."""
-    good_cities = []
-    for c in cities:
-        try:
-            c.extract_routes()
-        except CriticalValidationError as e:
-            logging.error(
-                "Critical validation error while processing %s: %s",
-                c.name,
-                e,
+        element_count += 1
+        if elements is not None:
+            elements.append(el)
+        is_localized = calculator.add(el)
+        if postponed_elements or (
+            el["type"] == "relation" and not is_localized
+        ):
+            postponed_elements.append(el)
+        else:
+            chunk.append(el)
+            if len(chunk) == chunk_size:
+                _add_chunk_to_cities(chunk, city_index, stop_area_groups)
+                chunk = []
+    _add_chunk_to_cities(chunk, city_index, stop_area_groups)
+    calculator.finish()
+    _add_osm_elements_to_indexed_cities(
+        postponed_elements, city_index, stop_area_groups
+    )
+    return element_count
+
+
+def _validate_city(
+    city: City, registry: StationRegistry | None = None
+) -> bool:
+    """Validate the city. Return if the city is good.
+    :param registry: stations and stop areas shared between cities.
+    """
+    try:
+        city.extract_routes(registry)
+    except CriticalValidationError as e:
+        logging.error(
+            "Critical validation error while processing %s: %s",
+            city.name,
+            e,
+        )
+        city.error(str(e))
+    except AssertionError as e:
+        logging.error(
+            "Validation logic error while processing %s: %s",
+            city.name,
+            e,
+        )
+        city.error(f"Validation logic error: {e}")
+    else:
+        city.validate()
+        if city.is_good:
+            city.calculate_distances()
+            return True
+    return False
+
+
+def _init_worker(batched_geometry: bool) -> None:
+    Route.batched_geometry = batched_geometry
+
+
+def _validate_city_in_worker(city: City) -> tuple[City, bool]:
+    is_good = _validate_city(city)
+    return city, is_good
+
+
+def validate_cities(
+    cities: list[City],
+    jobs: int = 1,
+    cache: ValidationCache | None = None,
+    batched_geometry: bool = False,
+) -> list[City]:
+    """Validate cities. Return list of good cities.
+    :param jobs: number of processes to validate cities in. If greater
+        than 1, cities are validated in copies, which replace the original
+        City objects in the cities list.
+    :param cache: store of validated cities from previous runs. Cities
+        whose fingerprint has not changed are replaced in the cities list
+        with the stored ones instead of validation; other cities are put
+        into the store after validation.
+    :param batched_geometry: calculate projections, angles and distances
+        of all stops of a route at once, see Route.batched_geometry.
+        The setting is applied in worker processes as well.
+    """
+    _init_worker(batched_geometry)
+    is_good_flags: list[bool] = [False] * len(cities)
+    fingerprints: dict[int, str] = {}
+    indices_to_validate = []
+    for i, city in enumerate(cities):
+        if cache is not None:
+            fingerprint = fingerprints[i] = get_city_fingerprint(
+                city, batched_geometry
             )
-            c.error(str(e))
-        except AssertionError as e:
-            logging.error(
-                "Validation logic error while processing %s: %s",
-                c.name,
-                e,
+            if cached_result := cache.get(city, fingerprint):
+                cities[i], is_good_flags[i] = cached_result
+                used_entrances.update(cities[i].used_entrances)
+                continue
+        indices_to_validate.append(i)
+
+    if jobs > 1 and len(indices_to_validate) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(batched_geometry,),
+        ) as executor:
+            results = executor.map(
+                _validate_city_in_worker,
+                [cities[i] for i in indices_to_validate],
             )
-            c.error(f"Validation logic error: {e}")
-        else:
-            c.validate()
-            if c.is_good:
-                c.calculate_distances()
-                good_cities.append(c)
+            for i, (city, is_good) in zip(indices_to_validate, results):
+                cities[i] = city
+                is_good_flags[i] = is_good
+                used_entrances.update(city.used_entrances)
+    else:
+        # Cities with overlapping bboxes share stations and stop areas.
+        # Copies of cities in worker processes have no elements in common.
+        registry = StationRegistry()
+        for i in indices_to_validate:
+            is_good_flags[i] = _validate_city(cities[i], registry)
+
+    if cache is not None:
+        for i in indices_to_validate:
+            cache.put(cities[i], fingerprints[i], is_good_flags[i])
 
-    return good_cities
+    return [c for c, is_good in zip(cities, is_good_flags) if is_good]
 
 
 def get_cities_info(
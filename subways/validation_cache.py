@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import typing
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+if typing.TYPE_CHECKING:
+    from subways.structure.city import City
+
+# Fingerprints depend on the code that builds and validates cities,
+# so that any change of it invalidates all cached results
+_VALIDATOR_SOURCE_DIRS = ("", "structure")
+
+_validator_version: str | None = None
+
+
+def get_validator_version() -> str:
+    """Hash of source files of the validator."""
+    global _validator_version
+    if _validator_version is None:
+        package_dir = Path(__file__).resolve().parent
+        sha = hashlib.sha256()
+        for sub_dir in _VALIDATOR_SOURCE_DIRS:
+            for path in sorted((package_dir / sub_dir).glob("*.py")):
+                sha.update(path.name.encode())
+                sha.update(path.read_bytes())
+        _validator_version = sha.hexdigest()
+    return _validator_version
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Mapping):  # e.g. an element from ElementCache
+        return dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if isinstance(obj, array):  # e.g. nodes of an OsmElement way
+        return obj.tolist()
+    raise TypeError(f"Cannot make fingerprint of {type(obj)}")
+
+
+def get_city_fingerprint(city: City, batched_geometry: bool = False) -> str:
+    """Hash of everything that determines the result of validation
+    of a not yet validated city: its settings from the cities list,
+    recovery data, OSM elements in the order they were added, and
+    the validator version and options.
+    :param batched_geometry: whether the city is validated with
+        Route.batched_geometry, which may change distances in the last bits
+    """
+    sha = hashlib.sha256(get_validator_version().encode())
+    if batched_geometry:
+        sha.update(b"batched_geometry")
+    sha.update(json.dumps(vars(city), default=_json_default).encode("utf-8"))
+    return sha.hexdigest()
+
+
+class ValidationCache:
+    """Persistent store of validated cities. A city is reused from
+    the store in the next run if its fingerprint has not changed.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self.cache_path = cache_path
+        # city name => (fingerprint, is_good, pickled City)
+        self.cache: dict[str, tuple[str, bool, bytes]] = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    self.cache = pickle.load(f)
+            except (pickle.UnpicklingError, EOFError):
+                logging.warning(
+                    "Validation cache '%s' is corrupted. "
+                    "Building cache from scratch.",
+                    cache_path,
+                )
+        self.hits = 0
+
+    def get(self, city: City, fingerprint: str) -> tuple[City, bool] | None:
+        """Return validated city and its is_good flag, or None if
+        the city with such fingerprint is not in the cache.
+        """
+        cached = self.cache.get(city.name)
+        if cached is None or cached[0] != fingerprint:
+            return None
+        self.hits += 1
+        return pickle.loads(cached[2]), cached[1]
+
+    def put(self, city: City, fingerprint: str, is_good: bool) -> None:
+        self.cache[city.name] = (
+            fingerprint,
+            is_good,
+            pickle.dumps(city, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+
+    def save(self) -> None:
+        with open(self.cache_path, "wb") as f:
+            pickle.dump(self.cache, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,174 @@
+"""Benchmark of assigning OSM elements to cities: checking every element
+against every city vs. the grid index over city bboxes vs. vectorized
+NumPy assignment (if NumPy is installed). Elements are given as a list
+of dicts and as a binary element cache, for which vectorized assignment
+takes centers straight from the cache arrays.
+
+Synthetic nodes are generated, half of them inside bboxes of random
+cities and half uniformly over the populated latitudes, so that
+the benchmark does not depend on a planet extract.
+
+    PYTHONPATH=. python3 tools/benchmarks/assign_elements_to_cities.py
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections.abc import Callable, Sequence
+
+from subways import spatial_index
+from subways.element_cache import ElementCache, write_element_cache
+from subways.spatial_index import CityIndex, VectorizedCityIndex
+from subways.structure.city import City
+from subways.types import OsmElementT
+from subways.validation import (
+    ASSIGNMENT_CHUNK_SIZE,
+    DEFAULT_CITIES_INFO_URL,
+    prepare_cities,
+)
+
+
+def make_elements(cities: list[City], count: int) -> list[OsmElementT]:
+    rnd = random.Random(0)
+    bboxes = [c.bbox for c in cities if c.bbox is not None]
+    elements = []
+    for i in range(count):
+        if i % 2 == 0:
+            lat_min, lon_min, lat_max, lon_max = rnd.choice(bboxes)
+            lat = rnd.uniform(lat_min, lat_max)
+            lon = rnd.uniform(lon_min, lon_max)
+        else:
+            lat = rnd.uniform(-60.0, 70.0)
+            lon = rnd.uniform(-180.0, 180.0)
+        elements.append({"type": "node", "id": i, "lat": lat, "lon": lon})
+    return elements
+
+
+def assign_brute_force(
+    elements: list[OsmElementT], cities: list[City]
+) -> list[list[int]]:
+    return [
+        [i for i, c in enumerate(cities) if c.contains(el)] for el in elements
+    ]
+
+
+def assign_with_index(
+    elements: Sequence[OsmElementT], cities: list[City]
+) -> list[list[int]]:
+    city_index = CityIndex(cities)
+    position = {id(c): i for i, c in enumerate(cities)}
+    return [
+        [position[id(c)] for c in city_index.find_cities(el)]
+        for el in elements
+    ]
+
+
+def assign_vectorized(
+    elements: list[OsmElementT], cities: list[City]
+) -> list[list[int]]:
+    city_index = VectorizedCityIndex(cities)
+    position = {id(c): i for i, c in enumerate(cities)}
+    chunk_size = ASSIGNMENT_CHUNK_SIZE
+    result = []
+    for start in range(0, len(elements), chunk_size):
+        chunk = elements[start : start + chunk_size]  # noqa E203
+        result.extend(
+            [position[id(c)] for c in el_cities]
+            for el_cities in city_index.find_cities_many(chunk)
+        )
+    return result
+
+
+def assign_vectorized_cache(
+    cache: ElementCache, cities: list[City]
+) -> list[list[int]]:
+    city_index = VectorizedCityIndex(cities)
+    result = [[] for _ in range(len(cache))]
+    el_indices, city_indices = city_index.find_city_indices(
+        cache.get_centers()
+    )
+    for el_i, city_i in zip(el_indices.tolist(), city_indices.tolist()):
+        result[el_i].append(city_i)
+    return result
+
+
+def measure(
+    name: str,
+    func: Callable[[Sequence[OsmElementT], list[City]], list[list[int]]],
+    elements: Sequence[OsmElementT],
+    cities: list[City],
+) -> tuple[float, list[list[int]]]:
+    start = time.perf_counter()
+    result = func(elements, cities)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {elapsed:8.3f} s")
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cities-info-url",
+        default=DEFAULT_CITIES_INFO_URL,
+        help=(
+            "URL of CSV file with reference information about rapid transit "
+            "networks. file:// protocol is also supported."
+        ),
+    )
+    parser.add_argument(
+        "-n",
+        "--elements",
+        type=int,
+        default=200_000,
+        help="Number of synthetic elements",
+    )
+    options = parser.parse_args()
+
+    cities = [c for c in prepare_cities(options.cities_info_url) if c.bbox]
+    elements = make_elements(cities, options.elements)
+    print(f"{len(elements)} elements, {len(cities)} cities")
+
+    base_time, expected = measure(
+        "brute force", assign_brute_force, elements, cities
+    )
+    index_time, result = measure(
+        "grid index", assign_with_index, elements, cities
+    )
+    if result != expected:
+        raise RuntimeError("Results of the assignment methods differ")
+    print(f"Speedup: {base_time / index_time:.1f}x")
+
+    if spatial_index.np is None:
+        print("NumPy is not installed, skipping vectorized assignment")
+        return
+    vectorized_time, result = measure(
+        "vectorized", assign_vectorized, elements, cities
+    )
+    if result != expected:
+        raise RuntimeError("Results of the assignment methods differ")
+    print(f"Speedup: {base_time / vectorized_time:.1f}x")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "elements.bin")
+        write_element_cache(cache_path, elements)
+        cache = ElementCache(cache_path)
+        cache_index_time, result = measure(
+            "grid index, cache", assign_with_index, cache, cities
+        )
+        if result != expected:
+            raise RuntimeError("Results of the assignment methods differ")
+        cache_vectorized_time, result = measure(
+            "vectorized, cache", assign_vectorized_cache, cache, cities
+        )
+        if result != expected:
+            raise RuntimeError("Results of the assignment methods differ")
+        print(
+            "Speedup over the grid index: "
+            f"{cache_index_time / cache_vectorized_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark of memory taken by validated cities: routes, route stops,
+stop areas and stations with __slots__, bit flags and id tuples vs.
+the same attributes in instance dicts and id sets.
+
+Memory of attribute values shared with OSM elements (names, ids,
+coordinates) is not counted, only the storage of the objects themselves.
+
+    PYTHONPATH=. python3 tools/benchmarks/structure_memory.py \\
+        --cities-info-url file:///path/to/cities.csv -x planet-metro.osm
+"""
+
+import argparse
+import sys
+from collections.abc import Iterator
+
+from subways.osm_pbf import load_pbf
+from subways.structure.city import City
+from subways.subway_io import load_xml
+from subways.validation import (
+    DEFAULT_CITIES_INFO_URL,
+    localize_and_add_to_cities,
+    prepare_cities,
+    validate_cities,
+)
+
+# Tuples of ids which were sets before
+ID_TUPLES = ("stops", "platforms", "exits", "entrances")
+
+
+class _Plain:
+    """An object keeping attributes in an instance dict."""
+
+
+def iter_objects(city: City) -> Iterator[object]:
+    stopareas = set()
+    stations = set()
+    for route_master in city:
+        for route in route_master:
+            yield route
+            for route_stop in route:
+                yield route_stop
+                stopareas.add(route_stop.stoparea)
+    for stoparea in stopareas:
+        yield stoparea
+        stations.add(stoparea.station)
+    yield from stations
+
+
+def slotted_size(obj: object) -> int:
+    size = sys.getsizeof(obj)
+    for attr in ID_TUPLES:
+        if isinstance(value := getattr(obj, attr, None), tuple):
+            size += sys.getsizeof(value)
+    return size
+
+
+def dict_based_size(obj: object) -> int:
+    plain = _Plain()
+    for cls in type(obj).__mro__:
+        for attr in getattr(cls, "__slots__", ()):
+            if attr == "_flags":
+                continue
+            plain.__dict__[attr] = getattr(obj, attr)
+        for attr, value in vars(cls).items():
+            # Bit flags were separate bool attributes
+            if hasattr(value, "mask"):
+                plain.__dict__[attr] = getattr(obj, attr)
+    size = sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+    for attr in ID_TUPLES:
+        if isinstance(value := getattr(obj, attr, None), tuple):
+            size += sys.getsizeof(set(value))
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cities-info-url",
+        default=DEFAULT_CITIES_INFO_URL,
+        help=(
+            "URL of CSV file with reference information about rapid transit "
+            "networks. file:// protocol is also supported."
+        ),
+    )
+    parser.add_argument(
+        "-x", "--xml", required=True, help="OSM extract with routes"
+    )
+    options = parser.parse_args()
+
+    cities = prepare_cities(options.cities_info_url)
+    if options.xml.endswith(".pbf"):
+        osm = load_pbf(options.xml)
+    else:
+        osm = load_xml(options.xml)
+    localize_and_add_to_cities(osm, cities)
+    validate_cities(cities)
+
+    total_saved = 0
+    print(
+        f"{'City':<30} {'objects':>8} {'slotted':>10} {'dicts':>10} "
+        f"{'saved':>10}"
+    )
+    for city in cities:
+        objects = list(iter_objects(city))
+        if not objects:
+            continue
+        slotted = sum(map(slotted_size, objects))
+        dict_based = sum(map(dict_based_size, objects))
+        total_saved += dict_based - slotted
+        print(
+            f"{city.name[:30]:<30} {len(objects):>8} "
+            f"{slotted:>10} {dict_based:>10} {dict_based - slotted:>10}"
+        )
+    print(f"Saved {total_saved} bytes in total")
+
+
+if __name__ == "__main__":
+    main()